@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from utils.file_management import export_excel
+
+
+def build_dataframe(row_count):
+    """
+    Builds a DataFrame with the usual column types of an ETL output.
+    """
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "ID": np.arange(row_count),
+            "ACCOUNT": rng.choice(["401000", "411000", "512000"], row_count),
+            "LABEL": rng.choice(["Invoice", "Credit note", "Payment"], row_count),
+            "AMOUNT": rng.random(row_count) * 10000,
+            "DATE": pd.Timestamp("2024-01-01")
+            + pd.to_timedelta(rng.integers(0, 365, row_count), unit="D"),
+        }
+    )
+
+
+def measure(label, write, trace_memory):
+    """
+    Runs a write function and prints its wall time, or its peak Python memory when trace_memory is set
+    (tracemalloc slows the write down too much to measure both at once).
+    """
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    write()
+    elapsed = time.perf_counter() - start
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label:<14} {peak / 1024**2:10.1f} MB peak")
+    else:
+        print(f"{label:<14} {elapsed:8.2f} s")
+
+
+def main():
+    """
+    Compares df.to_excel with export_excel.
+    Usage: poetry run python benchmarks/export_excel.py [row_count] [--memory]
+    """
+    arguments = [argument for argument in sys.argv[1:] if argument != "--memory"]
+    trace_memory = "--memory" in sys.argv
+    row_count = int(arguments[0]) if arguments else 200000
+    df = build_dataframe(row_count)
+    print(f"Writing {row_count} rows")
+    with tempfile.TemporaryDirectory() as folder:
+        measure(
+            "df.to_excel",
+            lambda: df.to_excel(os.path.join(folder, "to_excel.xlsx"), index=False),
+            trace_memory,
+        )
+        measure(
+            "export_excel",
+            lambda: export_excel(df, os.path.join(folder, "export_excel.xlsx")),
+            trace_memory,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -25,15 +25,22 @@ def main():
     df = pd.read_excel(get_excel_file(IN), header=0).fillna()
 
     # FILTER_ROWS
-    # Need to define the filter columns and the function to apply. Here, the row will filter the column 'COLUMN_NAME' where the value is different from empty string
-    # To filter on an empty date, you can use {"DATE_COLOMN": lambda value: pd.notna(value)}
-    FILTERS = {"COLUMN_NAME": lambda value: value != ""}
+    # Need to define the filter columns and the condition to apply. Here, the row will filter the column 'COLUMN_NAME' where the value is different from empty string
+    # Conditions are (operator, value) tuples: '==', '!=', '>', '>=', '<', '<=', 'in', 'not in', 'between', 'contains'
+    # or predicates: "notna", "isna", "empty", "not_empty". A list of conditions can be given for a single column.
+    # Example: {"AMOUNT": (">", 500000), "STATUS": ("in", ["OPEN", "PAID"]), "DATE_COLUMN": "notna"}
+    # A function can still be used for custom conditions (slower): {"COLUMN_NAME": lambda value: value.startswith("A")}
+    FILTERS = {"COLUMN_NAME": ("!=", "")}
     df = filter_rows(df, FILTERS)
 
     # AGGREGATE_INPUT
     # Need to define the group columns and the column to apply the sum. Here, the row will group by the columns 'COLUMN_1' and 'COLUMN_2' and apply the sum on 'COLUMN_3'
     GROUP_COLUMNS = ["COLUMN_1", "COLUMN_2"]
     AMOUNT_COLUMN = "COLUMN_3"
+    # Several columns can be summed with a list: AMOUNT_COLUMN = ["COLUMN_3", "COLUMN_4"]
+    # Other aggregations (sum, count, min, max, mean) can be added in the same pass. Example:
+    # AGGREGATIONS = {"NB_LINES": ("COLUMN_3", "count"), "MAX_AMOUNT": ("COLUMN_3", "max")}
+    # df = aggregate_input(df, GROUP_COLUMNS, AMOUNT_COLUMN, AGGREGATIONS)
     df = aggregate_input(df, GROUP_COLUMNS, AMOUNT_COLUMN)
 
     # MAP_ROWS
@@ -43,6 +50,9 @@ def main():
     #     "Total_Amount": lambda row, row_index: row["PRICE"] * row["QUANTITY"],
     #     "Trans_Date": lambda row, row_index: pd.to_datetime(row["DATE"]).strftime("%Y-%m-%d"),
     # }
+    # For large files, a field can be computed for the whole column at once (much faster):
+    #     "Total_Amount": "PRICE * QUANTITY",
+    #     "Total_Amount": column_expression(lambda cols, idx: cols["PRICE"] * cols["QUANTITY"]),
 
     # --- Define your field mapping here ---
     FIELD_MAPPING = {
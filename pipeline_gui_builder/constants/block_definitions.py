@@ -1,27 +1,61 @@
+# "resources": folders (IN, OUT) and remote services used by the block, with their access mode:
+# "read", "add" (new files only, blocks adding files to the same folder can run at the same time) or "write".
+# "kind": "cpu" for blocks computing on the DataFrame, which can run in worker processes.
 BLOCK_CATEGORIES = {
     "IN / OUT": [
         {
             "label": "Read Excel",
             "id": "read_excel",
             "description": "Search and read the Excel file in the IN folder. The folder will be editable.",
+            "resources": {"IN": "read"},
             "code": [
                 "    # The parameter IN can be modified if the excel file is elsewhere",
                 "    # The parameter header can also be changed to fit the excel file (0 is the first row, 1 is the second row, etc.)",
                 "    # The parameter dtype can be added to adapt the column type. To force a column to be a string use the following line:",
-                '    # df = pd.read_excel(get_excel_file(IN),header=0, dtype={"COLUMN_NAME": str}).fillna("")',
-                "    df = pd.read_excel(get_excel_file(IN),header=0).fillna(" ")",
+                '    # df = read_excel_file(get_excel_file(IN), header=0, dtype={"COLUMN_NAME": str}).fillna(" ")',
+                "    # The parsed file is cached in cache/excel, so a second run on the same file skips the parsing. Use use_cache=False to bypass it",
+                '    # Empty cells are read as " ", as in the streaming mode, the next blocks and FIELD_MAPPING receive " " for them',
+                '    df = read_excel_file(get_excel_file(IN), header=0).fillna(" ")',
+            ],
+            "streaming_code": [
+                "    # The parameter IN can be modified if the excel file is elsewhere",
+                "    # The file is read by chunks of CHUNK_SIZE rows, each block below processes one chunk at a time",
+                '    df = (chunk.fillna(" ") for chunk in read_excel_chunks(get_excel_file(IN), chunk_size=CHUNK_SIZE, header=0))',
+            ],
+        },
+        {
+            "label": "Read Excel (folder)",
+            "id": "read_excel_folder",
+            "description": "Read all the Excel files of the IN folder in parallel and concatenate them. A SOURCE_FILE column gives the file of each row.",
+            "resources": {"IN": "read"},
+            "code": [
+                "    # The parameter IN can be modified if the excel files are elsewhere",
+                "    # The parameter patterns selects the files to read with regex patterns (one or a list), all .xlsx files by default",
+                '    # Example: patterns=[r"^sales_.*\\.xlsx$", r"^returns_.*\\.xlsx$"]',
+                "    # Files are read in parallel, a file that cannot be read is reported in the logs and skipped",
+                '    # Empty cells are read as " ", as with Read Excel',
+                '    df = read_excel_folder(IN, patterns=r".*\\.xlsx$", header=0).fillna(" ")',
             ],
         },
         {
             "label": "Export Excel",
             "id": "write_excel",
             "description": "Write the Excel file in the OUT folder. The folder and file name will be editable.",
+            "resources": {"OUT": "add"},
             "code": [
                 "    # The parameter OUT can be modified if the excel file is elsewhere",
                 "    # The parameter file_name can be modified to change the name of the file",
                 "    file_name = 'file.xlsx'",
-                '    outputFile = os.path.join(OUT, "file_name")',
-                "    df.to_excel(outputFile, index=False)",
+                "    outputFile = os.path.join(OUT, file_name)",
+                "    # The file is written row by row in constant memory, rows beyond the Excel limit go to additional sheets",
+                "    export_excel(df, outputFile)",
+            ],
+            "streaming_code": [
+                "    # The parameter OUT can be modified if the excel file is elsewhere",
+                "    # The parameter file_name can be modified to change the name of the file",
+                "    file_name = 'file.xlsx'",
+                "    outputFile = os.path.join(OUT, file_name)",
+                "    export_excel(df, outputFile)",
             ],
         },
     ],
@@ -29,29 +63,50 @@ BLOCK_CATEGORIES = {
         {
             "label": "Filter",
             "id": "filter_rows",
-            "description": "Apply filter to the rows. A filter column will be needed and a function to apply will also have to be set. <br>Example:<br> FILTERS = {'COLUMN_NAME': lambda value: value > 500000}",
+            "description": "Apply filter to the rows. A filter column will be needed and a condition to apply will also have to be set. <br>Example:<br> FILTERS = {'COLUMN_NAME': ('>', 500000)}",
+            "kind": "cpu",
             "code": [
-                "    # Need to define the filter columns and the function to apply. Here, the row will filter the column 'COLUMN_NAME' where the value is different from empty string",
-                '    # To filter on an empty date, you can use {"DATE_COLOMN": lambda value: pd.notna(value)}',
-                '    FILTERS = {"COLUMN_NAME": lambda value: value != ""}',
+                "    # Need to define the filter columns and the condition to apply. Here, the row will filter the column 'COLUMN_NAME' where the value is different from empty string",
+                "    # Conditions are (operator, value) tuples: '==', '!=', '>', '>=', '<', '<=', 'in', 'not in', 'between', 'contains'",
+                '    # or predicates: "notna", "isna", "empty", "not_empty". A list of conditions can be given for a single column.',
+                '    # Example: {"AMOUNT": (">", 500000), "STATUS": ("in", ["OPEN", "PAID"]), "DATE_COLUMN": "notna"}',
+                '    # A function can still be used for custom conditions (slower): {"COLUMN_NAME": lambda value: value.startswith("A")}',
+                '    FILTERS = {"COLUMN_NAME": ("!=", "")}',
                 "    df = filter_rows(df, FILTERS)",
             ],
+            "streaming_code": [
+                '    # Same conditions as the Filter block, applied to each chunk. Example: {"AMOUNT": (">", 500000), "DATE_COLUMN": "notna"}',
+                '    FILTERS = {"COLUMN_NAME": ("!=", "")}',
+                "    df = stream_filter_rows(df, FILTERS)",
+            ],
         },
         {
             "label": "Aggregate",
             "id": "aggregate_input",
             "description": "Apply aggregation to the rows. An aggregation column will be needed and a column to apply the sum will also have to be set. <br>Example:<br> GROUP_COLUMNS = ['COLUMN_1', 'COLUMN_2']<br>AMOUNT_COLUMN = 'COLUMN_3'",
+            "kind": "cpu",
             "code": [
                 "    # Need to define the group columns and the column to apply the sum. Here, the row will group by the columns 'COLUMN_1' and 'COLUMN_2' and apply the sum on 'COLUMN_3'",
                 '    GROUP_COLUMNS = ["COLUMN_1", "COLUMN_2"]',
                 '    AMOUNT_COLUMN = "COLUMN_3"',
+                '    # Several columns can be summed with a list: AMOUNT_COLUMN = ["COLUMN_3", "COLUMN_4"]',
+                "    # Other aggregations (sum, count, min, max, mean) can be added in the same pass. Example:",
+                '    # AGGREGATIONS = {"NB_LINES": ("COLUMN_3", "count"), "MAX_AMOUNT": ("COLUMN_3", "max")}',
+                "    # df = aggregate_input(df, GROUP_COLUMNS, AMOUNT_COLUMN, AGGREGATIONS)",
                 "    df = aggregate_input(df, GROUP_COLUMNS, AMOUNT_COLUMN)",
             ],
+            "streaming_code": [
+                "    # Each chunk is aggregated and merged with the previous ones, the result is a single chunk",
+                '    GROUP_COLUMNS = ["COLUMN_1", "COLUMN_2"]',
+                '    AMOUNT_COLUMN = "COLUMN_3"',
+                "    df = stream_aggregate_input(df, GROUP_COLUMNS, AMOUNT_COLUMN)",
+            ],
         },
         {
             "label": "Mapping",
             "id": "map_rows",
             "description": "Apply a mapping to the rows using a predefined FIELD_MAPPING. Each field is transformed individually based on the input row.",
+            "kind": "cpu",
             "code": [
                 "    # Define a dictionary that maps output field names to a transformation function",
                 "    # Each function receives the current row and its index, and returns the mapped value",
@@ -66,6 +121,9 @@ BLOCK_CATEGORIES = {
                 '    #     "Total_Amount": lambda row, row_index: row["PRICE"] * row["QUANTITY"],  # Calculate total amount from price and quantity',
                 '    #     "Trans_Date": lambda row, row_index: pd.to_datetime(row["DATE"]).strftime("%Y-%m-%d"),  # Format date field to YYYY-MM-DD',
                 "    # }",
+                "    # For large files, a field can be computed for the whole column at once (much faster):",
+                '    #     "Total_Amount": "PRICE * QUANTITY",  # String expression evaluated with DataFrame.eval',
+                '    #     "Total_Amount": column_expression(lambda cols, idx: cols["PRICE"] * cols["QUANTITY"]),  # cols is the DataFrame, idx its index',
                 "",
                 "    # Actual FIELD_MAPPING used here",
                 "    FIELD_MAPPING = {",
@@ -75,15 +133,46 @@ BLOCK_CATEGORIES = {
                 "    # Apply the mapping to the dataframe",
                 "    df = map_fields(df, FIELD_MAPPING)",
             ],
+            "streaming_code": [
+                "    # Same FIELD_MAPPING as the Mapping block, applied to each chunk",
+                "    FIELD_MAPPING = {",
+                '        "OutputFieldName": lambda row, row_index: str(row["InputFieldName"]),',
+                "    }",
+                "    df = stream_map_fields(df, FIELD_MAPPING)",
+            ],
+        },
+        {
+            "label": "Compact Types",
+            "id": "compact_dtypes",
+            "description": "Convert the columns to compact types (text, dates, optionally small integers and categories) to reduce the memory and speed up the next blocks. Added after each Read Excel block.",
+            "kind": "cpu",
+            "code": [
+                "    # Columns of numbers, booleans and dates stored as objects are converted, values are kept as they are",
+                '    # Columns with empty cells (" ") are kept, blanks_as_missing=True converts them with missing values (pd.NA) instead of " "',
+                "    # With category_ratio=0.05, text columns with at most 5% distinct values become categories (new values must be added to their categories)",
+                "    # Integers stay in 64 bits, downcast_integers=True uses the smallest integer types (arithmetic on them can overflow)",
+                "    # The memory before and after is written in the logs",
+                "    df = compact_dtypes(df, category_ratio=0)",
+            ],
         },
         {
             "label": "Fill Empty Fields",
             "id": "fill_empty_fields",
             "description": "Fill empty fields in the DataFrame. The column name will be editable.",
+            "kind": "cpu",
             "code": [
-                "    # Need to define the column name to fill empty fields",
+                "    # Need to define the column name to fill empty fields, several columns can be filled at once with a list",
+                '    # Example: column_name = ["INVOICE_ID", "CUSTOMER", "DATE"]',
+                '    # With group_by, values are only carried between rows of the same group. Example: group_by="INVOICE_ID"',
+                '    # The parameter strategy can be "ffill" (value above), "bfill" (value below) or "constant" (with fill_value=...)',
                 '    column_name = ""',
-                "    df = fill_empty_fields(df, column_name)",
+                '    df = fill_empty_fields(df, column_name, group_by=None, strategy="ffill")',
+            ],
+            "streaming_code": [
+                "    # Need to define the column name to fill empty fields, the last value of a chunk fills the start of the next one",
+                "    # Several columns can be filled with a list, and group_by carries values within groups only (bfill cannot be streamed)",
+                '    column_name = ""',
+                "    df = stream_fill_empty_fields(df, column_name, group_by=None)",
             ],
         },
     ],
@@ -92,6 +181,7 @@ BLOCK_CATEGORIES = {
             "label": "Clear Folder",
             "id": "clear_folder",
             "description": "Clear the folder. The folder will be editable.",
+            "resources": {"OUT": "write"},
             "code": [
                 "    # The parameter OUT can be modified to clear another folder",
                 "    clear_folder(OUT)",
@@ -101,33 +191,42 @@ BLOCK_CATEGORIES = {
             "label": "Group Files In Single Folder",
             "id": "group_files_in_single_folder",
             "description": "Copy all files in a single folder. The folders from and where will be editable.",
+            "resources": {"IN": "read", "OUT": "add"},
             "code": [
                 "    # The parameters IN and OUT can be modified to group files from another folder or to another folder",
-                "    group_files_in_single_folder(IN, OUT)",
+                "    # Files already in OUT with the same size and modification time are skipped, files with the same name get their folder as a suffix",
+                '    # The parameter method can be "copy", "reflink" (clone without copying the data, on btrfs or XFS) or "hardlink" (OUT shares the files of IN)',
+                '    group_files_in_single_folder(IN, OUT, method="copy")',
             ],
         },
         {
             "label": "Zip Folder",
             "id": "zip_Files",
             "description": "Zip all files in a single folder. The folders from and where will be editable.",
+            "resources": {"IN": "read", "OUT": "add"},
             "code": [
                 "    # The parameter folder_path determines the folder to zip",
                 "    folder_path = IN",
                 "    # The parameter zip_path determines the path to save the zip file",
                 "    zip_path = os.path.join(OUT, 'archive.zip')",
-                "    zip_folder(folder_path, zip_path)",
+                "    # Files are compressed in parallel, compression_level goes from 1 (fastest) to 9 (smallest), 0 stores all the files",
+                "    # Already compressed files (xlsx, png, zip...) are stored as is, the parameter store_extensions can change the list",
+                "    # Use streaming=True to compress the files one by one without temporary files",
+                "    zip_folder(folder_path, zip_path, compression_level=6)",
             ],
         },
         {
             "label": "Unzip Folder",
             "id": "unzip_Files",
             "description": "Unzip all files in a single folder. The folders from and where will be editable.",
+            "resources": {"IN": "read", "OUT": "add"},
             "code": [
                 "    # The parameter zip_path determines the path to the zip file",
                 "    zip_path = os.path.join(IN, 'archive.zip')",
                 "    # The parameter folder_path determines the folder to unzip",
                 "    folder_path = OUT",
-                "    unzip_folder(zip_path, folder_path)",
+                "    # The files are extracted in parallel, the parameter max_workers sets the number of processes",
+                "    unzip_file(zip_path, folder_path)",
             ],
         },
     ],
@@ -136,17 +235,32 @@ BLOCK_CATEGORIES = {
             "label": "Send Message",
             "id": "send_message_to_rabbitmq",
             "description": "Define a message and send a payload to RabbitMQ. ",
+            "resources": {"rabbitmq": "write"},
             "code": [
                 "    rabbitmq_payload = {}",
                 "    send_message_to_rabbitmq(rabbitmq_payload)",
             ],
         },
+        {
+            "label": "Send Rows",
+            "id": "send_rows_to_rabbitmq",
+            "description": "Send each row of the DataFrame as a JSON message to RabbitMQ. A routing key column and a rate limit can be set.",
+            "resources": {"rabbitmq": "write"},
+            "code": [
+                "    # The parameter routing_key_column can be set to the column holding the routing key of each row",
+                "    # The parameter max_rate limits the number of messages sent per second (None for no limit)",
+                "    routing_key_column = None",
+                "    max_rate = None",
+                "    send_dataframe_to_rabbitmq(df, routing_key_column=routing_key_column, max_rate=max_rate)",
+            ],
+        },
     ],
     "S3": [
         {
             "label": "Download File",
             "id": "download_file_on_s3",
             "description": "Download a file from S3. The variables will be loaded from the .env file.",
+            "resources": {"IN": "add", "s3": "read"},
             "code": [
                 "    # The parameter IN can be modified to download another in another folder.",
                 "    # The parameter s3_prefix need to be set to determine where are the files in the S3 storage",
@@ -154,33 +268,66 @@ BLOCK_CATEGORIES = {
                 "    download_s3_folder(IN, s3_prefix)",
             ],
         },
+        {
+            "label": "Upload Folder",
+            "id": "upload_folder_on_s3",
+            "description": "Upload all files of a folder to S3 concurrently. The variables will be loaded from the .env file.",
+            "resources": {"OUT": "read", "s3": "add"},
+            "code": [
+                "    # The parameter OUT can be modified to upload another folder.",
+                "    # The parameter s3_prefix need to be set to determine where the files will be stored in the S3 storage",
+                "    # The number of files uploaded at the same time can be set with S3_MAX_CONCURRENCY in the .env file",
+                '    s3_prefix = ""',
+                "    upload_folder_to_s3(OUT, s3_prefix)",
+            ],
+        },
     ],
     "Google Drive": [
         {
             "label": "List Files",
             "id": "list_files_on_gdrive",
             "description": "List all files in a Google Drive folder. The variables will be loaded from the .env file.",
+            "resources": {"gdrive": "read"},
             "code": [
                 "    # The parameter gdrive_folder_id can be set in the .env file to determine where are the files in the Google Drive storage",
                 '    gdrive_folder_id = os.getenv("GDRIVE_FOLDER_ID")',
-                "    list_files(gdrive_folder_id)",
+                '    drive_service = init_gdrive_service(os.getenv("GDRIVE_CREDENTIALS_FILE"))',
+                "    gdrive_files = list_files(drive_service, gdrive_folder_id)",
             ],
         },
         {
             "label": "Download File",
             "id": "download_file_on_gdrive",
             "description": "Download a file from Google Drive. The variables will be loaded from the .env file.",
+            "resources": {"IN": "add", "gdrive": "read"},
             "code": [
                 "    # The parameter IN can be modified to download another in another folder.",
                 "    # The parameter gdrive_folder_id need to be set to determine where are the files in the Google Drive storage",
-                '    gdrive_folder_id = ""',
-                "    download_file(gdrive_folder_id, IN)",
+                "    # Files are downloaded concurrently, the parameter max_workers sets the number of simultaneous downloads",
+                '    gdrive_folder_id = os.getenv("GDRIVE_FOLDER_ID")',
+                '    drive_service = init_gdrive_service(os.getenv("GDRIVE_CREDENTIALS_FILE"))',
+                "    download_folder(drive_service, gdrive_folder_id, IN, max_workers=8)",
+            ],
+        },
+        {
+            "label": "Sync Folder",
+            "id": "sync_folder_on_gdrive",
+            "description": "Download only the files added or modified in a Google Drive folder since the last run, and delete local copies of removed files. The variables will be loaded from the .env file.",
+            "resources": {"IN": "write", "gdrive": "read"},
+            "code": [
+                "    # The parameter IN can be modified to synchronise another folder.",
+                "    # The parameter gdrive_folder_id need to be set to determine where are the files in the Google Drive storage",
+                "    # The first run downloads the whole folder, the state of the synchronisation is kept in cache/gdrive",
+                '    gdrive_folder_id = os.getenv("GDRIVE_FOLDER_ID")',
+                '    drive_service = init_gdrive_service(os.getenv("GDRIVE_CREDENTIALS_FILE"))',
+                "    sync_folder(drive_service, gdrive_folder_id, IN, max_workers=8)",
             ],
         },
         {
             "label": "Upload File",
             "id": "upload_file_on_gdrive",
             "description": "Upload a file to Google Drive. The variables will be loaded from the .env file.",
+            "resources": {"OUT": "read", "gdrive": "add"},
             "code": [
                 "    # The parameter OUT can be modified to upload another in another folder.",
                 "    # The parameter gdrive_folder_id need to be set to determine where are the files in the Google Drive storage",
@@ -192,6 +339,7 @@ BLOCK_CATEGORIES = {
             "label": "Create Timestamped Folder",
             "id": "create_timestamped_folder_on_gdrive",
             "description": "Create a timestamped folder in Google Drive. The variables will be loaded from the .env file.",
+            "resources": {"OUT": "read", "gdrive": "add"},
             "code": [
                 "    # The parameter OUT can be modified to create another in another folder.",
                 "    # The parameter gdrive_folder_id need to be set to determine where are the files in the Google Drive storage",
@@ -203,11 +351,15 @@ BLOCK_CATEGORIES = {
             "label": "Move File",
             "id": "move_file_on_gdrive",
             "description": "Move a file in Google Drive. The variables will be loaded from the .env file.",
+            "resources": {"gdrive": "write"},
             "code": [
-                "    # The parameter OUT can be modified to move another in another folder.",
-                "    # The parameter gdrive_folder_id need to be set to determine where are the files in the Google Drive storage",
-                '    gdrive_folder_id = ""',
-                "    move_file(gdrive_folder_id, OUT)",
+                "    # The parameters gdrive_folder_id and gdrive_destination_folder_id need to be set to determine where the files are moved from and to",
+                "    # All the files of the folder are moved, by batches of 100 calls to the Google Drive API",
+                '    gdrive_folder_id = os.getenv("GDRIVE_FOLDER_ID")',
+                '    gdrive_destination_folder_id = ""',
+                '    drive_service = init_gdrive_service(os.getenv("GDRIVE_CREDENTIALS_FILE"))',
+                "    gdrive_file_ids = [file['id'] for file in list_files(drive_service, gdrive_folder_id)]",
+                "    move_files(drive_service, gdrive_file_ids, gdrive_folder_id, gdrive_destination_folder_id)",
             ],
         },
     ],
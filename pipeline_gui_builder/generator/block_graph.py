@@ -0,0 +1,235 @@
+import ast
+import textwrap
+
+# Variables of the generated job holding folders, resolved to paths by the scheduler at run time
+FOLDER_VARIABLES = ("IN", "OUT")
+
+# Access modes of a resource: blocks adding files to the same folder can run together,
+# a block writing a resource waits for all the other blocks using it
+ACCESS_MODES = ("read", "add", "write")
+
+# Methods changing the object they are called on, a block calling them on a variable modifies it
+MUTATING_METHODS = {
+    "add",
+    "append",
+    "clear",
+    "discard",
+    "extend",
+    "insert",
+    "pop",
+    "popitem",
+    "remove",
+    "reverse",
+    "setdefault",
+    "sort",
+    "update",
+}
+
+
+def _inner_scope_names(statement):
+    """
+    Returns the names bound inside the lambdas, functions and comprehensions of a statement,
+    which are not variables of the job.
+    """
+    names = set()
+    for node in ast.walk(statement):
+        if isinstance(node, (ast.Lambda, ast.FunctionDef, ast.AsyncFunctionDef)):
+            arguments = node.args
+            for argument in (
+                arguments.posonlyargs
+                + arguments.args
+                + arguments.kwonlyargs
+                + [arguments.vararg, arguments.kwarg]
+            ):
+                if argument is not None:
+                    names.add(argument.arg)
+        elif isinstance(node, ast.comprehension):
+            names.update(
+                target.id
+                for target in ast.walk(node.target)
+                if isinstance(target, ast.Name)
+            )
+    return names
+
+
+def _modified_name(node):
+    """
+    Returns the variable modified in place by a node (df["A"] = ..., df.columns = ..., rows.append(...),
+    df.drop(..., inplace=True)), None if the node does not modify a variable.
+    """
+    if isinstance(node, (ast.Subscript, ast.Attribute)) and isinstance(
+        node.ctx, (ast.Store, ast.Del)
+    ):
+        target = node.value
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        inplace = any(
+            keyword.arg == "inplace"
+            and isinstance(keyword.value, ast.Constant)
+            and keyword.value.value is True
+            for keyword in node.keywords
+        )
+        if not inplace and node.func.attr not in MUTATING_METHODS:
+            return None
+        target = node.func.value
+    else:
+        return None
+    while isinstance(target, (ast.Subscript, ast.Attribute)):
+        target = target.value
+    return target.id if isinstance(target, ast.Name) else None
+
+
+def _rebound_arguments(node):
+    """
+    Returns the variables passed to a function and assigned its result (df = fill_empty_fields(df, ...)).
+    Library functions write into the DataFrame they receive before returning it, so the variable
+    is modified in place.
+    """
+    if not isinstance(node, (ast.Assign, ast.AnnAssign)) or node.value is None:
+        return set()
+    targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+    names = {target.id for target in targets if isinstance(target, ast.Name)}
+    arguments = set()
+    for call in ast.walk(node.value):
+        if isinstance(call, ast.Call):
+            arguments.update(
+                argument.id
+                for argument in call.args + [keyword.value for keyword in call.keywords]
+                if isinstance(argument, ast.Name)
+            )
+    return names & arguments
+
+
+def analyze_block_code(code):
+    """
+    Finds the variables used by the code of a block.
+
+    Arguments:
+    - code (list): The code lines of the block, indented as in the main function.
+
+    Returns:
+    - tuple: The sets of variables read before being assigned in the block, assigned by the block
+      and modified in place by the block.
+
+    Raises:
+    - SyntaxError: If the code of the block is not valid.
+    """
+    tree = ast.parse(textwrap.dedent("\n".join(code)))
+    free, stored, modified = set(), set(), set()
+    for statement in tree.body:
+        inner = _inner_scope_names(statement)
+        loaded, assigned = set(), set()
+        for node in ast.walk(statement):
+            if isinstance(node, ast.Name) and node.id not in inner:
+                if isinstance(node.ctx, ast.Load):
+                    loaded.add(node.id)
+                else:
+                    assigned.add(node.id)
+            elif isinstance(
+                node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+            ):
+                assigned.add(node.name)
+            elif isinstance(node, (ast.Import, ast.ImportFrom)):
+                assigned.update(
+                    (alias.asname or alias.name).split(".")[0] for alias in node.names
+                )
+            name = _modified_name(node)
+            if name is not None and name not in inner:
+                modified.add(name)
+            modified |= _rebound_arguments(node) - inner
+        # The right side of an assignment is evaluated first: df = f(df) reads the previous df
+        free |= loaded - stored
+        stored |= assigned
+    return free, stored, modified
+
+
+def _merge_access(first, second):
+    if first is None or first == second:
+        return second
+    return "write"
+
+
+def build_block_graph(blocks, definitions, streaming=False):
+    """
+    Describes the inputs, outputs and resources of each block of a pipeline, so the scheduler can run
+    the blocks which do not depend on each other at the same time.
+
+    Variables assigned by a block and read by a later one become outputs of the first block and inputs
+    of the second one. Variables modified in place, or passed to a function assigning them its result
+    (df = fill_empty_fields(df, ...)), are outputs too, and the blocks reading the previous value
+    run before the block modifying it.
+    The resources are the IN / OUT folders used by the code and the remote services declared in the
+    block definitions. A folder used by a block whose definition does not declare it is considered written.
+
+    Arguments:
+    - blocks (list): The blocks of the pipeline, dictionaries with a type and the code lines to run.
+    - definitions (dict): The block definitions by id.
+    - streaming (bool): Whether the blocks pass lazy chunk generators, so a block also uses the
+      resources of the blocks producing its inputs, and all the blocks run in threads.
+
+    Returns:
+    - list: A dictionary per block with the inputs, outputs, inputs modified in place, resources
+      and kind ("io" or "cpu") of the block.
+
+    Raises:
+    - SyntaxError: If the code of a block is not valid.
+    """
+    analyses = []
+    for block in blocks:
+        free, stored, modified = analyze_block_code(block["code"])
+        analyses.append((free, stored | modified, modified))
+
+    # Variables assigned by the blocks before each block
+    produced_before = []
+    produced = set()
+    for _, stored, _ in analyses:
+        produced_before.append(set(produced))
+        produced |= stored
+
+    # Walking backwards, the variables assigned by a block are outputs if a later block reads them.
+    # Outputs already assigned before are also inputs, so a block assigning them only in some cases
+    # keeps the previous value, as in a sequential job
+    nodes = [None] * len(blocks)
+    read_later = set()
+    for position in range(len(blocks) - 1, -1, -1):
+        free, stored, modified = analyses[position]
+        outputs = stored & read_later
+        inputs = (free | outputs) & produced_before[position]
+        read_later = (read_later - stored) | free | inputs
+        nodes[position] = {
+            "inputs": sorted(inputs),
+            "outputs": sorted(outputs),
+            "modifies": sorted(modified & inputs),
+        }
+
+    for position, block in enumerate(blocks):
+        free = analyses[position][0]
+        definition = definitions.get(block["type"])
+        node = nodes[position]
+        if definition is None:
+            # Unknown block: it waits for all the blocks before it and the blocks after it wait for it
+            node["resources"] = {"*": "write"}
+            node["kind"] = "io"
+            continue
+
+        declared = definition.get("resources", {})
+        resources = {
+            name: access
+            for name, access in declared.items()
+            if name not in FOLDER_VARIABLES or name in free
+        }
+        for folder in FOLDER_VARIABLES:
+            if folder in free and folder not in resources:
+                resources[folder] = "write"
+        if streaming:
+            # Chunks are read when a later block consumes them, with the resources of their producer
+            for name in node["inputs"]:
+                producer = next(
+                    nodes[index]
+                    for index in range(position - 1, -1, -1)
+                    if name in nodes[index]["outputs"]
+                )
+                for resource, access in producer["resources"].items():
+                    resources[resource] = _merge_access(resources.get(resource), access)
+        node["resources"] = resources
+        node["kind"] = "io" if streaming else definition.get("kind", "io")
+    return nodes
@@ -1,8 +1,24 @@
+import json
 import os
 
+from pipeline_gui_builder.constants.block_definitions import BLOCK_CATEGORIES
+from pipeline_gui_builder.generator.block_graph import build_block_graph
 
-def generate_all(pipeline, folder, generateLocalFiles):
-    generate_script(pipeline, folder)
+BLOCK_DEFINITIONS = {
+    block["id"]: block for blocks in BLOCK_CATEGORIES.values() for block in blocks
+}
+
+# Number of rows processed at once by the streaming blocks
+DEFAULT_CHUNK_SIZE = 50000
+
+# Blocks followed by a COMPACT_DTYPES block, unless the pipeline already has one after them
+INGESTION_BLOCKS = ("read_excel", "read_excel_folder")
+
+
+def generate_all(
+    pipeline, folder, generateLocalFiles, streaming=False, compact=True, concurrent=True
+):
+    generate_script(pipeline, folder, streaming, compact, concurrent)
     if not folder or not generateLocalFiles:
         return
     os.makedirs(os.path.join(folder, "IN"), exist_ok=True)
@@ -10,7 +26,109 @@ def generate_all(pipeline, folder, generateLocalFiles):
     write_dot_env(pipeline, folder)
 
 
-def generate_script(pipeline, folder):
+def block_code(block, streaming):
+    """
+    Returns the code lines of a block.
+    In streaming mode, blocks that can run chunk by chunk use their streaming code instead.
+    """
+    definition = BLOCK_DEFINITIONS.get(block["type"], {})
+    if streaming and "streaming_code" in definition:
+        return definition["streaming_code"]
+    return block["code"]
+
+
+def with_compaction(pipeline):
+    """
+    Returns the pipeline with a COMPACT_DTYPES block after each ingestion block.
+    """
+    blocks = []
+    for position, block in enumerate(pipeline):
+        blocks.append(block)
+        following = pipeline[position + 1] if position + 1 < len(pipeline) else None
+        if block["type"] in INGESTION_BLOCKS and (
+            following is None or following["type"] != "compact_dtypes"
+        ):
+            blocks.append(
+                {
+                    "type": "compact_dtypes",
+                    "code": BLOCK_DEFINITIONS["compact_dtypes"]["code"],
+                }
+            )
+    return blocks
+
+
+def block_lines(block, streaming):
+    """
+    Returns the lines of a block, run in a context recording its metrics when JOB_METRICS is set.
+    """
+    lines = [f"    # {block['type'].upper()}"]
+    lines.append(f'    with measure_block("{block["type"].upper()}"):')
+    code = block_code(block, streaming)
+    for line in code:
+        lines.append(f"    {line}" if line.strip() else line)
+    if not any(line.strip() and not line.strip().startswith("#") for line in code):
+        lines.append("        pass")
+    return lines
+
+
+def sequential_main(pipeline, streaming):
+    lines = ["def main():"]
+    for block in pipeline:
+        lines.append("")
+        lines += block_lines(block, streaming)
+    return lines
+
+
+def concurrent_main(pipeline, graph, streaming):
+    """
+    Returns the lines of a main function running the blocks with run_blocks.
+    Each block becomes a function receiving the variables it reads from the blocks before it
+    and returning the variables read by the blocks after it.
+    """
+    lines = []
+    blocks = []
+    for position, (block, node) in enumerate(zip(pipeline, graph), start=1):
+        function_name = f"block_{position}_{block['type'].lower()}"
+        lines.append(f"def {function_name}({', '.join(node['inputs'])}):")
+        lines += block_lines(block, streaming)
+        if node["outputs"]:
+            outputs = ", ".join(f'"{name}": {name}' for name in node["outputs"])
+            lines.append(f"    return {{{outputs}}}")
+        lines += ["", ""]
+
+        arguments = [f'"{block["type"].upper()}"', function_name]
+        for key in ("inputs", "outputs", "modifies", "resources"):
+            if node[key]:
+                arguments.append(f"{key}={json.dumps(node[key])}")
+        if node["kind"] != "io":
+            arguments.append(f'kind="{node["kind"]}"')
+        blocks.append(f"            Block({', '.join(arguments)}),")
+
+    lines += [
+        "def main():",
+        "    # Blocks which do not depend on each other run at the same time",
+        "    run_blocks(",
+        "        [",
+        *blocks,
+        "        ],",
+        '        folders={"IN": IN, "OUT": OUT},',
+        "    )",
+    ]
+    return lines
+
+
+def generate_script(pipeline, folder, streaming=False, compact=True, concurrent=True):
+    # Chunks are already small, and types inferred chunk by chunk could differ from one chunk to the next
+    if compact and not streaming:
+        pipeline = with_compaction(pipeline)
+
+    graph = None
+    if concurrent:
+        try:
+            graph = build_block_graph(pipeline, BLOCK_DEFINITIONS, streaming)
+        except SyntaxError as e:
+            print(f"Invalid block code, the blocks will run one after another: {e}")
+
     lines = [
         "import os",
         "import pandas as pd",
@@ -18,8 +136,11 @@ def generate_script(pipeline, folder):
         "from utils.runner import *",
         "from utils.file_management import *",
         "from utils.data_management import *",
-        "",
+        "from utils.block_metrics import measure_block",
     ]
+    if graph is not None:
+        lines.append("from utils.scheduler import Block, run_blocks")
+    lines.append("")
 
     for block in pipeline:
         if "s3" in block["type"] and "from utils.s3_utils import *" not in lines:
@@ -35,22 +156,21 @@ def generate_script(pipeline, folder):
         ):
             lines.append("from utils.gDrive_utils import *")
 
-    lines.append(
+    lines += [
         "load_env(__file__)",
         "",
         'OUT = os.getenv("OUT")',
         'IN = os.getenv("IN")',
         "",
-    )
+    ]
+    if streaming:
+        lines += [f"CHUNK_SIZE = {DEFAULT_CHUNK_SIZE}", ""]
 
     lines.append("")
-    lines.append("def main():")
-
-    for block in pipeline:
-        lines.append("")
-        lines.append(f"    # {block['type'].upper()}")
-        for line in block["code"]:
-            lines.append(f"{line}")
+    if graph is None:
+        lines += sequential_main(pipeline, streaming)
+    else:
+        lines += concurrent_main(pipeline, graph, streaming)
 
     lines += ["", "", 'if __name__ == "__main__":']
 
@@ -69,6 +189,13 @@ def write_dot_env(pipeline, folder_path):
     env_path = os.path.join(folder_path, ".env")
     with open(env_path, "w") as f:
         f.write("# JOB\nIN=\nOUT=\n")
+        # 1 to print and save the time and memory used by each block, tracemalloc to also trace the allocations
+        f.write("JOB_METRICS=0\n")
+        # 1 to run the job under cProfile, or a list of modes among cpu, sampling and memory
+        f.write("JOB_PROFILE=0\n")
+        # 1 (or the --cache flag) to checkpoint the outputs of the blocks in cache/blocks and restore the unchanged ones
+        # on the next run, instead of running all the blocks. Each block writes a copy of its outputs to disk
+        f.write("JOB_CACHE=0\n")
 
         for block in pipeline:
             if "s3" in block["type"]:
@@ -16,12 +16,12 @@ class Api:
         )
         return path or None
 
-    def generate_script(self, pipeline, path, generate_local_files):
+    def generate_script(self, pipeline, path, generate_local_files, streaming=False):
         if not path:
             return None
 
         folder = os.path.dirname(path)
-        generate_all(pipeline, folder, generate_local_files)
+        generate_all(pipeline, folder, generate_local_files, streaming)
 
         return os.path.join(folder, "run.py")
 
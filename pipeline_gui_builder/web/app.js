@@ -95,11 +95,12 @@ function generate() {
   if (window.pywebview) {
     const generateLocalFiles =
       document.getElementById("generateLocalFiles").checked;
+    const streaming = document.getElementById("streaming").checked;
 
     window.pywebview.api.choose_output_path().then((path) => {
       if (path) {
         window.pywebview.api
-          .generate_script(pipeline, path, generateLocalFiles)
+          .generate_script(pipeline, path, generateLocalFiles, streaming)
           .then((savedPath) => {
             alert("Script saved at: " + savedPath);
           });
@@ -0,0 +1,23 @@
+import pytest
+
+from utils import block_cache
+
+
+@pytest.mark.parametrize(
+    "arguments, environment, enabled",
+    [
+        ([], None, False),
+        ([], "0", False),
+        ([], "1", True),
+        (["--cache"], None, True),
+        (["--no-cache"], "1", False),
+    ],
+)
+def test_cache_is_off_by_default(monkeypatch, arguments, environment, enabled):
+    monkeypatch.setattr(block_cache.sys, "argv", ["run.py", *arguments])
+    if environment is None:
+        monkeypatch.delenv(block_cache.CACHE_ENV_VARIABLE, raising=False)
+    else:
+        monkeypatch.setenv(block_cache.CACHE_ENV_VARIABLE, environment)
+
+    assert block_cache.cache_enabled() is enabled
@@ -0,0 +1,63 @@
+from pipeline_gui_builder.generator.block_graph import (
+    analyze_block_code,
+    build_block_graph,
+)
+from pipeline_gui_builder.generator.script_generator import (
+    BLOCK_DEFINITIONS,
+    with_compaction,
+)
+from utils.scheduler import Block, build_dependencies
+
+
+def pipeline_block(block_type, code=None):
+    return {"type": block_type, "code": code or BLOCK_DEFINITIONS[block_type]["code"]}
+
+
+def test_variables_rebound_to_a_function_result_are_modified():
+    _, _, modified = analyze_block_code(
+        [
+            '    df = fill_empty_fields(df, "A", strategy="ffill")',
+            "    other = compact_dtypes(frame=rows)",
+            "    total = df.copy()",
+        ]
+    )
+
+    assert modified == {"df"}
+
+
+def test_fill_waits_for_the_export_of_the_previous_value():
+    pipeline = with_compaction(
+        [
+            pipeline_block("read_excel"),
+            pipeline_block(
+                "write_excel", ["    export_excel(df, os.path.join(OUT, 'raw.xlsx'))"]
+            ),
+            pipeline_block(
+                "fill_empty_fields",
+                ['    df = fill_empty_fields(df, ["A", "B"], strategy="ffill")'],
+            ),
+            pipeline_block(
+                "write_excel",
+                ["    export_excel(df, os.path.join(OUT, 'filled.xlsx'))"],
+            ),
+        ]
+    )
+    graph = build_block_graph(pipeline, BLOCK_DEFINITIONS)
+
+    blocks = [
+        Block(block["type"].upper(), None, **node)
+        for block, node in zip(pipeline, graph)
+    ]
+    dependencies, _ = build_dependencies(blocks, {"IN": "IN", "OUT": "OUT"})
+
+    names = [block.name for block in blocks]
+    assert names == [
+        "READ_EXCEL",
+        "COMPACT_DTYPES",
+        "WRITE_EXCEL",
+        "FILL_EMPTY_FIELDS",
+        "WRITE_EXCEL",
+    ]
+    assert graph[1]["modifies"] == ["df"]
+    assert graph[3]["modifies"] == ["df"]
+    assert 2 in dependencies[3]
@@ -0,0 +1,41 @@
+import threading
+import time
+
+from utils.block_metrics import get_metrics, measure_block, reset_metrics
+from utils.scheduler import Block, run_blocks
+
+
+def test_concurrent_blocks_measure_their_own_thread(monkeypatch):
+    monkeypatch.setenv("JOB_METRICS", "tracemalloc")
+    reset_metrics()
+    started = threading.Barrier(2, timeout=5)
+
+    def busy_block():
+        with measure_block("BUSY"):
+            started.wait()
+            end = time.perf_counter() + 0.3
+            while time.perf_counter() < end:
+                pass
+
+    def waiting_block():
+        with measure_block("WAITING"):
+            started.wait()
+            time.sleep(0.3)
+
+    def alone_block():
+        with measure_block("ALONE"):
+            rows = [0] * 100000
+
+    run_blocks([Block("BUSY", busy_block), Block("WAITING", waiting_block)])
+    alone_block()
+
+    records = {record["block"]: record for record in get_metrics()}
+    reset_metrics()
+    assert records["BUSY"]["cpu_time_s"] > 0.2
+    assert records["WAITING"]["cpu_time_s"] < 0.1
+    for name in ("BUSY", "WAITING"):
+        assert records[name]["concurrent"]
+        assert records[name]["traced_peak_mb"] is None
+        assert records[name]["peak_rss_growth_mb"] is None
+    assert not records["ALONE"]["concurrent"]
+    assert records["ALONE"]["traced_peak_mb"] >= 0.7
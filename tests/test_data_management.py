@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+from utils.data_management import (
+    aggregate_input,
+    column_expression,
+    compact_dtypes,
+    fill_empty_fields,
+    filter_rows,
+    map_fields,
+)
+
+
+def test_map_fields_row_functions_receive_a_series():
+    df = pd.DataFrame({"A": [1, 2], "B": [np.nan, "x"]})
+
+    mapped = map_fields(
+        df,
+        {
+            "ATTRIBUTE": lambda row, i: row.A + 1,
+            "MISSING": lambda row, i: row.isna().sum(),
+            "KEY": lambda row, i: f"{row['B']}-{i}",
+        },
+    )
+
+    assert mapped["ATTRIBUTE"].tolist() == [2, 3]
+    assert mapped["MISSING"].tolist() == [1, 0]
+    assert mapped["KEY"].tolist() == ["nan-0", "x-1"]
+
+
+def test_map_fields_named_functions_receive_a_series():
+    def total(row, row_index):
+        return row[["A", "B"]].sum()
+
+    df = pd.DataFrame({"A": [1, 2], "B": [10, 20]})
+
+    assert map_fields(df, {"TOTAL": total})["TOTAL"].tolist() == [11, 22]
+
+
+def test_aggregate_input_keeps_passthrough_dtypes():
+    df = pd.DataFrame(
+        {
+            "KEY": ["a", "a", "b", "b"],
+            "STATUS": pd.Categorical([np.nan, "open", "closed", np.nan]),
+            "COUNT": pd.array([None, 2, 3, None], dtype="Int64"),
+            "LABEL": [np.nan, "x", "y", "z"],
+            "AMOUNT": [1.0, 2.0, 3.0, 4.0],
+        }
+    )
+
+    grouped = aggregate_input(df, ["KEY"], "AMOUNT")
+
+    expected = df.groupby("KEY", as_index=False).first()
+    expected["AMOUNT"] = [3.0, 7.0]
+    pd.testing.assert_frame_equal(grouped, expected[df.columns])
+    assert grouped["STATUS"].dtype == df["STATUS"].dtype
+    assert grouped["COUNT"].dtype == "Int64"
+
+
+def test_compact_dtypes_keeps_integer_arithmetic_exact():
+    df = compact_dtypes(
+        pd.DataFrame({"PRICE": [399, 1], "QUANTITY": [399.0, np.nan]}),
+        verbose=False,
+    )
+
+    mapped = map_fields(
+        df,
+        {
+            "TOTAL": "PRICE * QUANTITY",
+            "EXPRESSION": column_expression(
+                lambda cols, idx: cols["PRICE"] * cols["QUANTITY"]
+            ),
+        },
+    )
+
+    assert df["PRICE"].dtype == "int64"
+    assert df["QUANTITY"].dtype == "float64"
+    assert mapped["TOTAL"].iloc[0] == 159201
+    assert mapped["EXPRESSION"].iloc[0] == 159201
+
+
+def test_compact_dtypes_can_downcast_integers():
+    df = compact_dtypes(
+        pd.DataFrame({"A": [1, 2], "B": [1.0, np.nan]}),
+        downcast_integers=True,
+        verbose=False,
+    )
+
+    assert df["A"].dtype == "int8"
+    assert df["B"].dtype == "Int8"
+
+
+def test_compact_dtypes_keeps_blank_cells():
+    df = pd.DataFrame({"A": [1.0, " "], "T": ["a", " "]})
+
+    kept = compact_dtypes(df.copy(), verbose=False)
+    converted = compact_dtypes(df.copy(), blanks_as_missing=True, verbose=False)
+
+    assert kept["A"].tolist() == [1.0, " "]
+    assert kept["T"].tolist() == ["a", " "]
+    assert converted["A"].dtype == "float64"
+    assert converted["A"].isna().tolist() == [False, True]
+
+
+def test_compact_dtypes_converts_categories_on_request():
+    df = pd.DataFrame({"S": ["a", "b", "a", "a"]})
+
+    assert compact_dtypes(df.copy(), verbose=False)["S"].dtype == object
+    assert (
+        compact_dtypes(df.copy(), category_ratio=0.5, verbose=False)["S"].dtype
+        == "category"
+    )
+
+
+def test_categories_can_be_filled_and_filtered():
+    df = pd.DataFrame({"S": pd.Categorical(["a", "", "d", np.nan])})
+
+    filled = fill_empty_fields(df, "S", strategy="constant", fill_value="c")
+
+    assert filled["S"].tolist() == ["a", "c", "d", "c"]
+    assert filter_rows(filled, {"S": ("<", "c")})["S"].tolist() == ["a"]
+    assert filter_rows(filled, {"S": ("between", ("b", "c"))})["S"].tolist() == [
+        "c",
+        "c",
+    ]
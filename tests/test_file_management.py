@@ -0,0 +1,229 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils import file_management
+from utils.file_management import (
+    find_files,
+    get_directory_index,
+    get_excel_file,
+    get_json_file,
+    parse_excel_file,
+    read_excel_file,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_logged(code, cwd, timeout=120):
+    """
+    Runs code in a new Python process after init_logs, as in a generated job, and returns its log.
+    """
+    script = textwrap.dedent("""
+        import sys
+        from utils.logs_management import close_logs, init_logs
+
+        log_path = init_logs("test")
+        """) + textwrap.dedent(code)
+    script += "\nclose_logs()\nprint(log_path)\n"
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=cwd,
+        env={**os.environ, "PYTHONPATH": ROOT},
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
+    assert result.returncode == 0, result.stderr
+    with open(os.path.join(cwd, result.stdout.splitlines()[-1]), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_read_excel_folder_runs_under_logs(tmp_path):
+    folder = tmp_path / "IN"
+    folder.mkdir()
+    for number in range(3):
+        pd.DataFrame({"A": [number, number + 1]}).to_excel(
+            folder / f"f{number}.xlsx", index=False
+        )
+
+    log = run_logged(
+        """
+        from utils.file_management import read_excel_folder
+
+        df = read_excel_folder("IN", max_workers=3)
+        print(f"ROWS {len(df)} {sorted(df['SOURCE_FILE'].unique())}")
+        """,
+        tmp_path,
+    )
+
+    assert "ROWS 6 ['f0.xlsx', 'f1.xlsx', 'f2.xlsx']" in log
+
+
+def test_zip_folder_runs_under_logs_and_sorts_members(tmp_path):
+    folder = tmp_path / "data"
+    (folder / "sub").mkdir(parents=True)
+    for name in ("f4.txt", "f1.txt", "f0.txt", "sub/f3.txt", "f2.csv"):
+        (folder / name).write_text(name * 1000)
+
+    log = run_logged(
+        """
+        import zipfile
+        from utils.file_management import unzip_file, zip_folder
+
+        zip_folder("data", "data.zip", max_workers=2)
+        with zipfile.ZipFile("data.zip") as archive:
+            print(f"MEMBERS {archive.namelist()}")
+        unzip_file("data.zip", "extracted", max_workers=2)
+        """,
+        tmp_path,
+    )
+
+    assert "MEMBERS ['f0.txt', 'f1.txt', 'f2.csv', 'f4.txt', 'sub/f3.txt']" in log
+    for name in ("f4.txt", "f1.txt", "f0.txt", "sub/f3.txt", "f2.csv"):
+        assert (tmp_path / "extracted" / name).read_text() == name * 1000
+
+
+def test_get_excel_file_matches_glob(tmp_path):
+    folder = tmp_path / "IN"
+    (folder / "sub").mkdir(parents=True)
+    (folder / "in.xlsx").touch()
+    (folder / "._in.xlsx").touch()
+    (folder / "sub" / "a.xlsx").touch()
+
+    assert get_excel_file(f"{folder}/") == f"{folder}/in.xlsx"
+    assert get_excel_file(str(folder)) == str(folder / "in.xlsx")
+    assert find_files(r".*\.xlsx$", str(folder)) == [
+        str(folder / "in.xlsx"),
+        str(folder / "sub" / "a.xlsx"),
+    ]
+
+
+def test_directory_index_does_not_follow_directory_links(tmp_path):
+    folder = tmp_path / "IN"
+    (folder / "sub").mkdir(parents=True)
+    (folder / "sub" / "a.csv").touch()
+    (folder / "sub" / "loop").symlink_to(folder, target_is_directory=True)
+
+    assert find_files(r".*\.csv$", str(folder)) == [str(folder / "sub" / "a.csv")]
+
+
+def test_root_lookups_do_not_scan_subfolders(tmp_path):
+    folder = tmp_path / "IN"
+    (folder / "sub").mkdir(parents=True)
+    (folder / "data.json").touch()
+
+    index = get_directory_index(str(folder), recursive=False)
+
+    assert list(index.directory_mtimes) == [str(folder)]
+    assert get_json_file(str(folder)) == str(folder / "data.json")
+
+
+def test_directory_index_lookups_during_a_refresh(tmp_path):
+    folder = tmp_path / "IN"
+    folder.mkdir()
+    for number in range(500):
+        (folder / f"file{number}.csv").touch()
+    index = get_directory_index(str(folder))
+    expected = index.find(r".*\.csv$")
+
+    def refresh():
+        for _ in range(50):
+            index.refresh()
+
+    def look_up():
+        return [
+            (index.find(r".*\.csv$"), index.with_extension(".csv")) for _ in range(200)
+        ]
+
+    with ThreadPoolExecutor(4) as executor:
+        refreshing = executor.submit(refresh)
+        lookups = [executor.submit(look_up) for _ in range(3)]
+        refreshing.result()
+        results = [result for lookup in lookups for result in lookup.result()]
+
+    assert len(expected) == 500
+    assert all(found == expected and listed == expected for found, listed in results)
+
+
+def test_stale_directory_index_is_replaced(tmp_path):
+    folder = tmp_path / "IN"
+    folder.mkdir()
+    (folder / "a.csv").touch()
+    index = get_directory_index(str(folder))
+    (folder / "b.csv").touch()
+
+    assert get_directory_index(str(folder)) is not index
+    assert index.find(r".*\.csv$") == [str(folder / "a.csv")]
+    assert find_files(r".*\.csv$", str(folder)) == [
+        str(folder / "a.csv"),
+        str(folder / "b.csv"),
+    ]
+
+
+def test_unzip_file_creates_shared_folders_once(tmp_path):
+    with zipfile.ZipFile(tmp_path / "data.zip", "w") as archive:
+        archive.writestr("empty/", "")
+        for directory in range(50):
+            for number in range(16):
+                archive.writestr(f"d{directory}/f{number}.txt", f"{directory}-{number}")
+
+    log = run_logged(
+        """
+        from utils.file_management import unzip_file
+
+        unzip_file("data.zip", "out", max_workers=16)
+        """,
+        tmp_path,
+    )
+
+    assert "801 file(s) extracted to out by 16 processes" in log
+    assert (tmp_path / "out" / "empty").is_dir()
+    for directory in range(50):
+        for number in range(16):
+            path = tmp_path / "out" / f"d{directory}" / f"f{number}.txt"
+            assert path.read_text() == f"{directory}-{number}"
+
+
+def test_openpyxl_reader_converts_text_like_read_excel(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_management, "CALAMINE_AVAILABLE", False)
+    path = tmp_path / "in.xlsx"
+    pd.DataFrame(
+        {
+            "A": [1.5, None, 2.0],
+            "N": [1.5, 2, 3],
+            "B": ["x", None, "y"],
+            "C": [pd.Timestamp("2024-01-01"), None, pd.Timestamp("2024-01-02 03:04")],
+        }
+    ).to_excel(path, index=False)
+
+    for dtype in (str, {"A": str}, {"A": "string"}):
+        df = parse_excel_file(str(path), dtype=dtype)
+
+        pd.testing.assert_frame_equal(df, pd.read_excel(path, dtype=dtype))
+    df = parse_excel_file(str(path), dtype=str)
+    assert df["A"].tolist()[::2] == ["1.5", "2"]
+    assert df["A"].isna().tolist() == [False, True, False]
+    assert df["N"].tolist() == ["1.5", "2", "3"]
+
+
+def test_excel_cache_is_written_by_concurrent_threads(tmp_path, monkeypatch):
+    monkeypatch.setenv("EXCEL_CACHE_DIR", str(tmp_path / "cache"))
+    paths = []
+    for number in range(8):
+        paths.append(tmp_path / f"in{number}.xlsx")
+        pd.DataFrame({"A": [number] * 100}).to_excel(paths[-1], index=False)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        frames = list(executor.map(lambda path: read_excel_file(str(path)), paths))
+
+    assert [df["A"].iloc[0] for df in frames] == list(range(8))
+    with open(tmp_path / "cache" / "index.json", encoding="utf-8") as f:
+        assert json.load(f)
+    assert not list((tmp_path / "cache").glob("*.tmp"))
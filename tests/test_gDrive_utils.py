@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from utils import gDrive_utils
+
+
+class FakeService:
+    """
+    Stands for a Drive service, the downloads are replaced.
+    """
+
+
+def fake_download(contents):
+    """
+    Replaces download_file, writing the content of each file id in small slow chunks,
+    so concurrent downloads of files with the same name overlap.
+    """
+    started = threading.Barrier(2, timeout=5)
+
+    def download_file(drive_service, file_id, filename, http):
+        started.wait()
+        with open(filename, "wb") as f:
+            for position in range(0, len(contents[file_id]), 100):
+                f.write(contents[file_id][position : position + 100])
+                f.flush()
+                time.sleep(0.001)
+
+    return download_file
+
+
+def test_files_with_the_same_name_are_not_mixed(tmp_path, monkeypatch):
+    contents = {"id1": b"a" * 5000, "id2": b"b" * 3000}
+    monkeypatch.setattr(gDrive_utils, "download_file", fake_download(contents))
+    files = [{"id": "id1", "name": "report.csv"}, {"id": "id2", "name": "report.csv"}]
+
+    paths = gDrive_utils.download_files(
+        FakeService(), files, str(tmp_path), max_workers=2, http_factory=lambda: None
+    )
+
+    assert paths == [str(tmp_path / "report.csv")]
+    assert (tmp_path / "report.csv").read_bytes() in contents.values()
+    assert [path.name for path in tmp_path.iterdir()] == ["report.csv"]
+
+
+def test_downloads_use_the_credentials_of_init_gdrive_service(tmp_path, monkeypatch):
+    credentials = object()
+    service = FakeService()
+    monkeypatch.setattr(
+        gDrive_utils.service_account.Credentials,
+        "from_service_account_file",
+        lambda path, scopes: credentials,
+    )
+    monkeypatch.setattr(gDrive_utils, "build", lambda *args, **kwargs: service)
+    authorized = []
+    monkeypatch.setattr(
+        gDrive_utils,
+        "AuthorizedHttp",
+        lambda creds, http: authorized.append(creds) or http,
+    )
+    monkeypatch.setattr(
+        gDrive_utils,
+        "download_file",
+        lambda drive_service, file_id, filename, http: open(filename, "wb").close(),
+    )
+
+    drive_service = gDrive_utils.init_gdrive_service("credentials.json")
+    gDrive_utils.download_files(
+        drive_service, [{"id": "id1", "name": "a.csv"}], str(tmp_path)
+    )
+
+    assert authorized == [credentials]
+
+
+def test_downloads_need_credentials_for_other_services(tmp_path):
+    with pytest.raises(ValueError, match="credentials"):
+        gDrive_utils.download_files(
+            FakeService(), [{"id": "id1", "name": "a.csv"}], str(tmp_path)
+        )
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_forked_processes_write_to_the_log(tmp_path):
+    script = textwrap.dedent("""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        from utils.logs_management import close_logs, init_logs
+
+
+        def square(value):
+            print(f"worker {value}")
+            return value * value
+
+
+        if __name__ == "__main__":
+            log_path = init_logs("test")
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(2, mp_context=context) as executor:
+                print(f"results {list(executor.map(square, range(4)))}")
+            close_logs()
+            print(log_path)
+        """)
+    (tmp_path / "job.py").write_text(script)
+
+    result = subprocess.run(
+        [sys.executable, "job.py"],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": ROOT},
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+
+    assert result.returncode == 0, result.stderr
+    log = (tmp_path / result.stdout.splitlines()[-1]).read_text()
+    assert "results [0, 1, 4, 9]" in log
+    assert all(f"worker {value}" in log for value in range(4))
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.data_management import map_fields
+from utils.mapping_vectorizer import (
+    LAMBDA_CACHE_SIZE,
+    _find_lambda_node,
+    vectorize_row_function,
+)
+
+
+def sample_df():
+    return pd.DataFrame(
+        {
+            "PRICE": np.array([399, 250, -7], dtype=np.int16),
+            "QUANTITY": np.array([399, 2, 3], dtype=np.int16),
+            "BIG": np.array([2**40, 3, -(2**40)], dtype=np.int64),
+            "AMOUNT": [1.5, np.nan, -2.25],
+            "COUNT": pd.array([1, None, 3], dtype="Int64"),
+            "NAME": ["a", np.nan, "c"],
+            "STATUS": pd.Categorical(["open", "closed", "open"]),
+            "DATE": pd.to_datetime(["2024-01-31", "2024-02-29", "2024-03-01"]),
+        },
+        index=[10, 11, 12],
+    )
+
+
+# Rewritten as column operations on the sample DataFrame
+VECTORIZED = {
+    "product": lambda row, i: row["PRICE"] * row["QUANTITY"],
+    "sum": lambda row, i: row["PRICE"] + row["QUANTITY"] + 1,
+    "negative": lambda row, i: -row["PRICE"],
+    "power": lambda row, i: row["PRICE"] ** 2,
+    "float": lambda row, i: row["AMOUNT"] * 2 + 1,
+    "division": lambda row, i: row["AMOUNT"] / row["QUANTITY"],
+    "nullable": lambda row, i: row["COUNT"] + 1,
+    "str": lambda row, i: str(row["NAME"]),
+    "str_amount": lambda row, i: str(row["AMOUNT"]),
+    "fstring": lambda row, i: f"{row['STATUS']}-{row['PRICE']}-{i}",
+    "format_spec": lambda row, i: f"{row['AMOUNT']:.2f}",
+    "index": lambda row, i: i + 1,
+    "strftime": lambda row, i: row["DATE"].strftime("%d/%m/%Y"),
+}
+
+# Left to the row path, where Python integers do not overflow and Python raises on zero divisions
+ROW_BY_ROW = {
+    "big_product": lambda row, i: row["BIG"] * row["BIG"],
+    "big_power": lambda row, i: row["BIG"] ** 2,
+    "big_constant": lambda row, i: row["BIG"] * 10**8,
+}
+
+
+def map_both_ways(transformation):
+    df = sample_df()
+    vectorized = map_fields(df, {"VALUE": transformation})["VALUE"]
+    row_by_row = map_fields(df, {"VALUE": transformation}, vectorize=False)["VALUE"]
+    return vectorized, row_by_row
+
+
+@pytest.mark.parametrize("name", VECTORIZED)
+def test_vectorized_fields_match_row_by_row(name):
+    transformation = VECTORIZED[name]
+    assert vectorize_row_function(transformation, sample_df()) is not None
+
+    vectorized, row_by_row = map_both_ways(transformation)
+
+    pd.testing.assert_series_equal(vectorized, row_by_row, check_dtype=False)
+
+
+@pytest.mark.parametrize("name", ROW_BY_ROW)
+def test_integer_overflow_uses_row_path(name):
+    transformation = ROW_BY_ROW[name]
+    assert vectorize_row_function(transformation, sample_df()) is None
+
+    vectorized, row_by_row = map_both_ways(transformation)
+
+    assert vectorized.tolist() == row_by_row.tolist()
+    assert vectorized.tolist()[0] == transformation({"BIG": 2**40}, 0)
+
+
+def test_small_integers_do_not_overflow():
+    vectorized, _ = map_both_ways(VECTORIZED["product"])
+
+    assert vectorized.tolist() == [159201, 500, -21]
+
+
+def test_division_by_zero_raises_as_row_by_row():
+    df = pd.DataFrame({"A": [1, 2], "B": [1, 0]})
+
+    with pytest.raises(ZeroDivisionError):
+        map_fields(df, {"RATIO": lambda row, i: row["A"] / row["B"]})
+
+
+def test_lambda_cache_is_bounded():
+    df = pd.DataFrame({"A": [1]})
+    for offset in range(LAMBDA_CACHE_SIZE + 10):
+        # A new code object each time, as lambdas built by exec or generated jobs
+        namespace = {}
+        exec(f"f = lambda row, i: row['A'] + {offset}", namespace)
+        map_fields(df, {"B": namespace["f"]})
+
+    assert _find_lambda_node.cache_info().currsize <= LAMBDA_CACHE_SIZE
@@ -0,0 +1,32 @@
+import pstats
+import threading
+
+from utils.profiling import profiled
+from utils.scheduler import Block, run_blocks
+
+
+def test_profiled_jobs_run_their_blocks_in_the_main_thread(tmp_path):
+    threads = []
+
+    def first_block():
+        threads.append(threading.current_thread())
+
+    def second_block():
+        threads.append(threading.current_thread())
+
+    def main():
+        run_blocks([Block("FIRST", first_block), Block("SECOND", second_block)])
+
+    profiled(main, str(tmp_path / "job"), {"cpu"})()
+
+    assert threads == [threading.main_thread()] * 2
+    functions = {
+        name for _, _, name in pstats.Stats(str(tmp_path / "job.pstats")).stats
+    }
+    assert {"first_block", "second_block"} <= functions
+
+
+def test_blocks_run_concurrently_without_profiling():
+    started = threading.Barrier(2, timeout=5)
+
+    run_blocks([Block("FIRST", started.wait), Block("SECOND", started.wait)])
@@ -0,0 +1,279 @@
+import collections
+import json
+from types import SimpleNamespace
+
+import pandas as pd
+import pika
+import pytest
+
+from utils import rabbitmq_utils
+
+
+class FakeIOLoop:
+    """
+    Runs the callbacks scheduled by the fake connection in order, and the timers when nothing else is left.
+    """
+
+    def __init__(self):
+        self.callbacks = collections.deque()
+        self.timers = []
+        self.stopping = False
+        self.runs = 0
+
+    def call_later(self, delay, callback):
+        handle = [callback]
+        if delay:
+            self.timers.append(handle)
+        else:
+            self.callbacks.append(handle)
+        return handle
+
+    def remove_timeout(self, handle):
+        if handle in self.timers:
+            self.timers.remove(handle)
+
+    def stop(self):
+        self.stopping = True
+
+    def start(self):
+        self.runs += 1
+        while not self.stopping:
+            queue = self.callbacks or self.timers
+            assert queue, "The ioloop waits forever"
+            handle = queue.popleft() if queue is self.callbacks else queue.pop(0)
+            handle[0]()
+        self.stopping = False
+
+
+class FakeChannel:
+    """
+    A channel of FakeBroker: each published message is returned if the broker cannot route it,
+    then acknowledged (or refused) asynchronously.
+    """
+
+    def __init__(self, broker, connection):
+        self.broker = broker
+        self.connection = connection
+        self.delivery_tag = 0
+
+    def add_on_return_callback(self, callback):
+        self.on_return = callback
+
+    def add_on_close_callback(self, callback):
+        self.on_close = callback
+
+    def confirm_delivery(self, ack_nack_callback, callback):
+        self.on_confirmation = ack_nack_callback
+        self.connection.ioloop.call_later(0, lambda: callback(SimpleNamespace()))
+
+    def basic_publish(self, exchange, routing_key, body, properties, mandatory):
+        assert not self.connection.is_closed
+        self.delivery_tag += 1
+        tag = self.delivery_tag
+        ioloop = self.connection.ioloop
+        if mandatory and routing_key in self.broker.unroutable:
+            returned = pika.spec.Basic.Return(routing_key=routing_key)
+            ioloop.call_later(
+                0, lambda: self.on_return(self, returned, properties, body)
+            )
+        elif routing_key not in self.broker.refused:
+            self.broker.messages.append(
+                (exchange, routing_key, body, properties.delivery_mode)
+            )
+        if self.broker.silent:
+            return
+        if routing_key in self.broker.refused:
+            method = pika.spec.Basic.Nack(delivery_tag=tag)
+        else:
+            method = pika.spec.Basic.Ack(
+                delivery_tag=tag, multiple=self.broker.multiple
+            )
+        ioloop.call_later(
+            0, lambda: self.on_confirmation(SimpleNamespace(method=method))
+        )
+
+
+class FakeConnection:
+    def __init__(self, broker, parameters, on_open_callback, on_close_callback):
+        self.broker = broker
+        self.parameters = parameters
+        self.on_close_callback = on_close_callback
+        self.ioloop = FakeIOLoop()
+        self.is_closed = False
+        self.is_closing = False
+        self.channels = []
+        self.ioloop.call_later(0, lambda: on_open_callback(self))
+
+    def channel(self, on_open_callback):
+        self.channels.append(FakeChannel(self.broker, self))
+        channel = self.channels[-1]
+        self.ioloop.call_later(0, lambda: on_open_callback(channel))
+
+    def close(self):
+        self.is_closing = True
+        self.ioloop.call_later(
+            0, lambda: self.closed(pika.exceptions.ConnectionClosedByClient(200, ""))
+        )
+
+    def lose(self):
+        """
+        Drops the connection as a network failure would, with the confirmations not received yet.
+        """
+        self.ioloop.callbacks.clear()
+        self.ioloop.call_later(
+            0, lambda: self.closed(pika.exceptions.StreamLostError("lost"))
+        )
+
+    def closed(self, reason):
+        self.is_closed = True
+        self.is_closing = False
+        for channel in self.channels:
+            channel.on_close(channel, reason)
+        self.on_close_callback(self, reason)
+
+
+class FakeBroker:
+    """
+    Replaces pika.SelectConnection, recording the connections and the messages routed.
+    """
+
+    def __init__(self):
+        self.connections = []
+        self.messages = []
+        self.unroutable = set()
+        self.refused = set()
+        self.silent = False
+        self.multiple = False
+
+    def __call__(
+        self, parameters, on_open_callback, on_open_error_callback, on_close_callback
+    ):
+        self.connections.append(
+            FakeConnection(self, parameters, on_open_callback, on_close_callback)
+        )
+        return self.connections[-1]
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = FakeBroker()
+    monkeypatch.setattr(rabbitmq_utils.pika, "SelectConnection", broker)
+    monkeypatch.setenv("RABBITMQ_HOST", "broker")
+    monkeypatch.setenv("RABBITMQ_USER", "user")
+    monkeypatch.setenv("RABBITMQ_PASS", "password")
+    monkeypatch.setenv("RABBITMQ_EXCHANGE", "exchange")
+    monkeypatch.delenv("RABBITMQ_PROTOCOL", raising=False)
+    rabbitmq_utils.close_rabbitmq_publisher()
+    yield broker
+    rabbitmq_utils.close_rabbitmq_publisher()
+
+
+@pytest.mark.parametrize("multiple", [False, True])
+def test_messages_are_confirmed_by_batches_on_one_connection(broker, multiple):
+    broker.multiple = multiple
+    count = rabbitmq_utils.send_messages_to_rabbitmq(
+        ({"id": number} for number in range(1201)), routing_key="rows"
+    )
+    rabbitmq_utils.send_message_to_rabbitmq({"id": "last"})
+
+    publisher = rabbitmq_utils.get_rabbitmq_publisher()
+    assert count == 1201
+    assert publisher.published == 1202
+    assert len(broker.connections) == 1
+    assert [json.loads(body) for _, _, body, _ in broker.messages][-2:] == [
+        {"id": 1200},
+        {"id": "last"},
+    ]
+    assert {
+        (exchange, delivery_mode) for exchange, _, _, delivery_mode in broker.messages
+    } == {("exchange", 2)}
+    parameters = broker.connections[0].parameters
+    assert (parameters.host, parameters.port) == ("broker", 5672)
+
+
+def test_unroutable_messages_raise(broker):
+    broker.unroutable.add("nowhere")
+
+    with pytest.raises(RuntimeError, match="2 message\\(s\\) not routed"):
+        rabbitmq_utils.send_messages_to_rabbitmq([{"id": 1}, {"id": 2}], "nowhere")
+
+
+def test_refused_messages_raise(broker):
+    broker.refused.add("full")
+
+    with pytest.raises(RuntimeError, match="refused"):
+        rabbitmq_utils.send_messages_to_rabbitmq([{"id": 1}], "full")
+
+
+def test_unconfirmed_batch_times_out(broker):
+    broker.silent = True
+    publisher = rabbitmq_utils.RabbitMQPublisher(timeout=1)
+    publisher.publish("{}")
+
+    with pytest.raises(RuntimeError, match="did not confirm 1 message"):
+        publisher.flush()
+
+
+def test_connection_lost_with_unconfirmed_messages_raises(broker):
+    publisher = rabbitmq_utils.get_rabbitmq_publisher()
+    publisher.publish("{}")
+    broker.connections[0].lose()
+
+    with pytest.raises(RuntimeError, match="StreamLostError"):
+        publisher.flush()
+    publisher.publish("{}")
+    publisher.flush()
+
+    assert len(broker.connections) == 2
+
+
+def test_connection_lost_between_batches_reconnects(broker):
+    publisher = rabbitmq_utils.get_rabbitmq_publisher()
+    publisher.publish("{}")
+    publisher.flush()
+    broker.connections[0].lose()
+
+    publisher.publish("{}")
+    publisher.flush()
+
+    assert len(broker.connections) == 2
+    assert publisher.published == 2
+
+
+def test_close_publisher_confirms_pending_messages(broker):
+    rabbitmq_utils.get_rabbitmq_publisher().publish("{}")
+
+    rabbitmq_utils.close_rabbitmq_publisher()
+
+    assert len(broker.messages) == 1
+    assert broker.connections[0].is_closed
+
+
+def test_send_dataframe_routes_each_row(broker):
+    df = pd.DataFrame({"ID": [1, 2, 3], "QUEUE": ["a", "b", "c"]})
+
+    stats = rabbitmq_utils.send_dataframe_to_rabbitmq(
+        df, routing_key_column="QUEUE", chunk_size=2
+    )
+
+    assert stats["messages"] == 3
+    assert [
+        (routing_key, json.loads(body)) for _, routing_key, body, _ in broker.messages
+    ] == [
+        ("a", {"ID": 1, "QUEUE": "a"}),
+        ("b", {"ID": 2, "QUEUE": "b"}),
+        ("c", {"ID": 3, "QUEUE": "c"}),
+    ]
+
+
+def test_send_dataframe_keeps_line_separators_in_values(broker):
+    values = ["a\u2028b", "c\u2029d\x85e\x1cf\x1dg\x1eh", "line\nbreak"]
+    df = pd.DataFrame({"TEXT": values, "QUEUE": ["q1", "q2", "q3"]})
+
+    stats = rabbitmq_utils.send_dataframe_to_rabbitmq(df, routing_key_column="QUEUE")
+
+    assert stats["messages"] == 3
+    assert [
+        (routing_key, json.loads(body)["TEXT"])
+        for _, routing_key, body, _ in broker.messages
+    ] == list(zip(["q1", "q2", "q3"], values))
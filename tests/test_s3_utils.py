@@ -0,0 +1,159 @@
+import json
+import os
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from utils import s3_utils
+from utils.s3_utils import download_s3_folder, get_s3_client, upload_folder_to_s3
+
+BUCKET = "test-bucket"
+
+
+@pytest.fixture
+def bucket(tmp_path, monkeypatch):
+    """
+    Returns a client of a mocked S3 bucket, with the credentials set in the environment as in a generated job.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("AWS_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_SECRET_KEY", "testing")
+    monkeypatch.setenv("AWS_BUCKET", BUCKET)
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(s3_utils, "_S3_CLIENTS", {})
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def put_objects(client, objects):
+    for key, body in objects.items():
+        client.put_object(Bucket=BUCKET, Key=key, Body=body)
+
+
+def count_downloads(monkeypatch, failing=()):
+    """
+    Records the keys downloaded by the shared client, and fails the download of the keys in failing.
+    """
+    client = get_s3_client(2)
+    download_file = client.download_file
+    downloaded = []
+
+    def download(bucket, key, path, *args, **kwargs):
+        if key in failing:
+            raise OSError("connection reset")
+        downloaded.append(key)
+        return download_file(bucket, key, path, *args, **kwargs)
+
+    monkeypatch.setattr(client, "download_file", download)
+    return downloaded
+
+
+def test_download_s3_folder_keeps_the_folder_structure(bucket, tmp_path):
+    put_objects(
+        bucket,
+        {"in/a.csv": b"a", "in/sub/b.csv": b"bb", "in/sub/": b"", "other/c.csv": b"c"},
+    )
+
+    download_s3_folder(str(tmp_path / "IN"), "in", max_workers=2)
+
+    assert (tmp_path / "IN" / "a.csv").read_bytes() == b"a"
+    assert (tmp_path / "IN" / "sub" / "b.csv").read_bytes() == b"bb"
+    assert sorted(
+        os.path.relpath(os.path.join(root, name), tmp_path / "IN")
+        for root, _, files in os.walk(tmp_path / "IN")
+        for name in files
+    ) == ["a.csv", os.path.join("sub", "b.csv")]
+
+
+def test_download_s3_folder_skips_the_files_up_to_date(bucket, tmp_path, monkeypatch):
+    put_objects(bucket, {"in/a.csv": b"a", "in/b.csv": b"b"})
+    download_s3_folder(str(tmp_path / "IN"), "in", max_workers=2)
+    downloaded = count_downloads(monkeypatch)
+
+    download_s3_folder(str(tmp_path / "IN"), "in", max_workers=2)
+
+    assert downloaded == []
+
+
+def test_download_s3_folder_downloads_the_changed_objects(
+    bucket, tmp_path, monkeypatch
+):
+    put_objects(bucket, {"in/a.csv": b"a", "in/b.csv": b"b"})
+    download_s3_folder(str(tmp_path / "IN"), "in", max_workers=2)
+    # Same size, so only the ETag tells the object changed
+    put_objects(bucket, {"in/b.csv": b"c"})
+    downloaded = count_downloads(monkeypatch)
+
+    download_s3_folder(str(tmp_path / "IN"), "in", max_workers=2)
+
+    assert downloaded == ["in/b.csv"]
+    assert (tmp_path / "IN" / "b.csv").read_bytes() == b"c"
+
+
+def test_download_s3_folder_resumes_after_a_failed_key(bucket, tmp_path, monkeypatch):
+    put_objects(bucket, {f"in/{name}.csv": name.encode() for name in "abcd"})
+    failing = {"in/c.csv"}
+    downloaded = count_downloads(monkeypatch, failing)
+
+    with pytest.raises(RuntimeError, match="1 file"):
+        download_s3_folder(str(tmp_path / "IN"), "in", max_workers=2)
+
+    manifest_path = s3_utils._manifest_path(BUCKET, "in", str(tmp_path / "IN"))
+    with open(manifest_path, encoding="utf-8") as f:
+        assert sorted(json.load(f)) == ["in/a.csv", "in/b.csv", "in/d.csv"]
+    assert not (tmp_path / "IN" / "c.csv").exists()
+
+    failing.clear()
+    downloaded.clear()
+    download_s3_folder(str(tmp_path / "IN"), "in", max_workers=2)
+
+    assert downloaded == ["in/c.csv"]
+    assert (tmp_path / "IN" / "c.csv").read_bytes() == b"c"
+
+
+def test_upload_folder_to_s3_keeps_the_folder_structure(bucket, tmp_path):
+    folder = tmp_path / "OUT"
+    (folder / "sub").mkdir(parents=True)
+    (folder / "a.csv").write_bytes(b"a")
+    (folder / "sub" / "b.csv").write_bytes(b"bb")
+
+    upload_folder_to_s3(str(folder), "out", max_workers=2)
+
+    keys = [obj["Key"] for obj in bucket.list_objects_v2(Bucket=BUCKET)["Contents"]]
+    assert sorted(keys) == ["out/a.csv", "out/sub/b.csv"]
+    body = bucket.get_object(Bucket=BUCKET, Key="out/sub/b.csv")["Body"].read()
+    assert body == b"bb"
+
+
+def test_upload_folder_to_s3_reports_the_failed_files(bucket, tmp_path, monkeypatch):
+    folder = tmp_path / "OUT"
+    folder.mkdir()
+    for name in "abc":
+        (folder / f"{name}.csv").write_bytes(name.encode())
+    client = get_s3_client(2 * 4)
+    upload_file = client.upload_file
+
+    def upload(path, bucket_name, key, *args, **kwargs):
+        if key == "out/b.csv":
+            raise OSError("connection reset")
+        return upload_file(path, bucket_name, key, *args, **kwargs)
+
+    monkeypatch.setattr(client, "upload_file", upload)
+
+    with pytest.raises(RuntimeError, match="1 file"):
+        upload_folder_to_s3(str(folder), "out", max_workers=2)
+
+    keys = [obj["Key"] for obj in bucket.list_objects_v2(Bucket=BUCKET)["Contents"]]
+    assert sorted(keys) == ["out/a.csv", "out/c.csv"]
+
+
+def test_get_s3_client_is_reused(bucket, monkeypatch):
+    client = get_s3_client()
+
+    assert get_s3_client() is client
+    assert get_s3_client(4) is not client
+    monkeypatch.setenv("AWS_ACCESS_KEY", "other")
+    assert get_s3_client() is not client
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from pipeline_gui_builder.generator.script_generator import (
+    BLOCK_DEFINITIONS,
+    generate_script,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_generated_job(pipeline, folder, streaming):
+    """
+    Generates the job of a pipeline in folder, runs it on folder/IN and returns the exported file.
+    """
+    (folder / "OUT").mkdir()
+    (folder / ".env").write_text("IN=IN\nOUT=OUT\n")
+    generate_script(pipeline, str(folder), streaming=streaming)
+    result = subprocess.run(
+        [sys.executable, "run.py"],
+        cwd=folder,
+        env={**os.environ, "PYTHONPATH": ROOT},
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    return pd.read_excel(folder / "OUT" / "file.xlsx")
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_generated_jobs_map_empty_cells_to_blanks(tmp_path, streaming):
+    folder = tmp_path / "job"
+    (folder / "IN").mkdir(parents=True)
+    pd.DataFrame({"X": [1, None, 3], "T": ["a", None, "c"]}).to_excel(
+        folder / "IN" / "in.xlsx", index=False
+    )
+    mapping = "stream_map_fields" if streaming else "map_fields"
+    pipeline = [
+        {"type": "read_excel", "code": BLOCK_DEFINITIONS["read_excel"]["code"]},
+        {
+            # Not a block of the GUI, so its code is also used in streaming mode
+            "type": "custom_mapping",
+            "code": [
+                "    FIELD_MAPPING = {",
+                "        \"OUT\": lambda row, row_index: f\"{row['X']}|{row['T']}\",",
+                "    }",
+                f"    df = {mapping}(df, FIELD_MAPPING)",
+            ],
+        },
+        {"type": "write_excel", "code": BLOCK_DEFINITIONS["write_excel"]["code"]},
+    ]
+
+    df = run_generated_job(pipeline, folder, streaming)
+
+    assert df["OUT"].tolist() == ["1.0|a", " | ", "3.0|c"]
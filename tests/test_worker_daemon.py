@@ -0,0 +1,93 @@
+import json
+import threading
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pika
+
+from utils import worker_daemon
+
+
+class FakeChannel:
+    """
+    Delivers the given messages when consuming starts, and records the acknowledgements and replies.
+    """
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.calls = []
+        self.consumed = threading.Event()
+
+    def queue_declare(self, queue, durable):
+        pass
+
+    def basic_qos(self, prefetch_count):
+        pass
+
+    def basic_consume(self, queue, on_message_callback):
+        self.on_message = on_message_callback
+
+    def start_consuming(self):
+        for tag, body in enumerate(self.messages, start=1):
+            properties = pika.BasicProperties(reply_to="replies")
+            self.on_message(self, SimpleNamespace(delivery_tag=tag), properties, body)
+        self.consumed.set()
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.calls.append(("reply", json.loads(body)["status"]))
+
+    def basic_ack(self, delivery_tag):
+        self.calls.append(("ack", delivery_tag))
+
+    def basic_nack(self, delivery_tag, requeue):
+        self.calls.append(("nack", delivery_tag, requeue))
+
+    def basic_reject(self, delivery_tag, requeue):
+        self.calls.append(("reject", delivery_tag, requeue))
+
+
+class FakeConnection:
+    def __init__(self, channel):
+        self._channel = channel
+
+    def channel(self):
+        return self._channel
+
+    def add_callback_threadsafe(self, callback):
+        callback()
+
+
+class FakeDaemon:
+    """
+    Returns the given result for each job, as if it had run or been cancelled by stop.
+    """
+
+    worker_count = 1
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+
+    def submit(self, job, arguments):
+        future = Future()
+        future.set_result({"job": job, "status": self.statuses[job]})
+        return future
+
+
+def test_cancelled_jobs_are_requeued(monkeypatch):
+    monkeypatch.setenv("RABBITMQ_HOST", "localhost")
+    channel = FakeChannel([b'{"job": "ran"}', b'{"job": "queued"}', b"{}"])
+    monkeypatch.setattr(
+        pika, "BlockingConnection", lambda parameters: FakeConnection(channel)
+    )
+
+    worker_daemon.consume_rabbitmq_queue(
+        FakeDaemon({"ran": "ok", "queued": "cancelled"}), "jobs"
+    )
+    assert channel.consumed.wait(timeout=5)
+
+    assert channel.calls == [
+        ("reply", "ok"),
+        ("ack", 1),
+        ("nack", 2, True),
+        ("reject", 3, False),
+    ]
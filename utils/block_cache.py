@@ -0,0 +1,338 @@
+import glob
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+import types
+
+import pandas as pd
+
+# Checkpoints copy the outputs of every block to disk, they are only read and written with JOB_CACHE=1
+# (or the --cache flag). The --no-cache flag disables them whatever the environment
+CACHE_ENV_VARIABLE = "JOB_CACHE"
+CACHE_FLAG = "--cache"
+NO_CACHE_FLAG = "--no-cache"
+BLOCK_CACHE_DIR = os.path.join("cache", "blocks")
+BLOCK_CACHE_MAX_SIZE = 2 * 1024**3
+BLOCK_CACHE_MANIFEST = "manifest.json"
+# Checkpoints of blocks downloading from a remote service are only reused for this number of seconds,
+# as the remote files can change without the job knowing it
+BLOCK_CACHE_REMOTE_MAX_AGE = 3600
+
+# DataFrames are written in Parquet when pyarrow is installed (poetry install -E parquet), other values (and DataFrames Parquet cannot hold) are pickled
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+REMOTE_SERVICES = ("s3", "gdrive", "rabbitmq")
+
+
+def cache_enabled():
+    """
+    Returns:
+    - bool: True when the --cache flag is given or the JOB_CACHE environment variable is 1,
+      unless the --no-cache flag is given.
+    """
+    arguments = sys.argv[1:]
+    if NO_CACHE_FLAG in arguments:
+        return False
+    return CACHE_FLAG in arguments or os.getenv(CACHE_ENV_VARIABLE) == "1"
+
+
+def _library_hash():
+    """
+    Returns the hash of the source of the utils modules, so the checkpoints are not reused after an update.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(__file__), "*.py"))):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _code_constants(code):
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            yield from _code_constants(constant)
+        else:
+            yield constant
+
+
+def _function_source(function):
+    """
+    Returns the source of a block function and of the functions of its module it calls,
+    with the environment variables it reads (written as strings in its code).
+    """
+    try:
+        parts = [inspect.getsource(function)]
+    except (OSError, TypeError):
+        parts = [repr(function.__code__.co_code)]
+    module_globals = getattr(function, "__globals__", {})
+    for name in sorted(function.__code__.co_names):
+        value = module_globals.get(name)
+        if (
+            inspect.isfunction(value)
+            and value.__module__ == function.__module__
+            and value is not function
+        ):
+            try:
+                parts.append(inspect.getsource(value))
+            except (OSError, TypeError):
+                pass
+    environment = {
+        constant: os.environ[constant]
+        for constant in _code_constants(function.__code__)
+        if isinstance(constant, str) and constant in os.environ
+    }
+    parts.append(json.dumps(environment, sort_keys=True))
+    return "\n".join(parts)
+
+
+def _folder_files(folder):
+    """
+    Returns the size and modification time of each file of a folder and its subfolders.
+    """
+    files = {}
+    if not folder:
+        return files
+    for root, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns]
+    return files
+
+
+def _write_value(value, path):
+    """
+    Writes an output of a block, returning the name of the written file.
+    """
+    if isinstance(value, pd.DataFrame) and PARQUET_AVAILABLE:
+        try:
+            value.to_parquet(f"{path}.parquet", engine="pyarrow")
+            return f"{os.path.basename(path)}.parquet"
+        except Exception:
+            # Mixed types in a column, non-string column names...
+            if os.path.exists(f"{path}.parquet"):
+                os.remove(f"{path}.parquet")
+    with open(f"{path}.pkl", "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return f"{os.path.basename(path)}.pkl"
+
+
+def _read_value(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, engine="pyarrow")
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+class Checkpoint:
+    """
+    An output of a block restored from the cache, read only when a block running after it needs it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        return _read_value(self.path)
+
+
+class BlockCache:
+    """
+    Checkpoints of the outputs of the blocks of jobs, stored in cache/blocks (or the JOB_CACHE_DIR
+    environment variable), one folder per checkpoint.
+
+    The key of a checkpoint is the hash of the code of the block (with the functions of the job it calls
+    and the environment variables it reads), the keys of the blocks producing its inputs, the paths of
+    its folders, the content of the folders it reads, and the source of the utils modules.
+    The least recently used checkpoints are deleted when the cache exceeds BLOCK_CACHE_MAX_SIZE bytes
+    (or the JOB_CACHE_MAX_SIZE environment variable).
+    """
+
+    def __init__(self, cache_dir=None, max_size=None):
+        self.cache_dir = cache_dir or os.getenv("JOB_CACHE_DIR", BLOCK_CACHE_DIR)
+        self.max_size = int(
+            max_size or os.getenv("JOB_CACHE_MAX_SIZE", BLOCK_CACHE_MAX_SIZE)
+        )
+        self.library_hash = _library_hash()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def cacheable(block):
+        """
+        Returns whether the effects of a block can be checked, so the block can be skipped:
+        it only reads folders and remote services, and adds files to folders.
+        Blocks deleting files, sending or uploading data are always run.
+        """
+        for name, access in block.resources.items():
+            if access == "write" or (access == "add" and name in REMOTE_SERVICES):
+                return False
+        return True
+
+    def key(self, block, input_keys, folders):
+        """
+        Computes the key of the checkpoint of a block.
+
+        Arguments:
+        - block (Block): The block.
+        - input_keys (dict): The key of the block producing each input of the block.
+        - folders (dict): The paths of the folder variables of the job.
+
+        Returns:
+        - str: The hexadecimal key.
+        """
+        used_folders = {
+            name: os.path.abspath(path) if path else None
+            for name, path in folders.items()
+            if name in block.resources
+        }
+        read_folders = {
+            name: sorted(_folder_files(folders[name]).items())
+            for name, access in block.resources.items()
+            if access == "read" and name in folders
+        }
+        description = {
+            "block": block.name,
+            "source": _function_source(block.function),
+            "inputs": input_keys,
+            "folders": used_folders,
+            "read_folders": read_folders,
+            "library": self.library_hash,
+        }
+        encoded = json.dumps(description, sort_keys=True, default=str).encode()
+        return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+    def snapshot(self, block, folders):
+        """
+        Returns the files of the folders a block adds files to, before it runs.
+        """
+        files = {}
+        for name, access in block.resources.items():
+            if access == "add" and name in folders:
+                files.update(_folder_files(folders[name]))
+        return files
+
+    def lookup(self, key, block):
+        """
+        Returns the outputs of a block from its checkpoint, None if there is no valid checkpoint:
+        the files added by the block must still be there, unchanged.
+
+        Arguments:
+        - key (str): The key of the checkpoint.
+        - block (Block): The block.
+
+        Returns:
+        - dict | None: A Checkpoint for each output of the block.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        manifest_path = os.path.join(entry_dir, BLOCK_CACHE_MANIFEST)
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        remote_read = any(
+            name in REMOTE_SERVICES and access == "read"
+            for name, access in block.resources.items()
+        )
+        max_age = float(
+            os.getenv("JOB_CACHE_REMOTE_MAX_AGE", BLOCK_CACHE_REMOTE_MAX_AGE)
+        )
+        if remote_read and time.time() - manifest["created"] > max_age:
+            return None
+        for path, (size, mtime) in manifest["files"].items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            if stat.st_size != size or stat.st_mtime_ns != mtime:
+                return None
+        outputs = {
+            name: os.path.join(entry_dir, file_name)
+            for name, file_name in manifest["outputs"].items()
+        }
+        if set(outputs) != set(block.outputs) or not all(
+            os.path.exists(path) for path in outputs.values()
+        ):
+            return None
+
+        # Refresh the modification time, used as last access time by the eviction
+        os.utime(manifest_path)
+        return {name: Checkpoint(path) for name, path in outputs.items()}
+
+    def store(self, key, block, outputs, files_before, folders):
+        """
+        Writes the checkpoint of a block which just ran, then deletes the least recently used checkpoints
+        if the cache is too large. Outputs which cannot be written (chunk generators of streaming jobs,
+        connections...) leave the block without checkpoint.
+
+        Arguments:
+        - key (str): The key of the checkpoint.
+        - block (Block): The block.
+        - outputs (dict): The outputs of the block.
+        - files_before (dict): The files of the folders the block adds files to, before it ran.
+        - folders (dict): The paths of the folder variables of the job.
+        """
+        if any(isinstance(value, types.GeneratorType) for value in outputs.values()):
+            return
+        files = {
+            path: stat
+            for path, stat in self.snapshot(block, folders).items()
+            if files_before.get(path) != stat
+        }
+        entry_dir = os.path.join(self.cache_dir, key)
+        # Written to a temporary folder first, as several jobs can use the same cache
+        temporary_dir = f"{entry_dir}.{os.getpid()}.tmp"
+        shutil.rmtree(temporary_dir, ignore_errors=True)
+        os.makedirs(temporary_dir)
+        try:
+            written = {
+                name: _write_value(outputs.get(name), os.path.join(temporary_dir, name))
+                for name in block.outputs
+            }
+            manifest = {
+                "block": block.name,
+                "created": time.time(),
+                "outputs": written,
+                "files": files,
+            }
+            with open(
+                os.path.join(temporary_dir, BLOCK_CACHE_MANIFEST), "w", encoding="utf-8"
+            ) as f:
+                json.dump(manifest, f)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(temporary_dir, entry_dir)
+        except Exception as e:
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+            print(f"No checkpoint for block {block.name}: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used checkpoints until the cache fits in max_size bytes.
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            manifest_path = os.path.join(entry.path, BLOCK_CACHE_MANIFEST)
+            if not entry.is_dir() or not os.path.exists(manifest_path):
+                continue
+            size = sum(
+                file.stat().st_size for file in os.scandir(entry.path) if file.is_file()
+            )
+            entries.append((os.stat(manifest_path).st_mtime, size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
@@ -0,0 +1,220 @@
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# JOB_METRICS=1 records time, CPU, peak RSS and row counts of each block,
+# JOB_METRICS=tracemalloc also records the peak of the Python allocations (slower)
+METRICS_ENV_VARIABLE = "JOB_METRICS"
+
+_RECORDS = []
+# Blocks being measured, in all the threads of the job
+_ACTIVE = set()
+_ACTIVE_LOCK = threading.Lock()
+
+
+class _NoMetrics:
+    """Context manager used when the metrics are disabled, so blocks run with no overhead."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_METRICS = _NoMetrics()
+
+
+def metrics_mode():
+    """
+    Returns:
+    - str: "" when the metrics are disabled, "1" or "tracemalloc" otherwise.
+    """
+    mode = os.getenv(METRICS_ENV_VARIABLE, "0")
+    return "" if mode in ("", "0") else mode
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def _row_count(frame):
+    """
+    Returns the number of rows of the df variable of the job, None if it is not a DataFrame
+    (streaming blocks pass generators of chunks, which cannot be counted without consuming them).
+    """
+    value = frame.f_locals.get("df")
+    if hasattr(value, "shape"):
+        return int(value.shape[0])
+    return None
+
+
+class BlockMetrics:
+    """
+    Records the wall time, CPU time, peak memory and row counts of a block of a job.
+
+    The CPU time is the one of the thread running the block. The memory is measured for the whole process:
+    the peak RSS growth and the traced peak are only recorded for blocks which ran alone,
+    as the allocations of the blocks running at the same time in other threads cannot be told apart.
+    """
+
+    def __init__(self, name, trace_allocations):
+        self.name = name
+        self.trace_allocations = trace_allocations
+        self.concurrent = False
+
+    def __enter__(self):
+        self.frame = sys._getframe(1)
+        self.rows_in = _row_count(self.frame)
+        self.peak_rss_before = _peak_rss_mb()
+        with _ACTIVE_LOCK:
+            if _ACTIVE:
+                self.concurrent = True
+                for block in _ACTIVE:
+                    block.concurrent = True
+            _ACTIVE.add(self)
+            if self.trace_allocations:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                # The peak is global, resetting it would lose the peak of the running blocks
+                if not self.concurrent:
+                    tracemalloc.reset_peak()
+                self.traced_before = tracemalloc.get_traced_memory()[0]
+        self.cpu_start = time.thread_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record = {
+            "block": self.name,
+            "wall_time_s": round(time.perf_counter() - self.start, 4),
+            "cpu_time_s": round(time.thread_time() - self.cpu_start, 4),
+            "rows_in": self.rows_in,
+            "rows_out": _row_count(self.frame),
+            "peak_rss_mb": None,
+            "peak_rss_growth_mb": None,
+            "concurrent": None,
+            "status": "failed" if exc_type else "ok",
+        }
+        with _ACTIVE_LOCK:
+            _ACTIVE.discard(self)
+            record["concurrent"] = self.concurrent
+        peak_rss = _peak_rss_mb()
+        if peak_rss is not None:
+            record["peak_rss_mb"] = round(peak_rss, 1)
+            if not self.concurrent:
+                record["peak_rss_growth_mb"] = round(peak_rss - self.peak_rss_before, 1)
+        if self.trace_allocations:
+            record["traced_peak_mb"] = None
+            if not self.concurrent:
+                peak = tracemalloc.get_traced_memory()[1]
+                record["traced_peak_mb"] = round(
+                    (peak - self.traced_before) / 1024**2, 1
+                )
+        self.frame = None
+        _RECORDS.append(record)
+        return False
+
+
+def measure_block(name: str):
+    """
+    Returns the context manager wrapping a block of a generated job.
+    It records the block metrics when the JOB_METRICS environment variable is set, and does nothing otherwise.
+
+    Arguments:
+    - name (str): The name of the block, as written in the job.
+
+    Returns:
+    - A context manager.
+    """
+    mode = metrics_mode()
+    if not mode:
+        return _NO_METRICS
+    return BlockMetrics(name, trace_allocations=mode == "tracemalloc")
+
+
+def get_metrics():
+    """
+    Returns:
+    - list: The metrics recorded for each block since the last reset.
+    """
+    return list(_RECORDS)
+
+
+def reset_metrics():
+    _RECORDS.clear()
+
+
+def add_metrics(records: list):
+    """
+    Adds metrics recorded in another process, such as a block run by a worker process.
+
+    Arguments:
+    - records (list): The metrics of the blocks, as returned by get_metrics.
+    """
+    _RECORDS.extend(records)
+
+
+def print_metrics_summary():
+    """
+    Prints a table with the metrics of each block of the job.
+    """
+    if not _RECORDS:
+        return
+    columns = [
+        ("block", "Block"),
+        ("wall_time_s", "Wall (s)"),
+        ("cpu_time_s", "CPU (s)"),
+        ("rows_in", "Rows in"),
+        ("rows_out", "Rows out"),
+        ("peak_rss_mb", "Process peak RSS (MB)"),
+        ("peak_rss_growth_mb", "RSS growth (MB)"),
+    ]
+    if any("traced_peak_mb" in record for record in _RECORDS):
+        columns.append(("traced_peak_mb", "Traced peak (MB)"))
+    columns += [("concurrent", "Concurrent"), ("status", "Status")]
+
+    rows = [
+        ["" if record.get(key) is None else str(record.get(key)) for key, _ in columns]
+        for record in _RECORDS
+    ]
+    widths = [
+        max(len(title), *(len(row[index]) for row in rows))
+        for index, (_, title) in enumerate(columns)
+    ]
+    lines = [
+        "  ".join(title.ljust(width) for (_, title), width in zip(columns, widths)),
+        "  ".join("-" * width for width in widths),
+    ]
+    lines += [
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows
+    ]
+    if any(record.get("concurrent") for record in _RECORDS):
+        lines.append(
+            "The memory growth of the blocks which ran at the same time as others is not recorded"
+        )
+    print("Block metrics:\n" + "\n".join(lines))
+
+
+def write_metrics(path: str):
+    """
+    Writes the metrics of each block of the job to a JSON file.
+
+    Arguments:
+    - path (str): The path of the JSON file.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"blocks": _RECORDS}, f, indent=2)
+    print(f"Block metrics written to {path}")
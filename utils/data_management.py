@@ -1,89 +1,815 @@
+import importlib.util
+
 import numpy as np
 import pandas as pd
 
+from utils.mapping_vectorizer import (
+    reads_row_keys_only,
+    row_values,
+    vectorize_row_function,
+)
+
+FILTER_OPERATORS = {
+    "==": lambda series, value: series == value,
+    "!=": lambda series, value: series != value,
+    ">": lambda series, value: series > value,
+    ">=": lambda series, value: series >= value,
+    "<": lambda series, value: series < value,
+    "<=": lambda series, value: series <= value,
+    "in": lambda series, value: series.isin(value),
+    "not in": lambda series, value: ~series.isin(value),
+    "between": lambda series, value: series.between(value[0], value[1]),
+    "contains": lambda series, value: series.astype(str).str.contains(
+        value, regex=False
+    ),
+}
+
+# Operators comparing the order of values, unordered categories are compared as their values
+ORDERING_OPERATORS = (">", ">=", "<", "<=", "between")
+
+FILTER_PREDICATES = {
+    "notna": lambda series: series.notna(),
+    "isna": lambda series: series.isna(),
+    "empty": lambda series: series == "",
+    "not_empty": lambda series: series != "",
+}
+
+
+def _filter_spec_mask(series: pd.Series, spec) -> np.ndarray:
+    """
+    Compiles a single declarative filter spec into a NumPy boolean mask.
+
+    Arguments:
+    - series (pd.Series): The column the spec applies to.
+    - spec (str | tuple | list): A predicate name ("notna"), an (operator, value) tuple (">", 500000)
+                                 or a list of those, all of which must be met.
+
+    Returns:
+    - np.ndarray: A boolean array with one entry per row of the series.
+    """
+    if isinstance(spec, list):
+        mask = np.ones(len(series), dtype=bool)
+        for sub_spec in spec:
+            mask &= _filter_spec_mask(series, sub_spec)
+        return mask
+
+    if isinstance(spec, str):
+        if spec not in FILTER_PREDICATES:
+            raise ValueError(f"Unknown filter predicate: {spec}")
+        result = FILTER_PREDICATES[spec](series)
+    else:
+        operator, value = spec
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(f"Unknown filter operator: {operator}")
+        if (
+            operator in ORDERING_OPERATORS
+            and isinstance(series.dtype, pd.CategoricalDtype)
+            and not series.cat.ordered
+        ):
+            series = series.astype(series.cat.categories.dtype)
+        result = FILTER_OPERATORS[operator](series, value)
+
+    return result.to_numpy(dtype=bool, na_value=False)
+
 
 def filter_rows(df: pd.DataFrame, filters: dict) -> pd.DataFrame:
     """
     Filters the input DataFrame based on a dictionary of column-specific conditions.
 
+    Declarative conditions are compiled into one combined boolean mask and applied in a single slice.
+    Functions are applied afterwards, value by value, on the remaining rows.
+
     Arguments:
     - df (pd.DataFrame): The input DataFrame to filter.
-    - filters (dict): A dictionary where each key is a column name and each value is a function (usually a lambda)
-                      that returns True or False. Only rows for which all conditions are met are retained.
+    - filters (dict): A dictionary where each key is a column name and each value is either:
+                      - a declarative condition: an (operator, value) tuple such as (">", 500000) or ("in", ["A", "B"]),
+                        a predicate name such as "notna", or a list of those (see FILTER_OPERATORS and FILTER_PREDICATES).
+                      - a function (usually a lambda) that returns True or False.
+                      Only rows for which all conditions are met are retained.
 
     Returns:
     - pd.DataFrame: The filtered DataFrame with only rows that satisfy all conditions.
     """
+    callable_filters = {}
+    mask = None
     for column, condition in filters.items():
+        if callable(condition):
+            callable_filters[column] = condition
+            continue
+        column_mask = _filter_spec_mask(df[column], condition)
+        mask = column_mask if mask is None else mask & column_mask
+
+    if mask is not None:
+        df = df[mask]
+
+    for column, condition in callable_filters.items():
         df = df[df[column].apply(condition)]
     return df
 
 
+AGGREGATION_REDUCERS = ("sum", "count", "min", "max", "mean")
+
+
+def _group_codes(df: pd.DataFrame, group_columns: list) -> tuple:
+    """
+    Factorizes the group columns once into a single integer code per row.
+    Codes follow the sorted order of the group keys, rows with a missing key get -1 (as dropped by groupby).
+
+    Arguments:
+    - df (pd.DataFrame): The input DataFrame.
+    - group_columns (list[str]): The columns to group by.
+
+    Returns:
+    - tuple: (np.ndarray of codes, number of groups)
+    """
+    codes = np.zeros(len(df), dtype=np.int64)
+    missing = np.zeros(len(df), dtype=bool)
+    for column in group_columns:
+        column_codes, uniques = pd.factorize(df[column], sort=True)
+        missing |= column_codes < 0
+        # Mixed radix keeps the lexicographic order of the keys, factorizing again keeps the codes compact
+        codes = codes * len(uniques) + column_codes
+        codes[missing] = -1
+        codes, _ = pd.factorize(codes, sort=True)
+        if missing.any():
+            # -1 is the smallest value and received code 0
+            codes -= 1
+    ngroups = int(codes.max()) + 1 if len(codes) else 0
+    return codes, ngroups
+
+
+def _first_positions(codes: np.ndarray, positions: np.ndarray, ngroups: int):
+    """
+    Returns the position of the first row of each group.
+
+    Arguments:
+    - codes (np.ndarray): The group code of each row (without -1).
+    - positions (np.ndarray): The row position of each code.
+    - ngroups (int): The number of groups.
+
+    Returns:
+    - np.ndarray: One row position per group.
+    """
+    first = np.full(ngroups, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first, codes, positions)
+    return first
+
+
+def _reduce(values: pd.Series, codes: np.ndarray, ngroups: int, reducer: str):
+    """
+    Reduces a column per group in a single pass.
+    Integer columns and float count/min/max use NumPy accumulators, float sum and mean use the
+    compensated summation of pandas so results stay identical to groupby, other dtypes use groupby.
+
+    Arguments:
+    - values (pd.Series): The values of the rows that belong to a group.
+    - codes (np.ndarray): The group code of each of these rows.
+    - ngroups (int): The number of groups.
+    - reducer (str): One of AGGREGATION_REDUCERS.
+
+    Returns:
+    - np.ndarray or pd.api.extensions.ExtensionArray: One value per group.
+    """
+    if reducer not in AGGREGATION_REDUCERS:
+        raise ValueError(f"Unknown aggregation reducer: {reducer}")
+
+    dtype = values.dtype
+    if reducer == "count":
+        return np.bincount(codes[values.notna().to_numpy()], minlength=ngroups)
+
+    # Nullable extension dtypes (Int64, Float64...) go through groupby
+    numpy_dtype = isinstance(dtype, np.dtype)
+    if numpy_dtype and dtype.kind == "i" and reducer in ("sum", "min", "max"):
+        array = values.to_numpy()
+        if reducer == "sum":
+            result = np.zeros(ngroups, dtype=np.int64)
+            np.add.at(result, codes, array)
+        elif reducer == "min":
+            result = np.full(ngroups, np.iinfo(np.int64).max, dtype=np.int64)
+            np.minimum.at(result, codes, array)
+        else:
+            result = np.full(ngroups, np.iinfo(np.int64).min, dtype=np.int64)
+            np.maximum.at(result, codes, array)
+        return result
+
+    if numpy_dtype and dtype.kind == "f" and reducer in ("min", "max"):
+        array = values.to_numpy()
+        if reducer == "min":
+            result = np.full(ngroups, np.inf, dtype=dtype)
+            np.fmin.at(result, codes, array)
+        else:
+            result = np.full(ngroups, -np.inf, dtype=dtype)
+            np.fmax.at(result, codes, array)
+        result[np.bincount(codes[~np.isnan(array)], minlength=ngroups) == 0] = np.nan
+        return result
+
+    grouped = values.groupby(codes, sort=True).agg(reducer)
+    return grouped.reindex(range(ngroups)).array
+
+
 def aggregate_input(
-    df: pd.DataFrame, GROUP_COLUMNS: dict, AMOUNT_COLUMN: dict
+    df: pd.DataFrame,
+    GROUP_COLUMNS: list,
+    AMOUNT_COLUMN: str,
+    AGGREGATIONS: dict = None,
 ) -> pd.DataFrame:
     """
     Aggregates a DataFrame by grouping on specified columns and summing a designated amount column.
 
+    The group keys are factorized once, the amount columns are reduced with NumPy accumulators
+    and the other columns are taken from the first row of each group in a single take.
+
     Arguments:
     - df (pd.DataFrame): The input DataFrame to group and aggregate.
     - GROUP_COLUMNS (list[str]): List of column names to group the DataFrame by.
-    - AMOUNT_COLUMN (str): The name of the column containing numeric values to be summed for each group.
+    - AMOUNT_COLUMN (str | list[str]): The name of the column (or columns) containing numeric values to be summed for each group.
+    - AGGREGATIONS (dict, optional): Additional output columns computed in the same pass, as {"OUTPUT_COLUMN": ("COLUMN", "reducer")}
+                                     where reducer is one of "sum", "count", "min", "max", "mean".
+                                     Example: {"NB_LINES": ("AMOUNT", "count"), "MAX_AMOUNT": ("AMOUNT", "max")}
 
     Returns:
     - pd.DataFrame: A new DataFrame grouped by GROUP_COLUMNS where all non-aggregated columns keep their first value,
-                    and the amount column is summed.
+                    and the amount columns are summed.
     """
-    # Create an aggregation dictionary: "first" for all columns except the amount column
-    agg_dict = {col: "first" for col in df.columns if col != AMOUNT_COLUMN}
-    agg_dict[AMOUNT_COLUMN] = "sum"
+    group_columns = (
+        [GROUP_COLUMNS] if isinstance(GROUP_COLUMNS, str) else list(GROUP_COLUMNS)
+    )
+    amount_columns = (
+        [AMOUNT_COLUMN] if isinstance(AMOUNT_COLUMN, str) else list(AMOUNT_COLUMN)
+    )
+    aggregations = {column: (column, "sum") for column in amount_columns}
+    aggregations.update(AGGREGATIONS or {})
+
+    codes, ngroups = _group_codes(df, group_columns)
+    positions = np.flatnonzero(codes >= 0)
+    all_rows = len(positions) == len(df)
+    codes = codes[positions]
+    first = _first_positions(codes, positions, ngroups)
+
+    # Every other column keeps its first value, as groupby "first" does
+    passthrough_columns = [
+        column for column in df.columns if column not in amount_columns
+    ]
+    grouped_df = df.take(first)[passthrough_columns].reset_index(drop=True)
+    for column in passthrough_columns:
+        values = df[column]
+        if not values.hasnans:
+            continue
+        # "first" skips missing values: take the first non-missing row of each group instead
+        valid = values.notna().to_numpy()[positions]
+        first_valid = _first_positions(codes[valid], positions[valid], ngroups)
+        first_valid = np.where(
+            first_valid == np.iinfo(np.int64).max, first, first_valid
+        )
+        # The array keeps extension dtypes (category, Int64, string...)
+        grouped_df[column] = values.array.take(first_valid)
 
-    # Group by the specified columns and apply the aggregation
-    grouped_df = df.groupby(GROUP_COLUMNS, as_index=False).agg(agg_dict)
+    for output_column, (column, reducer) in aggregations.items():
+        values = df[column] if all_rows else df[column].iloc[positions]
+        grouped_df[output_column] = _reduce(values, codes, ngroups, reducer)
     return grouped_df
 
 
-def fill_empty_fields(df: pd.DataFrame, column_name: str) -> pd.DataFrame:
+FILL_STRATEGIES = ("ffill", "bfill", "constant")
+
+
+def _empty_mask(series: pd.Series) -> np.ndarray:
+    """
+    Returns the rows of a column holding a missing value or an empty string.
+    """
+    if series.dtype == object:
+        values = series.to_numpy()
+        return pd.isna(values) | (values == "")
+    empty = series.isna().to_numpy()
+    if isinstance(series.dtype, (pd.StringDtype, pd.CategoricalDtype)):
+        empty |= series.eq("").fillna(False).to_numpy(dtype=bool)
+    return empty
+
+
+def _fill_sources(empty: np.ndarray, order: np.ndarray, starts: np.ndarray):
     """
-    Fills "" values in a DataFrame with a specified fill value.
+    Computes, for each row, the position of the row its value is taken from when filling forward along an order.
+
+    Arguments:
+    - empty (np.ndarray): The rows to fill.
+    - order (np.ndarray): The row positions in fill order, the rows of a group being contiguous.
+    - starts (np.ndarray): For each position of the order, the position where its group starts (past the end for rows not filled).
+
+    Returns:
+    - np.ndarray: The source row of each row, -1 when there is no value to fill it with.
+    """
+    steps = np.arange(len(order))
+    ordered_empty = empty[order]
+    last_valid = np.maximum.accumulate(np.where(ordered_empty, -1, steps))
+    # A value is only carried within the group it comes from, non-empty rows keep their value
+    last_valid[ordered_empty & (last_valid < starts)] = -1
+    sources = np.full(len(order), -1, dtype=np.int64)
+    sources[order] = np.where(last_valid >= 0, order[last_valid], -1)
+    return sources
+
+
+def fill_empty_fields(
+    df: pd.DataFrame,
+    column_name,
+    group_by=None,
+    strategy: str = "ffill",
+    fill_value=None,
+) -> pd.DataFrame:
+    """
+    Fills "" and missing values of one or several columns.
+
+    With ffill (the default) an empty cell takes the value of the last non-empty cell above it,
+    with bfill the value of the next non-empty cell below it, and with constant the fill_value.
+    With group_by, values are only carried between rows of the same group (same invoice, same account...),
+    even when the rows of a group are not contiguous; rows with a missing group key are not filled.
+    The rows are sorted once by group for all the columns, and each column is written once.
+    Empty cells that cannot be filled (before the first value of their group) become NaN.
 
     Arguments:
     - df (pd.DataFrame): The input DataFrame with potential "" values.
-    - fill_value (str): The value to replace "" values with.
+    - column_name (str | list[str]): The column (or columns) to fill.
+    - group_by (str | list[str], optional): The columns identifying the groups.
+    - strategy (str): "ffill", "bfill" or "constant".
+    - fill_value: The value of empty cells with the constant strategy.
+
+    Returns:
+    - pd.DataFrame: The DataFrame with the columns filled.
+    """
+    if strategy not in FILL_STRATEGIES:
+        raise ValueError(
+            f"Unknown fill strategy {strategy}, expected one of {FILL_STRATEGIES}"
+        )
+    columns = [column_name] if isinstance(column_name, str) else list(column_name)
+
+    if strategy == "constant":
+        for column in columns:
+            series = df[column]
+            empty = _empty_mask(series)
+            if not empty.any():
+                continue
+            if (
+                isinstance(series.dtype, pd.CategoricalDtype)
+                and not pd.isna(fill_value)
+                and fill_value not in series.cat.categories
+            ):
+                series = series.cat.add_categories([fill_value])
+            df[column] = series.mask(empty, fill_value)
+        return df
+
+    if group_by is None:
+        codes = np.zeros(len(df), dtype=np.int64)
+        order = np.arange(len(df))
+    else:
+        group_columns = [group_by] if isinstance(group_by, str) else list(group_by)
+        codes, _ = _group_codes(df, group_columns)
+        order = np.argsort(codes, kind="stable")
+    if strategy == "bfill":
+        order = order[::-1]
+    ordered_codes = codes[order]
+    new_group = np.ones(len(df), dtype=bool)
+    new_group[1:] = ordered_codes[1:] != ordered_codes[:-1]
+    starts = np.maximum.accumulate(np.where(new_group, np.arange(len(df)), 0))
+    # Rows without group key are never filled
+    starts[ordered_codes < 0] = len(df)
+
+    for column in columns:
+        series = df[column]
+        empty = _empty_mask(series)
+        if not empty.any():
+            continue
+        sources = _fill_sources(empty, order, starts)
+        filled = pd.Series(
+            pd.api.extensions.take(
+                (
+                    series.array
+                    if isinstance(series.dtype, pd.api.extensions.ExtensionDtype)
+                    else series.to_numpy()
+                ),
+                sources,
+                allow_fill=True,
+            ),
+            index=df.index,
+            copy=False,
+        )
+        if series.dtype == object:
+            # Same dtypes as replace("", np.nan): a text column holding only numbers or nothing becomes numeric
+            filled = filled.infer_objects()
+        df[column] = filled
+    return df
+
+
+# Text columns with at most this ratio of distinct values are converted to category by compact_dtypes,
+# 0 disables it: assigning a value outside the categories of a column raises an error
+COMPACT_CATEGORY_RATIO = 0
+# Other text columns use Arrow-backed strings when pyarrow is installed
+ARROW_STRINGS_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+# Blank strings used as missing values, as written by fillna(" ")
+BLANK_VALUES = ("", " ")
+
+INTEGER_DTYPES = ("int8", "int16", "int32", "int64")
+
+
+def _integer_dtype(minimum, maximum, nullable):
+    """
+    Returns the smallest integer dtype holding a range of values, None if it does not fit in 64 bits.
+    """
+    for name in INTEGER_DTYPES:
+        info = np.iinfo(name)
+        if info.min <= minimum and maximum <= info.max:
+            return name.capitalize() if nullable else name
+    return None
+
+
+def _compact_numbers(series: pd.Series, downcast_integers: bool) -> pd.Series:
+    """
+    Numbers are kept as they are, so they are written the same way (1.0 stays 1.0), unless downcast_integers is set:
+    integers then use the smallest integer dtype, and floats holding only whole numbers (integers with missing values)
+    too, with a nullable integer dtype when values are missing. Other floats are kept in float64, float32 would round amounts.
+    """
+    if not downcast_integers or series.empty:
+        return series
+    if series.dtype.kind in "iu":
+        dtype = _integer_dtype(series.min(), series.max(), nullable=False)
+        return series if dtype in (None, series.dtype) else series.astype(dtype)
+
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    present = ~np.isnan(values)
+    if not present.any():
+        return series
+    valid = values[present]
+    # Above 2**53 floats are not exact integers any more
+    if not np.array_equal(valid, np.trunc(valid)) or np.abs(valid).max() > 2**53:
+        return series if series.dtype == np.float64 else series.astype(np.float64)
+    return series.astype(
+        _integer_dtype(valid.min(), valid.max(), nullable=not present.all())
+    )
+
+
+def _compact_series(
+    series: pd.Series,
+    category_ratio: float,
+    downcast_integers: bool,
+    blanks_as_missing: bool,
+) -> pd.Series:
+    """
+    Returns a column with the most compact dtype that keeps its values, or the column itself.
+    """
+    dtype = series.dtype
+    if dtype.kind in "iuf" and isinstance(dtype, np.dtype):
+        return _compact_numbers(series, downcast_integers)
+    if dtype != object:
+        # Datetimes, booleans, categories and extension dtypes are kept
+        return series
+
+    candidates = series
+    if blanks_as_missing:
+        blank = series.isin(BLANK_VALUES).to_numpy()
+        if blank.any():
+            candidates = series.mask(blank)
+    inferred = pd.api.types.infer_dtype(candidates, skipna=True)
+    if inferred in ("integer", "floating", "mixed-integer-float", "decimal"):
+        return _compact_numbers(pd.to_numeric(candidates), downcast_integers)
+    if inferred == "boolean":
+        return candidates.astype("boolean")
+    if inferred in ("datetime", "datetime64"):
+        return pd.to_datetime(candidates)
+    if inferred != "string":
+        # Empty or mixed columns are kept as is
+        return series
+
+    # Blank strings of text columns are values, they are kept
+    distinct = series.nunique(dropna=True)
+    if category_ratio > 0 and distinct <= category_ratio * len(series):
+        return series.astype("category")
+    if ARROW_STRINGS_AVAILABLE:
+        return series.astype(pd.StringDtype("pyarrow"))
+    return series
+
+
+def compact_dtypes(
+    df: pd.DataFrame,
+    category_ratio: float = COMPACT_CATEGORY_RATIO,
+    downcast_integers: bool = False,
+    blanks_as_missing: bool = False,
+    verbose: bool = True,
+) -> pd.DataFrame:
+    """
+    Converts the columns of a DataFrame to compact dtypes, to reduce its memory and speed up the next blocks.
+
+    - Numbers keep their dtype. With downcast_integers, integers and floats holding whole numbers use the smallest
+      integer dtype, but arithmetic on small integer types silently overflows (int16 * int16...).
+    - Columns of Python numbers, booleans or dates are converted to them.
+      Blank strings ("" and " ", as written by fillna(" ")) are the missing values of the jobs: a column holding them
+      is kept as is, so the next blocks still read " ". With blanks_as_missing, they become missing values
+      of a nullable dtype (pd.NA, written "<NA>" in f-strings) and the column is converted.
+    - With category_ratio, text columns with few distinct values (status, currency...) become categories,
+      the other ones Arrow-backed strings when pyarrow is installed.
+      New values must then be added to the categories before being assigned (series.cat.add_categories).
+    - Datetimes stay datetime64, floats stay float64 so amounts are not rounded.
+
+    Arguments:
+    - df (pd.DataFrame): The input DataFrame.
+    - category_ratio (float): The maximum ratio of distinct values of a text column converted to category (0.05...).
+                              Defaults to 0, no column is converted.
+    - downcast_integers (bool): If True, integers are downcast to the smallest integer dtype holding their values.
+    - blanks_as_missing (bool): If True, blank strings become missing values so their column can be converted.
+    - verbose (bool): If True, prints the memory before and after and the converted columns.
 
     Returns:
-    - pd.DataFrame: The DataFrame with "" values replaced by the specified fill value.
+    - pd.DataFrame: The DataFrame with compact dtypes.
     """
-    df[column_name] = df[column_name].replace("", np.nan)
-    df[column_name] = df[column_name].ffill()
+    before = df.memory_usage(deep=True).sum()
+    converted = []
+    for position in range(df.shape[1]):
+        series = df.iloc[:, position]
+        compacted = _compact_series(
+            series, category_ratio, downcast_integers, blanks_as_missing
+        )
+        if compacted is not series:
+            df.isetitem(position, compacted)
+            converted.append(
+                f"{df.columns[position]}: {series.dtype} -> {compacted.dtype}"
+            )
+
+    if verbose:
+        after = df.memory_usage(deep=True).sum()
+        print(
+            f"Memory: {before / 1024**2:.2f} MB -> {after / 1024**2:.2f} MB, "
+            f"{len(converted)} column(s) converted: {converted}"
+        )
     return df
 
 
-def map_fields(df: pd.DataFrame, FIELD_MAPPING: dict) -> pd.DataFrame:
+def column_expression(transformation):
+    """
+    Marks a FIELD_MAPPING function as a whole-column expression for map_fields.
+
+    The function receives the input DataFrame and its index instead of a single row and its index,
+    and must return a Series, an array or a scalar.
+    Example: column_expression(lambda cols, idx: cols["PRICE"] * cols["QUANTITY"])
+
+    Arguments:
+    - transformation (callable): A function taking (cols, idx).
+
+    Returns:
+    - callable: The same function, flagged to be evaluated once for all rows.
+    """
+    transformation.column_expression = True
+    return transformation
+
+
+def _column_values(result, length: int):
+    """
+    Converts the result of a column expression into values that can be placed in the output DataFrame.
+
+    Arguments:
+    - result: A Series, Index, array or scalar returned by a column expression.
+    - length (int): The number of rows of the output DataFrame.
+
+    Returns:
+    - np.ndarray or pd.api.extensions.ExtensionArray: The positional values of the new column.
+    """
+    if isinstance(result, (pd.Series, pd.Index)):
+        return result.array
+    if np.ndim(result) == 0:
+        return np.full(
+            length, result, dtype=object if isinstance(result, str) else None
+        )
+    return result
+
+
+def map_fields(
+    df: pd.DataFrame, FIELD_MAPPING: dict, vectorize: bool = True, verbose: bool = False
+) -> pd.DataFrame:
     """
     Maps fields in a DataFrame based on a provided mapping dictionary.
 
+    The output DataFrame is built column by column. Column expressions are evaluated once for all rows.
+    Row lambdas with a simple shape (column access, arithmetic, str(), f-strings, strftime, row_index + k)
+    are rewritten as column operations (see utils.mapping_vectorizer), the others are called once per row.
+    Lambdas only reading row["COLUMN"] receive a dictionary of the row values, other functions
+    receive the row as a Series, as with iterrows.
+
     Arguments:
     - df (pd.DataFrame): The input DataFrame to map.
-    - FIELD_MAPPING (dict): A dictionary where each key is the name of the new column and each value is a function
-                            (usually a lambda) that takes a row and returns the value for that new column.
+    - FIELD_MAPPING (dict): A dictionary where each key is the name of the new column and each value is either:
+                            - a function (usually a lambda) that takes a row and its index and returns the value for that new column.
+                            - a function wrapped with column_expression that takes the DataFrame and its index and returns the whole column.
+                            - a string expression evaluated with DataFrame.eval, such as "PRICE * QUANTITY".
+    - vectorize (bool): Whether simple row lambdas are rewritten as column operations. Defaults to True.
+    - verbose (bool): Whether the vectorized and row by row fields are printed. Defaults to False.
 
     Returns:
     - pd.DataFrame: A new DataFrame with the mapped fields.
     """
+    length = len(df)
+    output_columns = {}
+    row_mapping = {}
+    vectorized_fields = []
 
-    class OutputRow:
-        def __init__(self, input_row: pd.Series, row_index: int, FIELD_MAPPING: dict):
-            self.data = {}
+    for field_name, transformation in FIELD_MAPPING.items():
+        if isinstance(transformation, str):
+            output_columns[field_name] = _column_values(df.eval(transformation), length)
+        elif getattr(transformation, "column_expression", False):
+            output_columns[field_name] = _column_values(
+                transformation(df, df.index), length
+            )
+        else:
+            # Simple row lambdas are rewritten as column operations when possible
+            result = vectorize_row_function(transformation, df) if vectorize else None
+            if result is None:
+                row_mapping[field_name] = transformation
+                output_columns[field_name] = []
+            else:
+                output_columns[field_name] = _column_values(result, length)
+                vectorized_fields.append(field_name)
 
-            for field_name, transformation in FIELD_MAPPING.items():
-                self.data[field_name] = transformation(input_row, row_index)
+    if verbose and (vectorized_fields or row_mapping):
+        print(
+            f"Mapping: vectorized fields: {vectorized_fields}, "
+            f"row by row fields: {list(row_mapping)}"
+        )
 
-        def to_dict(self):
-            return self.data
+    key_mapping = {
+        field_name: transformation
+        for field_name, transformation in row_mapping.items()
+        if reads_row_keys_only(transformation)
+    }
+    series_mapping = {
+        field_name: transformation
+        for field_name, transformation in row_mapping.items()
+        if field_name not in key_mapping
+    }
+    if key_mapping:
+        columns = list(df.columns)
+        # Same values as itertuples, with compacted columns read back as plain Python values
+        arrays = [row_values(df.iloc[:, position]) for position in range(df.shape[1])]
+        for row_index, values in zip(df.index, zip(*arrays)):
+            row = dict(zip(columns, values))
+            for field_name, transformation in key_mapping.items():
+                output_columns[field_name].append(transformation(row, row_index))
+    if series_mapping:
+        # Row attributes and Series methods (row.A, row.isna()...) need a real Series
+        for row_index, row in df.iterrows():
+            for field_name, transformation in series_mapping.items():
+                output_columns[field_name].append(transformation(row, row_index))
 
-    output_rows = []
-    for row_index, row in df.iterrows():
-        output_rows.append(OutputRow(row, row_index, FIELD_MAPPING).to_dict())
-    df_out = pd.DataFrame(output_rows)
+    df_out = pd.DataFrame(output_columns)
     return df_out
+
+
+def stream_filter_rows(chunks, filters: dict):
+    """
+    Applies filter_rows to each chunk of a streamed DataFrame.
+
+    Arguments:
+    - chunks (iterable of pd.DataFrame): The input chunks.
+    - filters (dict): The filters, as in filter_rows.
+
+    Yields:
+    - pd.DataFrame: The filtered chunks.
+    """
+    for chunk in chunks:
+        yield filter_rows(chunk, filters)
+
+
+def stream_map_fields(chunks, FIELD_MAPPING: dict):
+    """
+    Applies map_fields to each chunk of a streamed DataFrame.
+    The output index continues from one chunk to the next, as if the whole DataFrame had been mapped at once.
+
+    Arguments:
+    - chunks (iterable of pd.DataFrame): The input chunks.
+    - FIELD_MAPPING (dict): The field mapping, as in map_fields.
+
+    Yields:
+    - pd.DataFrame: The mapped chunks.
+    """
+    offset = 0
+    for chunk in chunks:
+        mapped = map_fields(chunk, FIELD_MAPPING)
+        mapped.index = pd.RangeIndex(offset, offset + len(mapped))
+        offset += len(mapped)
+        yield mapped
+
+
+def stream_fill_empty_fields(
+    chunks,
+    column_name,
+    group_by=None,
+    strategy: str = "ffill",
+    fill_value=None,
+):
+    """
+    Applies fill_empty_fields to each chunk of a streamed DataFrame.
+    The last non-empty values of a chunk (of each group with group_by) are carried over
+    to fill the first empty rows of the next one.
+
+    Arguments:
+    - chunks (iterable of pd.DataFrame): The input chunks.
+    - column_name (str | list[str]): The column (or columns) to fill.
+    - group_by (str | list[str], optional): The columns identifying the groups.
+    - strategy (str): "ffill" or "constant". bfill needs the next chunks and cannot be streamed.
+    - fill_value: The value of empty cells with the constant strategy.
+
+    Yields:
+    - pd.DataFrame: The filled chunks.
+    """
+    if strategy == "bfill":
+        raise ValueError(
+            "bfill needs the rows below and cannot be streamed, use fill_empty_fields"
+        )
+    columns = [column_name] if isinstance(column_name, str) else list(column_name)
+    group_columns = (
+        []
+        if group_by is None
+        else [group_by] if isinstance(group_by, str) else group_by
+    )
+    carry = None
+    for chunk in chunks:
+        if strategy == "constant":
+            yield fill_empty_fields(
+                chunk, columns, strategy=strategy, fill_value=fill_value
+            )
+            continue
+        # The carried rows are filled with the chunk, as if they were its first rows
+        carried = 0 if carry is None else len(carry)
+        if carried:
+            chunk = pd.concat([carry, chunk])
+        chunk = fill_empty_fields(chunk, columns, group_by=group_by)
+        if group_columns:
+            # After a forward fill, the last row of each group holds its last values
+            carry = chunk[~chunk.duplicated(subset=group_columns, keep="last")]
+        else:
+            carry = chunk.tail(1)
+        yield chunk.iloc[carried:]
+
+
+def stream_aggregate_input(
+    chunks,
+    GROUP_COLUMNS: list,
+    AMOUNT_COLUMN: str,
+    AGGREGATIONS: dict = None,
+):
+    """
+    Aggregates a streamed DataFrame chunk by chunk.
+    Each chunk is aggregated into a partial result which is merged with the previous ones,
+    so memory is bounded by the number of groups instead of the number of rows.
+
+    Arguments:
+    - chunks (iterable of pd.DataFrame): The input chunks.
+    - GROUP_COLUMNS (list[str]): List of column names to group the DataFrame by.
+    - AMOUNT_COLUMN (str | list[str]): The column (or columns) to sum, as in aggregate_input.
+    - AGGREGATIONS (dict, optional): Additional aggregations, as in aggregate_input.
+
+    Yields:
+    - pd.DataFrame: The aggregated DataFrame, as a single chunk.
+    """
+    amount_columns = (
+        [AMOUNT_COLUMN] if isinstance(AMOUNT_COLUMN, str) else list(AMOUNT_COLUMN)
+    )
+    # Partial results are merged with a reducer that combines them: counts are summed,
+    # means are rebuilt from partial sums and counts
+    partial_aggregations = {}
+    merge_aggregations = {}
+    for output_column, (column, reducer) in (AGGREGATIONS or {}).items():
+        if reducer == "mean":
+            for partial_reducer in ("sum", "count"):
+                partial_column = f"{output_column}__{partial_reducer}"
+                partial_aggregations[partial_column] = (column, partial_reducer)
+                merge_aggregations[partial_column] = (partial_column, "sum")
+        else:
+            partial_aggregations[output_column] = (column, reducer)
+            merge_aggregations[output_column] = (
+                output_column,
+                "sum" if reducer == "count" else reducer,
+            )
+    partial_columns = list(partial_aggregations)
+
+    merged = None
+    for chunk in chunks:
+        partial = aggregate_input(
+            chunk, GROUP_COLUMNS, amount_columns, partial_aggregations
+        )
+        if merged is not None:
+            partial = aggregate_input(
+                pd.concat([merged, partial], ignore_index=True),
+                GROUP_COLUMNS,
+                amount_columns + partial_columns,
+                merge_aggregations,
+            )
+        merged = partial
+
+    if merged is None:
+        return
+    for output_column, (column, reducer) in (AGGREGATIONS or {}).items():
+        if reducer == "mean":
+            merged[output_column] = merged.pop(f"{output_column}__sum") / merged.pop(
+                f"{output_column}__count"
+            )
+    output_columns = list(AGGREGATIONS or {})
+    merged = merged[
+        [column for column in merged.columns if column not in output_columns]
+        + output_columns
+    ]
+    yield merged
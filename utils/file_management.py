@@ -1,29 +1,215 @@
 import os
-import glob
+import hashlib
+import importlib.util
+import json
+import multiprocessing
 import re
 import shutil
+import tempfile
+import threading
+import time
 import zipfile
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import pandas as pd
 from dotenv import load_dotenv
+from openpyxl import Workbook, load_workbook
+from utils.logs_management import log_item
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# Directories modified less than this number of seconds before the index was built are scanned again,
+# as a change in the same timestamp tick as the scan would not change their modification time
+DIRECTORY_INDEX_RACY_SECONDS = 2
+
+_DIRECTORY_INDEXES = {}
+_DIRECTORY_INDEXES_LOCK = threading.Lock()
+
+# Files of a folder at the time of a scan, with the matches of the patterns already looked up
+_DirectorySnapshot = namedtuple(
+    "_DirectorySnapshot",
+    ["scanned_at", "directory_mtimes", "paths", "by_name", "by_extension", "matches"],
+)
+
+
+class DirectoryIndex:
+    """
+    Snapshot of the files of a folder and its subfolders, built once with os.scandir,
+    so that many lookups do not walk the folder again.
+    As with glob, names starting with "." are skipped, and symbolic links to directories are not followed.
+    The snapshot is stale as soon as the modification time of one of its directories changes,
+    which happens when a file is added, removed or renamed in it.
+
+    Arguments:
+    - folder (str): The folder to index.
+    - recursive (bool): False to only index the files at the root of the folder.
+    """
+
+    def __init__(self, folder, recursive=True):
+        self.folder = folder
+        self.recursive = recursive
+        self.refresh()
+
+    def refresh(self):
+        """
+        Scans the folder and its subfolders again.
+        The new snapshot is built apart and replaces the previous one at the end of the scan.
+        """
+        scanned_at = time.time()
+        directory_mtimes = {}
+        paths = []
+        by_name = {}
+        by_extension = {}
+        directories = [self.folder]
+        while directories:
+            directory = directories.pop()
+            try:
+                directory_mtimes[directory] = os.stat(directory).st_mtime_ns
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if self.recursive:
+                        directories.append(entry.path)
+                elif entry.is_file():
+                    paths.append(entry.path)
+                    by_name.setdefault(entry.name, []).append(entry.path)
+                    extension = os.path.splitext(entry.name)[1].lower()
+                    by_extension.setdefault(extension, []).append(entry.path)
+        paths.sort()
+        for found in (*by_name.values(), *by_extension.values()):
+            found.sort()
+        self._snapshot = _DirectorySnapshot(
+            scanned_at, directory_mtimes, paths, by_name, by_extension, {}
+        )
+
+    @property
+    def scanned_at(self):
+        return self._snapshot.scanned_at
+
+    @property
+    def directory_mtimes(self):
+        return self._snapshot.directory_mtimes
+
+    @property
+    def paths(self):
+        return self._snapshot.paths
+
+    @property
+    def by_name(self):
+        return self._snapshot.by_name
+
+    @property
+    def by_extension(self):
+        return self._snapshot.by_extension
+
+    def is_stale(self):
+        """
+        Returns:
+        - bool: True if a directory of the snapshot was modified or removed since the scan, or may have been modified during it.
+        """
+        snapshot = self._snapshot
+        racy_limit = (snapshot.scanned_at - DIRECTORY_INDEX_RACY_SECONDS) * 1e9
+        for directory, mtime in snapshot.directory_mtimes.items():
+            try:
+                current_mtime = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                return True
+            if current_mtime != mtime or current_mtime >= racy_limit:
+                return True
+        return False
+
+    def find(self, patterns):
+        """
+        Returns the files whose name matches one of the regex patterns (case insensitive).
+
+        Arguments:
+        - patterns (str | list[str]): The regex pattern (or patterns) to match file names.
+
+        Returns:
+        - list[str]: The full paths of the matching files, sorted.
+        """
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        key = tuple(patterns)
+        snapshot = self._snapshot
+        if key not in snapshot.matches:
+            names = set()
+            for pattern in patterns:
+                names.update(
+                    filter(re.compile(pattern, re.IGNORECASE).match, snapshot.by_name)
+                )
+            snapshot.matches[key] = sorted(
+                path for name in names for path in snapshot.by_name[name]
+            )
+        return list(snapshot.matches[key])
+
+    def with_extension(self, extension, recursive=True):
+        """
+        Returns the files with an extension (case insensitive).
+
+        Arguments:
+        - extension (str): The extension, with its dot (".xlsx").
+        - recursive (bool): False to only return the files at the root of the folder.
+
+        Returns:
+        - list[str]: The full paths of the files, sorted.
+        """
+        paths = self.by_extension.get(extension.lower(), [])
+        if not recursive and self.recursive:
+            root = os.path.normpath(self.folder)
+            paths = [
+                path
+                for path in paths
+                if os.path.normpath(os.path.dirname(path)) == root
+            ]
+        return list(paths)
+
+
+def get_directory_index(folder, recursive=True):
+    """
+    Returns the index of a folder, built on the first call and built again when the folder changed.
+
+    Arguments:
+    - folder (str): The folder to index.
+    - recursive (bool): False to only index the files at the root of the folder.
+
+    Returns:
+    - DirectoryIndex: The up to date index of the folder.
+    """
+    key = (os.path.abspath(folder), recursive)
+    with _DIRECTORY_INDEXES_LOCK:
+        index = _DIRECTORY_INDEXES.get(key)
+    if index is not None and index.folder == folder and not index.is_stale():
+        return index
+    # Callers still using the previous index keep a consistent snapshot of the folder
+    index = DirectoryIndex(folder, recursive)
+    with _DIRECTORY_INDEXES_LOCK:
+        _DIRECTORY_INDEXES[key] = index
+    return index
 
 
 def find_file(pattern, folder):
     """
-    Searches for a file matching a given regex pattern in the specified folder.
+    Searches for a file matching a given regex pattern in the specified folder and its subfolders.
 
     Arguments:
     - pattern (str): The regex pattern to match file names.
     - folder (str): The folder to search in.
 
     Returns:
-    - str or None: The name of the file if exactly one match is found, or None otherwise.
+    - str or None: The full path of the file if exactly one match is found, or None otherwise.
     """
-    regex = re.compile(pattern, re.IGNORECASE)
-    filesFound = []
-
-    for root, _, files in os.walk(folder):
-        for filename in files:
-            if regex.match(filename):
-                filesFound.append(filename)
+    filesFound = get_directory_index(folder).find(pattern)
 
     if len(filesFound) > 1:
         print(f"More than one file found matching pattern: {pattern}")
@@ -45,10 +231,495 @@ def get_excel_file(folder):
     Returns:
     - str or None: The path to the first Excel file found, or None if no Excel file is present.
     """
-    files = glob.glob(os.path.join(folder, "*.xlsx"))
+    files = get_directory_index(folder, recursive=False).with_extension(".xlsx")
     return files[0] if files else None
 
 
+def _excel_column_names(header_row):
+    """
+    Builds DataFrame column names from an Excel header row, the way pd.read_excel does.
+    Empty headers become "Unnamed: <position>" and duplicates are suffixed with ".1", ".2", etc.
+
+    Arguments:
+    - header_row (tuple): The values of the header row.
+
+    Returns:
+    - list[str]: The column names.
+    """
+    columns = []
+    counts = {}
+    for position, value in enumerate(header_row):
+        name = f"Unnamed: {position}" if value is None else value
+        if name in counts:
+            counts[name] += 1
+            name = f"{name}.{counts[name]}"
+        else:
+            counts[name] = 0
+        columns.append(name)
+    return columns
+
+
+def _excel_astype(chunk, dtype):
+    """
+    Applies the dtype option to a chunk read with openpyxl, the way pd.read_excel does:
+    text conversions keep empty cells missing (NaN, not "nan") and write whole numbers without decimals ("1", not "1.0").
+
+    Arguments:
+    - chunk (pd.DataFrame): The chunk, with the types inferred from the cell values.
+    - dtype (type | str | dict): The type of all the columns, or the types by column.
+
+    Returns:
+    - pd.DataFrame: The chunk with the requested types.
+    """
+    dtypes = dtype if isinstance(dtype, dict) else dict.fromkeys(chunk.columns, dtype)
+    for column, column_dtype in dtypes.items():
+        series = chunk[column]
+        if not pd.api.types.is_string_dtype(pd.api.types.pandas_dtype(column_dtype)):
+            chunk[column] = series.astype(column_dtype)
+            continue
+        present = series.notna()
+        # Built as objects, as a float column would turn the integers back into floats
+        values = pd.Series(
+            [
+                int(value) if isinstance(value, float) and value.is_integer() else value
+                for value in series[present]
+            ],
+            index=series.index[present],
+            dtype=object,
+        ).astype(column_dtype)
+        converted = pd.Series(np.nan, index=chunk.index, dtype=object)
+        converted[present] = values
+        chunk[column] = (
+            converted if values.dtype == object else converted.astype(values.dtype)
+        )
+    return chunk
+
+
+def read_excel_chunks(file_path, chunk_size=50000, header=0, sheet_name=0, dtype=None):
+    """
+    Reads an Excel file in batches of rows, without loading the whole sheet in memory.
+
+    Arguments:
+    - file_path (str): The path to the Excel file.
+    - chunk_size (int | None): The maximum number of rows per DataFrame. Defaults to 50000, None reads the whole sheet at once.
+    - header (int): The row holding the column names (0 is the first row, 1 is the second row, etc.).
+    - sheet_name (int | str): The position or the name of the sheet to read. Defaults to the first sheet.
+    - dtype (dict, optional): Column types to apply to each chunk, as in pd.read_excel.
+
+    Yields:
+    - pd.DataFrame: The successive chunks. Their index continues from one chunk to the next,
+                    so row indexes are the same as with pd.read_excel.
+    """
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        if isinstance(sheet_name, int):
+            worksheet = workbook.worksheets[sheet_name]
+        else:
+            worksheet = workbook[sheet_name]
+        rows = worksheet.iter_rows(values_only=True)
+        for _ in range(header):
+            next(rows, None)
+        columns = _excel_column_names(next(rows, ()))
+
+        def to_frame(buffer, offset):
+            chunk = pd.DataFrame.from_records(
+                [row[: len(columns)] for row in buffer], columns=columns
+            )
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            # Empty cells are NaN in text columns too, as with pd.read_excel
+            text_columns = chunk.columns[chunk.dtypes == object]
+            chunk[text_columns] = chunk[text_columns].mask(chunk[text_columns].isna())
+            return _excel_astype(chunk, dtype) if dtype else chunk
+
+        buffer = []
+        empty_rows = []
+        offset = 0
+        for row in rows:
+            # Empty rows are only kept when data follows them, trailing ones are dropped like pd.read_excel does
+            if all(value is None for value in row):
+                empty_rows.append(row)
+                continue
+            buffer.extend(empty_rows)
+            empty_rows = []
+            buffer.append(row)
+            if chunk_size and len(buffer) >= chunk_size:
+                yield to_frame(buffer[:chunk_size], offset)
+                offset += chunk_size
+                buffer = buffer[chunk_size:]
+        if buffer or offset == 0:
+            yield to_frame(buffer, offset)
+    finally:
+        workbook.close()
+
+
+# The calamine engine (python-calamine package) parses xlsx files much faster than openpyxl, it is used when installed
+CALAMINE_AVAILABLE = importlib.util.find_spec("python_calamine") is not None
+
+EXCEL_CACHE_DIR = os.path.join("cache", "excel")
+EXCEL_CACHE_INDEX = "index.json"
+EXCEL_CACHE_MAX_SIZE = 1024**3
+
+
+def _file_hash(file_path):
+    """
+    Computes the hash of the content of a file, reading it in blocks.
+
+    Arguments:
+    - file_path (str): The path to the file.
+
+    Returns:
+    - str: The hexadecimal BLAKE2 digest of the file content.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _evict_excel_cache(cache_dir, max_size):
+    """
+    Deletes the least recently used cached workbooks until the cache fits in max_size bytes.
+
+    Arguments:
+    - cache_dir (str): The cache folder.
+    - max_size (int): The maximum total size of the cached files, in bytes.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and entry.name.endswith(".pkl"):
+            # Another block of the job can evict the same entries at the same time
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+def _replace_file(path, write):
+    """
+    Writes a file through a temporary file of the same folder, renamed to path once complete,
+    so the threads and processes reading or writing the same cache never see a partial file.
+
+    Arguments:
+    - path (str): The path of the file.
+    - write (callable): Writes the content to the path it receives.
+    """
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path) or ".", suffix=".tmp", delete=False
+    ) as f:
+        temporary_path = f.name
+    try:
+        write(temporary_path)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+def _write_json(index, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+
+
+def parse_excel_file(file_path, header=0, dtype=None, sheet_name=0):
+    """
+    Parses an Excel sheet into a DataFrame with the fastest available engine.
+    The calamine engine is used when the python-calamine package is installed,
+    otherwise the sheet is streamed in read-only mode with openpyxl.
+
+    Arguments:
+    - file_path (str): The path to the Excel file.
+    - header (int): The row holding the column names (0 is the first row, 1 is the second row, etc.).
+    - dtype (dict, optional): Column types, as in pd.read_excel.
+    - sheet_name (int | str): The position or the name of the sheet to read. Defaults to the first sheet.
+
+    Returns:
+    - pd.DataFrame: The content of the sheet.
+    """
+    if CALAMINE_AVAILABLE:
+        return pd.read_excel(
+            file_path,
+            header=header,
+            dtype=dtype,
+            sheet_name=sheet_name,
+            engine="calamine",
+        )
+    return next(
+        read_excel_chunks(
+            file_path,
+            chunk_size=None,
+            header=header,
+            sheet_name=sheet_name,
+            dtype=dtype,
+        )
+    )
+
+
+def read_excel_file(file_path, header=0, dtype=None, sheet_name=0, use_cache=True):
+    """
+    Reads an Excel sheet into a DataFrame, using a local cache of the already parsed workbooks.
+
+    The cache is stored in cache/excel (or the EXCEL_CACHE_DIR environment variable) as pickled DataFrames.
+    Entries are keyed by the file path, size and modification time, plus the hash of the file content,
+    so a second read of an unchanged workbook does not parse it again.
+    The least recently used entries are deleted when the cache exceeds EXCEL_CACHE_MAX_SIZE bytes
+    (or the EXCEL_CACHE_MAX_SIZE environment variable).
+
+    Arguments:
+    - file_path (str): The path to the Excel file.
+    - header (int): The row holding the column names (0 is the first row, 1 is the second row, etc.).
+    - dtype (dict, optional): Column types, as in pd.read_excel.
+    - sheet_name (int | str): The position or the name of the sheet to read. Defaults to the first sheet.
+    - use_cache (bool): Set to False (or set the EXCEL_CACHE environment variable to 0) to bypass the cache.
+
+    Returns:
+    - pd.DataFrame: The content of the sheet.
+    """
+    if not use_cache or os.getenv("EXCEL_CACHE") == "0":
+        return parse_excel_file(file_path, header, dtype, sheet_name)
+
+    cache_dir = os.getenv("EXCEL_CACHE_DIR", EXCEL_CACHE_DIR)
+    max_size = int(os.getenv("EXCEL_CACHE_MAX_SIZE", EXCEL_CACHE_MAX_SIZE))
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, EXCEL_CACHE_INDEX)
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+
+    # The content hash is only computed again when the size or the modification time changed
+    absolute_path = os.path.abspath(file_path)
+    stat = os.stat(absolute_path)
+    entry = index.get(absolute_path)
+    if not entry or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime_ns:
+        entry = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "hash": _file_hash(absolute_path),
+        }
+        index[absolute_path] = entry
+        _replace_file(index_path, lambda path: _write_json(index, path))
+
+    options = repr((header, sheet_name, dtype))
+    options_hash = hashlib.blake2b(options.encode(), digest_size=8).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{entry['hash']}-{options_hash}.pkl")
+
+    if os.path.exists(cache_path):
+        try:
+            df = pd.read_pickle(cache_path)
+            # Refresh the modification time, used as last access time by the eviction
+            os.utime(cache_path)
+            print(f"Excel file loaded from cache: {file_path}")
+            return df
+        except Exception as e:
+            print(f"Unreadable cache entry {cache_path}, parsing the file again: {e}")
+
+    df = parse_excel_file(file_path, header, dtype, sheet_name)
+    _replace_file(cache_path, df.to_pickle)
+    _evict_excel_cache(cache_dir, max_size)
+    return df
+
+
+def find_files(patterns, folder):
+    """
+    Searches for all the files matching one of the given regex patterns in the specified folder and its subfolders.
+
+    Arguments:
+    - patterns (str | list[str]): The regex pattern (or patterns) to match file names.
+    - folder (str): The folder to search in.
+
+    Returns:
+    - list[str]: The full paths of the matching files, sorted.
+    """
+    return get_directory_index(folder).find(patterns)
+
+
+def _available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _process_pool(max_workers):
+    """
+    Returns a process pool whose workers do not inherit the threads of the job (log writer, scheduler...),
+    which do not exist in a forked process: forkserver where available, spawn otherwise.
+    """
+    method = (
+        "forkserver"
+        if "forkserver" in multiprocessing.get_all_start_methods()
+        else "spawn"
+    )
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context(method)
+    )
+
+
+def _read_excel_worker(file_path, header, dtype):
+    """
+    Reads one Excel file in a worker process. Errors are returned instead of raised,
+    so that one unreadable file does not stop the others.
+
+    Returns:
+    - tuple: (pd.DataFrame or None, error message or None)
+    """
+    try:
+        return read_excel_file(file_path, header=header, dtype=dtype), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def read_excel_folder(
+    folder,
+    patterns=r".*\.xlsx$",
+    header=0,
+    dtype=None,
+    source_column="SOURCE_FILE",
+    max_workers=None,
+):
+    """
+    Reads all the Excel files of a folder (and its subfolders) in parallel and concatenates them.
+
+    Files are parsed in a process pool sized to the available cores and concatenated in the sorted order of their paths,
+    with a column holding the name of the file each row comes from.
+    A file that cannot be read is reported and skipped, the other files are still read.
+
+    Arguments:
+    - folder (str): The folder to search in.
+    - patterns (str | list[str]): The regex pattern (or patterns) to match file names. Defaults to all .xlsx files.
+    - header (int): The row holding the column names (0 is the first row, 1 is the second row, etc.).
+    - dtype (dict, optional): Column types, as in pd.read_excel.
+    - source_column (str): The name of the column holding the source file name.
+    - max_workers (int, optional): The number of processes. Defaults to the number of available cores.
+
+    Returns:
+    - pd.DataFrame: The rows of all the files read.
+    """
+    file_paths = find_files(patterns, folder)
+    if not file_paths:
+        print(f"No file found matching pattern: {patterns}")
+        return pd.DataFrame()
+
+    if max_workers is None:
+        max_workers = _available_cores()
+    max_workers = max(1, min(max_workers, len(file_paths)))
+
+    if max_workers == 1:
+        results = [_read_excel_worker(path, header, dtype) for path in file_paths]
+    else:
+        with _process_pool(max_workers) as executor:
+            results = list(
+                executor.map(
+                    _read_excel_worker,
+                    file_paths,
+                    [header] * len(file_paths),
+                    [dtype] * len(file_paths),
+                )
+            )
+
+    frames = []
+    failures = []
+    for path, (df, error) in zip(file_paths, results):
+        if error:
+            failures.append(path)
+            print(f"Could not read {path}: {error}")
+            continue
+        df.insert(0, source_column, os.path.relpath(path, folder))
+        frames.append(df)
+
+    print(f"{len(frames)} file(s) read from {folder}, {len(failures)} failed")
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+# Maximum number of rows of an Excel sheet, header included
+EXCEL_MAX_ROWS = 1048576
+
+
+def _iter_chunks(data, chunk_size):
+    """
+    Returns an iterator of DataFrame chunks from a DataFrame or from an iterable of DataFrames.
+
+    Arguments:
+    - data (pd.DataFrame | iterable of pd.DataFrame): The data to split.
+    - chunk_size (int): The number of rows per chunk when data is a DataFrame.
+
+    Returns:
+    - iterator of pd.DataFrame: The chunks.
+    """
+    if isinstance(data, pd.DataFrame):
+        return (
+            data.iloc[start : start + chunk_size]
+            for start in range(0, max(len(data), 1), chunk_size)
+        )
+    return iter(data)
+
+
+def export_excel(
+    data, file_path, sheet_name="Sheet1", max_rows_per_sheet=EXCEL_MAX_ROWS
+):
+    """
+    Writes a DataFrame, or the chunks of a streamed DataFrame, to an Excel file in constant memory.
+    Rows are appended to write-only worksheets instead of building the whole workbook in memory.
+    When the rows do not fit in one sheet, new sheets named "<sheet_name>_2", "<sheet_name>_3", etc. are added,
+    each one starting with the header row.
+
+    Arguments:
+    - data (pd.DataFrame | iterable of pd.DataFrame): The data to write. Chunks must all have the same columns.
+    - file_path (str): The path of the Excel file to create.
+    - sheet_name (str): The name of the first sheet. Defaults to "Sheet1".
+    - max_rows_per_sheet (int): The maximum number of rows per sheet, header included. Defaults to the Excel limit.
+
+    Returns:
+    - int: The number of rows written, header excluded.
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = None
+    header = None
+    sheet_count = 0
+    sheet_rows = 0
+    row_count = 0
+    for chunk in _iter_chunks(data, 50000):
+        if header is None:
+            header = [str(column) for column in chunk.columns]
+        # Missing values are written as empty cells, as df.to_excel does
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            if worksheet is None or sheet_rows >= max_rows_per_sheet:
+                sheet_count += 1
+                title = (
+                    sheet_name if sheet_count == 1 else f"{sheet_name}_{sheet_count}"
+                )
+                worksheet = workbook.create_sheet(title)
+                worksheet.append(header)
+                sheet_rows = 1
+            worksheet.append(row)
+            sheet_rows += 1
+        row_count += len(chunk)
+
+    if worksheet is None:
+        # Empty data still produces a sheet with the header, as df.to_excel does
+        worksheet = workbook.create_sheet(sheet_name)
+        if header:
+            worksheet.append(header)
+    workbook.save(file_path)
+    print(f"{row_count} rows written to {file_path} in {max(sheet_count, 1)} sheet(s)")
+    return row_count
+
+
 def get_json_file(folder):
     """
     Returns the first .json file found in the specified folder.
@@ -59,7 +730,7 @@ def get_json_file(folder):
     Returns:
     - str or None: The path to the first JSON file found, or None if no JSON file is present.
     """
-    files = glob.glob(os.path.join(folder, "*.json"))
+    files = get_directory_index(folder, recursive=False).with_extension(".json")
     return files[0] if files else None
 
 
@@ -112,46 +783,433 @@ def find_root_folder():
     print(os.path.abspath(__file__))
 
 
-def group_files_in_single_folder(IN, OUT):
+# FICLONE ioctl (linux/fs.h): makes the target share the blocks of the source on btrfs, XFS, etc.
+FICLONE = 0x40049409
+GROUP_METHODS = ("copy", "reflink", "hardlink")
+
+
+def _target_names(files):
+    """
+    Gives each file its name in the grouped folder. Files are taken by depth, then in the sorted order of their paths:
+    the first one keeps its name, the next ones with the same name get their folder as a suffix.
+
+    Arguments:
+    - files (list): The relative paths of the files.
+
+    Returns:
+    - dict: The target name of each relative path.
+    """
+    names = {}
+    used = set()
+    for relative_path in sorted(files, key=lambda path: (path.count(os.sep), path)):
+        name = os.path.basename(relative_path)
+        if name.lower() in used:
+            stem, extension = os.path.splitext(name)
+            folder = os.path.dirname(relative_path).replace(os.sep, "_")
+            prefix = f"{stem}__{folder}" if folder else stem
+            name = f"{prefix}{extension}"
+            counter = 2
+            while name.lower() in used:
+                name = f"{prefix}_{counter}{extension}"
+                counter += 1
+        used.add(name.lower())
+        names[relative_path] = name
+    return names
+
+
+def _is_same_content(source_path, target_path, source_stat, compare_hash):
+    try:
+        target_stat = os.stat(target_path)
+    except FileNotFoundError:
+        return False
+    if os.path.samestat(source_stat, target_stat):
+        return True
+    if source_stat.st_size != target_stat.st_size:
+        return False
+    if int(source_stat.st_mtime) == int(target_stat.st_mtime):
+        return True
+    return compare_hash and _file_hash(source_path) == _file_hash(target_path)
+
+
+def _reflink(source_path, target_path):
+    """
+    Clones a file with the FICLONE ioctl, falling back to os.copy_file_range (done in the kernel,
+    and cloned by some file systems), then to a regular copy.
+
+    Returns:
+    - bool: True if the file was cloned without copying its data.
+    """
+    if fcntl is not None:
+        try:
+            with open(source_path, "rb") as source, open(target_path, "wb") as target:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            shutil.copystat(source_path, target_path)
+            return True
+        except OSError:
+            pass
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(source_path, "rb") as source, open(target_path, "wb") as target:
+                while os.copy_file_range(source.fileno(), target.fileno(), 1024**3):
+                    pass
+            shutil.copystat(source_path, target_path)
+            return False
+        except OSError:
+            pass
+    shutil.copy2(source_path, target_path)
+    return False
+
+
+def _group_file(source_path, target_path, method, same_device):
+    """
+    Puts a file in the grouped folder with the given method.
+
+    Returns:
+    - bool: True if the data was not copied (hardlink or clone).
+    """
+    # Removed first: writing into an existing hardlink would modify the source file it points to
+    if os.path.lexists(target_path):
+        os.remove(target_path)
+    if method == "hardlink" and same_device:
+        os.link(source_path, target_path)
+        return True
+    if method == "reflink" and same_device:
+        return _reflink(source_path, target_path)
+    shutil.copy2(source_path, target_path)
+    return False
+
+
+def group_files_in_single_folder(
+    IN, OUT, method="copy", compare_hash=False, max_workers=8
+):
     """
     Parses files in a directory and its subdirectories,
     and copies them to a specified root directory.
 
+    Files already in OUT with the same size and modification time (or the same content with compare_hash)
+    are skipped. Files with the same name in different subfolders are all kept: the first one in the sorted
+    order of the paths keeps its name, the next ones get their folder as a suffix (report__2024_january.xlsx).
+    Copies are done in parallel.
+
     Arguments:
     - IN (str): The source directory to parse files from.
     - OUT (str): The root directory where files will be copied.
+    - method (str): "copy", "reflink" to clone the files (no data copied on btrfs, XFS...) or "hardlink"
+      to link them (OUT then shares the files of IN, a change to one changes the other).
+      Both fall back to a copy when IN and OUT are on different file systems.
+    - compare_hash (bool): True to also compare the content of files of the same size but different modification time.
+    - max_workers (int): The number of concurrent copies.
+
+    Returns:
+    - dict: The number of files and bytes copied, linked or cloned, and skipped.
     """
-    for root, _, files in os.walk(IN):
-        for file in files:
-            source_file_path = os.path.join(root, file)
-            target_file_path = os.path.join(OUT, file)
-            shutil.copy2(source_file_path, target_file_path)
-            print(f"Copied {source_file_path} to {target_file_path}")
+    if method not in GROUP_METHODS:
+        raise ValueError(f"Unknown method {method}, expected one of {GROUP_METHODS}")
+    os.makedirs(OUT, exist_ok=True)
+    out_path = os.path.abspath(OUT)
+
+    files = []
+    for root, folders, file_names in os.walk(IN):
+        # OUT is not parsed when it is inside IN
+        folders[:] = [
+            folder
+            for folder in folders
+            if os.path.abspath(os.path.join(root, folder)) != out_path
+        ]
+        files += [os.path.relpath(os.path.join(root, file), IN) for file in file_names]
+    target_names = _target_names(files)
+    out_device = os.stat(OUT).st_dev
+
+    stats = {
+        "copied": 0,
+        "copied_bytes": 0,
+        "linked": 0,
+        "linked_bytes": 0,
+        "skipped": 0,
+        "skipped_bytes": 0,
+    }
+    copies = []
+    for relative_path, name in target_names.items():
+        source_file_path = os.path.join(IN, relative_path)
+        target_file_path = os.path.join(OUT, name)
+        source_stat = os.stat(source_file_path)
+        if _is_same_content(
+            source_file_path, target_file_path, source_stat, compare_hash
+        ):
+            stats["skipped"] += 1
+            stats["skipped_bytes"] += source_stat.st_size
+            continue
+        copies.append(
+            (
+                source_file_path,
+                target_file_path,
+                source_stat.st_size,
+                source_stat.st_dev == out_device,
+            )
+        )
+
+    def group(source_file_path, target_file_path, size, same_device):
+        without_copy = _group_file(
+            source_file_path, target_file_path, method, same_device
+        )
+        action = "Linked" if without_copy else "Copied"
+        log_item(f"{action} {source_file_path} to {target_file_path}", "Copied files")
+        return without_copy, size
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for without_copy, size in executor.map(lambda copy: group(*copy), copies):
+            key = "linked" if without_copy else "copied"
+            stats[key] += 1
+            stats[f"{key}_bytes"] += size
+
+    print(
+        f"{len(files)} file(s) grouped in {OUT}: "
+        f"{stats['copied']} copied ({stats['copied_bytes'] / 1024**2:.2f} MB moved), "
+        f"{stats['linked']} linked or cloned and {stats['skipped']} already up to date "
+        f"({(stats['linked_bytes'] + stats['skipped_bytes']) / 1024**2:.2f} MB avoided)"
+    )
+    return stats
+
+
+# Formats already compressed, stored as is by zip_folder
+STORED_EXTENSIONS = (
+    ".zip",
+    ".gz",
+    ".bz2",
+    ".xz",
+    ".7z",
+    ".rar",
+    ".xlsx",
+    ".xlsm",
+    ".docx",
+    ".pptx",
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".gif",
+    ".webp",
+    ".mp3",
+    ".mp4",
+    ".parquet",
+)
+ZIP_CHUNK_SIZE = 1024 * 1024
 
 
-def zip_folder(folder_path, zip_path):
+def _deflate_member(source_path, temporary_path, compression_level):
+    """
+    Compresses a file to a raw deflate stream, as stored in a zip member, chunk by chunk.
+    Runs in a worker process of zip_folder.
+
+    Returns:
+    - tuple: (CRC-32 of the file, size of the file, size of the compressed stream)
+    """
+    compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -15)
+    crc = 0
+    file_size = 0
+    with open(source_path, "rb") as source, open(temporary_path, "wb") as target:
+        while chunk := source.read(ZIP_CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+            file_size += len(chunk)
+            target.write(compressor.compress(chunk))
+        target.write(compressor.flush())
+        compress_size = target.tell()
+    return crc, file_size, compress_size
+
+
+def _write_deflated_member(zipf, source_path, arcname, temporary_path, result):
+    """
+    Writes a member compressed by _deflate_member to the archive, without compressing it again.
+
+    zipfile has no API to write compressed data: the stream is copied as a stored member,
+    then the compression method, CRC and sizes of the member are set to those of the deflated file
+    and its local header is written again. The central directory is built from the same ZipInfo on close.
+    """
+    crc, file_size, compress_size = result
+    zinfo = zipfile.ZipInfo.from_file(source_path, arcname)
+    zinfo.compress_type = zipfile.ZIP_STORED
+    # Decides the Zip64 extra field in the same way zipfile does, so both versions of the header have the same size
+    zinfo.file_size = file_size
+    zip64 = file_size * 1.05 > zipfile.ZIP64_LIMIT
+    with open(temporary_path, "rb") as source, zipf.open(
+        zinfo, "w", force_zip64=zip64
+    ) as target:
+        shutil.copyfileobj(source, target, ZIP_CHUNK_SIZE)
+
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.CRC = crc
+    zinfo.file_size = file_size
+    zinfo.compress_size = compress_size
+    end = zipf.fp.tell()
+    zipf.fp.seek(zinfo.header_offset)
+    zipf.fp.write(zinfo.FileHeader(zip64))
+    zipf.fp.seek(end)
+
+
+def zip_folder(
+    folder_path,
+    zip_path,
+    compression_level=6,
+    store_extensions=STORED_EXTENSIONS,
+    max_workers=None,
+    streaming=False,
+):
     """
     Zips the contents of a folder into a zip file.
+
+    Files with an already compressed format (xlsx, png, zip...) are stored without compression.
+    The other files are compressed in parallel in a process pool, each worker writing a temporary deflate stream
+    next to the zip file, and the streams are then copied to the archive in the sorted order of the paths.
+    In streaming mode, files are compressed one by one directly into the archive: no temporary file is written
+    and zip_path can be a writable file object, such as a pipe or an upload stream.
+    Members are read and written by chunks in both modes, and Zip64 is used for members and archives over 4 GB.
+
     Arguments:
     - folder_path (str): The path to the folder to zip.
-    - zip_path (str): The path where the zip file will be saved.
+    - zip_path (str | file object): The path where the zip file will be saved, or a file object in streaming mode.
+    - compression_level (int): The deflate level, from 1 (fastest) to 9 (smallest). 0 stores all the files.
+    - store_extensions (iterable): The extensions of the files stored without compression.
+    - max_workers (int, optional): The number of processes. Defaults to the number of available cores.
+    - streaming (bool): True to compress the files one by one into the archive.
     """
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                full_path = os.path.join(root, file)
-                if full_path == zip_path:
+    store_extensions = {extension.lower() for extension in store_extensions}
+    target_path = os.path.abspath(zip_path) if isinstance(zip_path, str) else None
+    members = []
+    # Sorted, so the same folder always gives the same archive
+    for root, directories, files in os.walk(folder_path):
+        directories.sort()
+        for file in sorted(files):
+            full_path = os.path.join(root, file)
+            if os.path.abspath(full_path) == target_path:
+                continue
+            arcname = os.path.relpath(full_path, folder_path)
+            stored = (
+                compression_level == 0
+                or os.path.splitext(file)[1].lower() in store_extensions
+            )
+            members.append((full_path, arcname, stored))
+
+    deflated = [member for member in members if not member[2]]
+    if max_workers is None:
+        max_workers = _available_cores()
+    max_workers = max(1, min(max_workers, len(deflated)))
+    if streaming or max_workers == 1 or not isinstance(zip_path, str):
+        with zipfile.ZipFile(
+            zip_path, "w", zipfile.ZIP_DEFLATED, compresslevel=compression_level
+        ) as zipf:
+            for full_path, arcname, stored in members:
+                zipf.write(
+                    full_path,
+                    arcname,
+                    compress_type=zipfile.ZIP_STORED if stored else None,
+                )
+        print(f"{len(members)} file(s) zipped to {zip_path}")
+        return
+
+    temporary_folder = tempfile.mkdtemp(
+        prefix=".zip-", dir=os.path.dirname(target_path)
+    )
+    try:
+        with _process_pool(max_workers) as executor, zipfile.ZipFile(
+            zip_path, "w", zipfile.ZIP_DEFLATED
+        ) as zipf:
+            futures = {}
+            for index, (full_path, _, stored) in enumerate(members):
+                if not stored:
+                    temporary_path = os.path.join(temporary_folder, str(index))
+                    futures[index] = executor.submit(
+                        _deflate_member, full_path, temporary_path, compression_level
+                    )
+            for index, (full_path, arcname, stored) in enumerate(members):
+                if stored:
+                    zipf.write(full_path, arcname, compress_type=zipfile.ZIP_STORED)
                     continue
-                arcname = os.path.relpath(full_path, folder_path)
-                zipf.write(full_path, arcname)
+                temporary_path = os.path.join(temporary_folder, str(index))
+                _write_deflated_member(
+                    zipf, full_path, arcname, temporary_path, futures[index].result()
+                )
+                os.remove(temporary_path)
+    finally:
+        shutil.rmtree(temporary_folder, ignore_errors=True)
+    print(
+        f"{len(members)} file(s) zipped to {zip_path}, {len(deflated)} compressed by {max_workers} processes"
+    )
 
 
-def unzip_file(zip_path, extract_to):
+def _member_directory(extract_to, member):
+    """
+    Returns the directory ZipFile.extract creates for a member: the member itself for a directory,
+    its parent folder for a file. The name is cleaned the same way (no drive, "..", "." or empty parts).
+    """
+    name = member.filename.replace("/", os.path.sep)
+    if os.path.altsep:
+        name = name.replace(os.path.altsep, os.path.sep)
+    name = os.path.splitdrive(name)[1]
+    parts = [
+        part
+        for part in name.split(os.path.sep)
+        if part not in ("", os.path.curdir, os.path.pardir)
+    ]
+    if os.path.sep == "\\":
+        parts = [
+            zipfile.ZipFile._sanitize_windows_name(part, os.path.sep) for part in parts
+        ]
+    if not member.is_dir():
+        parts = parts[:-1]
+    return os.path.normpath(os.path.join(extract_to, *parts))
+
+
+def _extract_members(zip_path, names, extract_to):
+    """
+    Extracts some members of a zip file. Runs in a worker process of unzip_file.
+    """
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        for name in names:
+            zip_ref.extract(name, extract_to)
+    return len(names)
+
+
+def unzip_file(zip_path, extract_to, max_workers=None):
     """
     Unzips a zip file to a specified directory.
+    Members are extracted in parallel in a process pool, each process opening the archive and extracting
+    a share of the members of about the same total size.
     Arguments:
     - zip_path (str): The path to the zip file.
     - extract_to (str): The directory where the contents will be extracted.
+    - max_workers (int, optional): The number of processes. Defaults to the number of available cores.
     """
     with zipfile.ZipFile(zip_path, "r") as zip_ref:
-        zip_ref.extractall(extract_to)
+        members = zip_ref.infolist()
+    if max_workers is None:
+        max_workers = _available_cores()
+    max_workers = max(1, min(max_workers, len(members)))
+    if max_workers == 1:
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            zip_ref.extractall(extract_to)
+        return
+
+    # The folders are created before the processes start: ZipFile.extract checks whether the folder
+    # of a member exists before creating it, and fails when another process created it in between
+    for directory in sorted(
+        {_member_directory(extract_to, member) for member in members}
+    ):
+        os.makedirs(directory, exist_ok=True)
+    files = [member for member in members if not member.is_dir()]
+
+    # Largest members first, each one given to the process with the smallest share
+    shares = [[] for _ in range(max_workers)]
+    share_sizes = [0] * max_workers
+    for member in sorted(files, key=lambda member: member.file_size, reverse=True):
+        index = share_sizes.index(min(share_sizes))
+        shares[index].append(member.filename)
+        share_sizes[index] += member.file_size
+    with _process_pool(max_workers) as executor:
+        for future in [
+            executor.submit(_extract_members, zip_path, names, extract_to)
+            for names in shares
+            if names
+        ]:
+            future.result()
+    print(
+        f"{len(members)} file(s) extracted to {extract_to} by {max_workers} processes"
+    )
@@ -1,10 +1,30 @@
+import hashlib
 import io
+import json
+import os
+import threading
+import weakref
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.http import MediaIoBaseDownload
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 
+from utils.logs_management import log_item
+
+# The batch endpoint of the Drive API accepts at most 100 calls per request
+DRIVE_BATCH_SIZE = 100
+DRIVE_MAX_CONCURRENCY = 8
+DRIVE_FILE_FIELDS = "id, name, mimeType, parents, md5Checksum, modifiedTime, size"
+DRIVE_SYNC_DIR = os.path.join("cache", "gdrive")
+
+# Credentials of the services created by init_gdrive_service, used to authorize the HTTP object of each download thread
+_SERVICE_CREDENTIALS = weakref.WeakKeyDictionary()
+
 
 def init_gdrive_service(credentials_file):
     """
@@ -20,12 +40,15 @@ def init_gdrive_service(credentials_file):
     creds = service_account.Credentials.from_service_account_file(
         credentials_file, scopes=SCOPES
     )
-    return build("drive", "v3", credentials=creds)
+    drive_service = build("drive", "v3", credentials=creds)
+    _SERVICE_CREDENTIALS[drive_service] = creds
+    return drive_service
 
 
 def list_files(drive_service, folder_id):
     """
     List all files in a specified Google Drive folder.
+    All the result pages are fetched, with only the fields needed by the other functions.
     Arguments:
     - drive_service: An authorized Google Drive API service instance.
     - str folder_id: The ID of the Google Drive folder to list files from.
@@ -33,29 +56,40 @@ def list_files(drive_service, folder_id):
     - list: A list of files in the specified folder.
     """
     query = f"'{folder_id}' in parents and trashed = false"
-    response = (
-        drive_service.files()
-        .list(
-            q=query,
-            spaces="drive",
-            fields="files(id, name, mimeType, parents)",
-            includeItemsFromAllDrives=True,
-            supportsAllDrives=True,
+    files = []
+    page_token = None
+    while True:
+        response = (
+            drive_service.files()
+            .list(
+                q=query,
+                spaces="drive",
+                fields=f"nextPageToken, files({DRIVE_FILE_FIELDS})",
+                pageSize=1000,
+                pageToken=page_token,
+                includeItemsFromAllDrives=True,
+                supportsAllDrives=True,
+            )
+            .execute()
         )
-        .execute()
-    )
-    return response.get("files", [])
+        files.extend(response.get("files", []))
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return files
 
 
-def download_file(drive_service, file_id, filename):
+def download_file(drive_service, file_id, filename, http=None):
     """
     Download a file from Google Drive.
     Arguments:
     - drive_service: An authorized Google Drive API service instance.
     - str file_id: The ID of the file to download.
     - str filename: The local path where the file will be saved.
+    - http (optional): The HTTP object used for the download, instead of the one of the service.
     """
     request = drive_service.files().get_media(fileId=file_id)
+    if http is not None:
+        request.http = http
     with io.FileIO(filename, "wb") as fh:
         downloader = MediaIoBaseDownload(fh, request)
         done = False
@@ -63,6 +97,178 @@ def download_file(drive_service, file_id, filename):
             _, done = downloader.next_chunk()
 
 
+def _authorized_http_factory(credentials):
+    """
+    Returns a function creating a new authorized HTTP object with the given credentials.
+    httplib2 is not thread-safe, so each thread needs its own HTTP object.
+    """
+    return lambda: AuthorizedHttp(credentials, http=httplib2.Http())
+
+
+def download_files(
+    drive_service,
+    files,
+    local_folder,
+    max_workers=DRIVE_MAX_CONCURRENCY,
+    http_factory=None,
+    credentials=None,
+):
+    """
+    Download several files from Google Drive concurrently.
+    Each thread uses its own HTTP object, as httplib2 is not thread-safe.
+    Each file is downloaded to a temporary file renamed once complete, so files with the same name
+    (allowed by Drive in a folder) never write to the same file at the same time.
+    Folders and Google Docs (which cannot be downloaded as is) are skipped.
+    Arguments:
+    - drive_service: An authorized Google Drive API service instance.
+    - list files: The files to download, as returned by list_files.
+    - str local_folder: The local folder where the files will be saved.
+    - int max_workers: The number of concurrent downloads.
+    - http_factory (optional): A function returning a new HTTP object, used by each thread. Defaults to
+      an HTTP object authorized with the credentials.
+    - credentials (optional): The credentials of the service. Defaults to the ones given to init_gdrive_service.
+    Returns:
+    - list: The local paths of the downloaded files.
+    """
+    if http_factory is None:
+        credentials = credentials or _SERVICE_CREDENTIALS.get(drive_service)
+        if credentials is None:
+            raise ValueError(
+                "The credentials are required for a service not created by init_gdrive_service"
+            )
+        http_factory = _authorized_http_factory(credentials)
+    thread_data = threading.local()
+    os.makedirs(local_folder, exist_ok=True)
+
+    def download(file):
+        if not hasattr(thread_data, "http"):
+            thread_data.http = http_factory()
+        local_path = os.path.join(local_folder, file["name"])
+        temporary_path = f"{local_path}.{file['id']}.part"
+        log_item(f"Downloading {file['name']} → {local_path}", "Google Drive downloads")
+        try:
+            download_file(drive_service, file["id"], temporary_path, thread_data.http)
+            os.replace(temporary_path, local_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        return local_path
+
+    downloadable = [
+        file
+        for file in files
+        if not file.get("mimeType", "").startswith("application/vnd.google-apps.")
+    ]
+    name_counts = Counter(file["name"] for file in downloadable)
+    duplicates = sorted(name for name, count in name_counts.items() if count > 1)
+    if duplicates:
+        print(
+            f"Several Drive files share the names {duplicates}, only one of each is kept in {local_folder}"
+        )
+    local_paths = []
+    failures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(download, file): file for file in downloadable}
+        for future in as_completed(futures):
+            try:
+                local_paths.append(future.result())
+            except Exception as e:
+                failures.append(futures[future]["name"])
+                print(f"Failed to download {futures[future]['name']}: {e}")
+
+    print(
+        f"{len(local_paths)} file(s) downloaded from Google Drive, {len(failures)} failed"
+    )
+    if failures:
+        raise RuntimeError(
+            f"{len(failures)} file(s) could not be downloaded from Google Drive"
+        )
+    return sorted(set(local_paths))
+
+
+def download_folder(
+    drive_service,
+    folder_id,
+    local_folder,
+    max_workers=DRIVE_MAX_CONCURRENCY,
+    credentials=None,
+):
+    """
+    Download all the files of a Google Drive folder concurrently.
+    Arguments:
+    - drive_service: An authorized Google Drive API service instance.
+    - str folder_id: The ID of the Google Drive folder.
+    - str local_folder: The local folder where the files will be saved.
+    - int max_workers: The number of concurrent downloads.
+    - credentials (optional): The credentials of the service. Defaults to the ones given to init_gdrive_service.
+    Returns:
+    - list: The local paths of the downloaded files.
+    """
+    return download_files(
+        drive_service,
+        list_files(drive_service, folder_id),
+        local_folder,
+        max_workers,
+        credentials=credentials,
+    )
+
+
+def _execute_in_batches(drive_service, requests):
+    """
+    Execute API calls through the batch endpoint, by batches of DRIVE_BATCH_SIZE calls.
+    Arguments:
+    - drive_service: An authorized Google Drive API service instance.
+    - list requests: The API calls to execute (not executed yet).
+    Returns:
+    - list: The response of each call, in the same order. Failed calls are reported and their response is None.
+    """
+    responses = [None] * len(requests)
+    failures = []
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            failures.append(request_id)
+            print(f"Drive batch call {request_id} failed: {exception}")
+        else:
+            responses[int(request_id)] = response
+
+    for start in range(0, len(requests), DRIVE_BATCH_SIZE):
+        batch = drive_service.new_batch_http_request(callback=callback)
+        for position in range(start, min(start + DRIVE_BATCH_SIZE, len(requests))):
+            batch.add(requests[position], request_id=str(position))
+        batch.execute()
+
+    if failures:
+        raise RuntimeError(f"{len(failures)} Drive call(s) failed")
+    return responses
+
+
+def create_folders(drive_service, names, parent_folder_id):
+    """
+    Create several folders in Google Drive through the batch endpoint.
+    Arguments:
+    - drive_service: An authorized Google Drive API service instance.
+    - list names: The names of the folders to create.
+    - str parent_folder_id: The ID of the parent folder.
+    Returns:
+    - list: The IDs of the new folders, in the order of the names.
+    """
+    requests = [
+        drive_service.files().create(
+            body={
+                "name": name,
+                "mimeType": "application/vnd.google-apps.folder",
+                "parents": [parent_folder_id],
+            },
+            fields="id",
+            supportsAllDrives=True,
+        )
+        for name in names
+    ]
+    return [response["id"] for response in _execute_in_batches(drive_service, requests)]
+
+
 def create_timestamped_folder(drive_service, parent_folder_id):
     """
     Create a timestamped folder in Google Drive.
@@ -106,3 +312,180 @@ def move_file(drive_service, file_id, src_folder_id, dest_folder_id):
         )
         .execute()
     )
+
+
+def move_files(drive_service, file_ids, src_folder_id, dest_folder_id):
+    """
+    Move several files from one folder to another in Google Drive, through the batch endpoint.
+    Arguments:
+    - drive_service: An authorized Google Drive API service instance.
+    - list file_ids: The IDs of the files to move.
+    - str src_folder_id: The ID of the source folder.
+    - str dest_folder_id: The ID of the destination folder.
+    """
+    requests = [
+        drive_service.files().update(
+            fileId=file_id,
+            addParents=dest_folder_id,
+            removeParents=src_folder_id,
+            fields="id, parents",
+            supportsAllDrives=True,
+        )
+        for file_id in file_ids
+    ]
+    _execute_in_batches(drive_service, requests)
+    print(f"{len(file_ids)} file(s) moved to {dest_folder_id}")
+
+
+def _sync_index_path(folder_id, local_folder):
+    """
+    Returns the path of the index of a synchronised folder, kept outside the local folder.
+    """
+    key = f"{folder_id}|{os.path.abspath(local_folder)}"
+    name = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return os.path.join(DRIVE_SYNC_DIR, f"{name}.json")
+
+
+def _save_sync_index(path, index):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(temporary_path, path)
+
+
+def _list_changes(drive_service, page_token, drive_id=None):
+    """
+    List all the changes since a page token of the changes feed.
+    Arguments:
+    - drive_service: An authorized Google Drive API service instance.
+    - str page_token: The page token saved by the previous synchronisation.
+    - str drive_id (optional): The ID of the shared drive to follow.
+    Returns:
+    - tuple: (list of changes, new start page token)
+    """
+    changes = []
+    while True:
+        response = (
+            drive_service.changes()
+            .list(
+                pageToken=page_token,
+                spaces="drive",
+                fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({DRIVE_FILE_FIELDS}, trashed))",
+                pageSize=1000,
+                includeItemsFromAllDrives=True,
+                supportsAllDrives=True,
+                driveId=drive_id,
+            )
+            .execute()
+        )
+        changes.extend(response.get("changes", []))
+        if "newStartPageToken" in response:
+            return changes, response["newStartPageToken"]
+        page_token = response["nextPageToken"]
+
+
+def _remove_local_file(index, file_id):
+    entry = index["files"].pop(file_id, None)
+    if entry and os.path.exists(entry["path"]):
+        os.remove(entry["path"])
+        print(f"Removed {entry['path']}")
+
+
+def sync_folder(
+    drive_service,
+    folder_id,
+    local_folder,
+    max_workers=DRIVE_MAX_CONCURRENCY,
+    drive_id=None,
+    credentials=None,
+):
+    """
+    Synchronise a Google Drive folder with a local folder, downloading only what changed since the last run.
+
+    The first run downloads the whole folder and saves the start page token of the Drive changes feed,
+    with an index of file id → (md5Checksum, modifiedTime, local path) kept in cache/gdrive.
+    Later runs read the changes feed from the saved token: new and modified files are downloaded,
+    local copies of files removed, trashed or moved out of the folder are deleted.
+    Arguments:
+    - drive_service: An authorized Google Drive API service instance.
+    - str folder_id: The ID of the Google Drive folder.
+    - str local_folder: The local folder kept in sync.
+    - int max_workers: The number of concurrent downloads.
+    - str drive_id (optional): The ID of the shared drive holding the folder, to follow its changes.
+    - credentials (optional): The credentials of the service. Defaults to the ones given to init_gdrive_service.
+    Returns:
+    - list: The local paths of the files downloaded by this run.
+    """
+    index_path = _sync_index_path(folder_id, local_folder)
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = None
+
+    if index is None:
+        # The token is taken before listing, so changes made during the first download are seen by the next run
+        start_page_token = (
+            drive_service.changes()
+            .getStartPageToken(supportsAllDrives=True, driveId=drive_id)
+            .execute()["startPageToken"]
+        )
+        index = {"start_page_token": start_page_token, "files": {}}
+        to_download = list_files(drive_service, folder_id)
+    else:
+        changes, new_start_page_token = _list_changes(
+            drive_service, index["start_page_token"], drive_id
+        )
+        to_download = {}
+        for change in changes:
+            file = change.get("file") or {}
+            file_id = change["fileId"]
+            in_folder = (
+                not change.get("removed")
+                and not file.get("trashed")
+                and folder_id in file.get("parents", [])
+            )
+            if not in_folder:
+                _remove_local_file(index, file_id)
+                continue
+            entry = index["files"].get(file_id)
+            if entry and (
+                entry["md5Checksum"] == file.get("md5Checksum")
+                and entry["modifiedTime"] == file.get("modifiedTime")
+                and entry["path"] == os.path.join(local_folder, file["name"])
+            ):
+                continue
+            if entry and entry["path"] != os.path.join(local_folder, file["name"]):
+                # Renamed file: the copy under the old name is removed
+                _remove_local_file(index, file_id)
+            to_download[file_id] = file
+        # Files deleted locally are downloaded again
+        for file_id, entry in index["files"].items():
+            if file_id not in to_download and not os.path.exists(entry["path"]):
+                to_download[file_id] = {
+                    "id": file_id,
+                    "name": entry["name"],
+                    "mimeType": entry.get("mimeType", ""),
+                    "md5Checksum": entry["md5Checksum"],
+                    "modifiedTime": entry["modifiedTime"],
+                }
+        to_download = list(to_download.values())
+        index["start_page_token"] = new_start_page_token
+
+    downloaded = download_files(
+        drive_service, to_download, local_folder, max_workers, credentials=credentials
+    )
+    for file in to_download:
+        local_path = os.path.join(local_folder, file["name"])
+        if local_path in downloaded:
+            index["files"][file["id"]] = {
+                "name": file["name"],
+                "mimeType": file.get("mimeType", ""),
+                "md5Checksum": file.get("md5Checksum"),
+                "modifiedTime": file.get("modifiedTime"),
+                "path": local_path,
+            }
+    _save_sync_index(index_path, index)
+    print(f"Google Drive folder synchronised: {len(downloaded)} file(s) downloaded")
+    return downloaded
@@ -1,33 +1,256 @@
+import atexit
+import itertools
 import os
+import queue
 import sys
+import threading
+import time
+from collections import Counter
 from datetime import datetime
 
+LOG_QUEUE_SIZE = 10000
+LOG_FLUSH_INTERVAL = 1.0
+LOG_FLUSH_SIZE = 64 * 1024
 
-class LoggerDualOutput:
-    def __init__(self, logfile):
+_LOGGER = None
+_QUIET = False
+_ITEM_COUNTS = Counter()
+_ITEM_COUNTS_LOCK = threading.Lock()
+
+
+class BufferedLogWriter:
+    """
+    Writes log messages to the terminal and a log file from a background thread.
+    Messages are queued by the callers and written in batches, both outputs being flushed
+    when LOG_FLUSH_INTERVAL seconds or LOG_FLUSH_SIZE bytes are reached, on flush() and on close().
+    A process forked from the job has no writer thread: it writes its messages directly.
+    """
+
+    def __init__(
+        self,
+        logfile,
+        queue_size=LOG_QUEUE_SIZE,
+        flush_interval=LOG_FLUSH_INTERVAL,
+        flush_size=LOG_FLUSH_SIZE,
+    ):
         self.terminal = sys.__stdout__
         self.logfile = logfile
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        # Bounded: a job logging faster than the disk waits instead of growing the memory
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._second = None
+        self._timestamp = ""
+        self._closed = False
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def timestamp(self):
+        """
+        Returns the "[%Y-%m-%d %H:%M:%S] " prefix, formatted at most once per second.
+        """
+        second = int(time.time())
+        if second != self._second:
+            self._timestamp = datetime.fromtimestamp(second).strftime(
+                "[%Y-%m-%d %H:%M:%S] "
+            )
+            self._second = second
+        return self._timestamp
+
+    def forked(self):
+        """
+        Returns whether the writer is used by a process forked from the one which created it,
+        where the writer thread does not run.
+        """
+        return os.getpid() != self._pid
+
+    def write(self, message):
+        if self._closed:
+            self.terminal.write(message)
+            return
+        if self.forked():
+            self._write([message])
+            return
+        self.queue.put(message)
+
+    def flush(self):
+        """
+        Waits until every message queued so far is written and flushed.
+        """
+        if self._closed or self.forked() or threading.current_thread() is self._thread:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self):
+        """
+        Writes the remaining messages, stops the writer thread and closes the log file.
+        """
+        if self._closed:
+            return
+        if self.forked():
+            # The log file is closed by the process which opened it
+            self._closed = True
+            return
+        self.queue.put(None)
+        self._thread.join()
+        self._closed = True
+        self.logfile.close()
+
+    def _run(self):
+        buffer = []
+        buffered_size = 0
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(self.flush_interval - (time.monotonic() - last_flush), 0)
+            try:
+                item = self.queue.get(timeout=timeout if buffer else None)
+            except queue.Empty:
+                item = ""
+            items = [item]
+            # Everything already queued is written in the same batch
+            while len(items) < 1000:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            events = []
+            stop = False
+            for item in items:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    events.append(item)
+                elif item:
+                    buffer.append(item)
+                    buffered_size += len(item)
+
+            if (
+                stop
+                or events
+                or buffered_size >= self.flush_size
+                or time.monotonic() - last_flush >= self.flush_interval
+            ):
+                self._write(buffer)
+                buffer = []
+                buffered_size = 0
+                last_flush = time.monotonic()
+            for event in events:
+                event.set()
+            if stop:
+                return
+
+    def _write(self, buffer):
+        if not buffer:
+            return
+        text = "".join(buffer)
+        for output in (self.terminal, self.logfile):
+            try:
+                output.write(text)
+                output.flush()
+            except (OSError, ValueError):
+                # A closed terminal must not stop the log file from being written, and the opposite
+                pass
+
+
+class LogStream:
+    """
+    Replaces sys.stdout or sys.stderr, adding the timestamp of each write before queuing it.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
 
     def write(self, message):
-        timestamp = datetime.now().strftime("[%Y-%m-%d %H:%M:%S] ")
+        timestamp = self.writer.timestamp()
         if message == "\n":
             timestamp = ""
-        self.terminal.write(timestamp + message)
-        self.logfile.write(timestamp + message)
-        self.flush()
+        self.writer.write(timestamp + message)
 
     def flush(self):
-        self.terminal.flush()
-        self.logfile.flush()
+        self.writer.flush()
+
+
+def log_item(message: str, category: str = "item"):
+    """
+    Logs a message printed once per processed item (file, key, message...).
+    In quiet mode the message is not written, only counted, and the counts are logged when the job ends.
+
+    Arguments:
+    - message (str): The message to log.
+    - category (str): The name under which the message is counted in quiet mode.
+    """
+    if not _QUIET:
+        print(message)
+        return
+    with _ITEM_COUNTS_LOCK:
+        _ITEM_COUNTS[category] += 1
+
 
+def print_item_counts():
+    """
+    Logs and resets the number of messages counted by log_item in quiet mode.
+    """
+    with _ITEM_COUNTS_LOCK:
+        counts = dict(_ITEM_COUNTS)
+        _ITEM_COUNTS.clear()
+    for category, count in counts.items():
+        print(f"{category}: {count} message(s) not logged (quiet mode)")
+
+
+def close_logs():
+    """
+    Writes the pending messages, closes the log file and restores the standard outputs.
+    Registered with atexit, so the end of the log is kept when a job crashes.
+    """
+    global _LOGGER
+    if _LOGGER is None:
+        return
+    print_item_counts()
+    sys.stdout = sys.__stdout__
+    sys.stderr = sys.__stderr__
+    _LOGGER.close()
+    _LOGGER = None
+
+
+def init_logs(log_file_name: str, quiet: bool = None):
+    """
+    Redirects stdout and stderr to the terminal and to a timestamped log file in ./logs.
+
+    Arguments:
+    - log_file_name (str): The prefix of the log file name.
+    - quiet (bool): If True, messages logged with log_item are only counted. Defaults to the LOG_QUIET environment variable.
+    """
+    global _LOGGER, _QUIET
+    close_logs()
+    if quiet is None:
+        quiet = os.getenv("LOG_QUIET", "0") == "1"
+    _QUIET = quiet
 
-def init_logs(log_file_name: str):
     logs_dir = "logs"
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
     os.makedirs(logs_dir, exist_ok=True)
     full_log_file_name = f"{log_file_name}-{timestamp}.log"
     log_filename = os.path.join(logs_dir, full_log_file_name)
 
-    log_file = open(log_filename, "w", encoding="utf-8")
-    sys.stdout = LoggerDualOutput(log_file)
-    sys.stderr = LoggerDualOutput(log_file)
+    # A job run by the worker daemon can start several times in the same second, each run keeps its own log
+    for index in itertools.count(1):
+        try:
+            log_file = open(log_filename, "x", encoding="utf-8")
+            break
+        except FileExistsError:
+            log_filename = os.path.join(
+                logs_dir, f"{log_file_name}-{timestamp}-{index}.log"
+            )
+    _LOGGER = BufferedLogWriter(log_file)
+    sys.stdout = LogStream(_LOGGER)
+    sys.stderr = LogStream(_LOGGER)
+    return log_filename
+
+
+atexit.register(close_logs)
@@ -0,0 +1,470 @@
+import ast
+import builtins
+import functools
+import inspect
+import operator
+
+import numpy as np
+import pandas as pd
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+UNARY_OPERATORS = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+# Characters after which a lambda written in a FIELD_MAPPING line can end
+_LAMBDA_END_CHARACTERS = ",)}]#\n"
+
+# Number of lambdas whose parsed source is kept, so chunked calls of map_fields only parse each lambda once
+# and long-running workers do not keep every lambda they have seen
+LAMBDA_CACHE_SIZE = 256
+
+# Integer results of this magnitude may have wrapped around in 64 bits, where Python integers grow
+INTEGER_RESULT_LIMIT = 2**62
+
+
+class UnsupportedExpression(Exception):
+    """Raised when a row function cannot be rewritten as a vectorized expression."""
+
+
+@functools.lru_cache(maxsize=LAMBDA_CACHE_SIZE)
+def _find_lambda_node(code):
+    """
+    Retrieves the AST of a lambda function from its source code.
+
+    Arguments:
+    - code (CodeType): The code object of the lambda function to analyze.
+
+    Returns:
+    - ast.Lambda or None: The lambda node, or None if the source is unavailable or ambiguous.
+    """
+    if code.co_name != "<lambda>":
+        return None
+    try:
+        lines, _ = inspect.getsourcelines(code)
+    except (OSError, TypeError):
+        return None
+
+    source = "".join(lines)
+    candidates = {}
+    start = source.find("lambda")
+    while start != -1:
+        ends = [len(source)] + [
+            index
+            for index in range(len(source) - 1, start, -1)
+            if source[index] in _LAMBDA_END_CHARACTERS
+        ]
+        for end in ends:
+            try:
+                tree = ast.parse(source[start:end].strip(), mode="eval")
+            except SyntaxError:
+                continue
+            if isinstance(tree.body, ast.Lambda):
+                if _same_code(tree, code):
+                    candidates[ast.dump(tree.body)] = tree.body
+                break
+        start = source.find("lambda", start + len("lambda"))
+
+    # Several different lambdas with the same names and constants on the same lines cannot be told apart
+    if len(candidates) != 1:
+        return None
+    return next(iter(candidates.values()))
+
+
+def _same_code(tree, code):
+    """
+    Checks that a parsed lambda uses the same names and constants as the running function.
+    Bytecode is not compared as it depends on the context the lambda was compiled in.
+
+    Arguments:
+    - tree (ast.Expression): The parsed lambda expression.
+    - code (CodeType): The code object of the running function.
+
+    Returns:
+    - bool: True if the parsed lambda can be the source of the running function.
+    """
+    try:
+        compiled = compile(tree, "<mapping>", "eval")
+    except (SyntaxError, ValueError):
+        return False
+    for constant in compiled.co_consts:
+        if inspect.iscode(constant):
+            return (
+                constant.co_names == code.co_names
+                and constant.co_varnames == code.co_varnames
+                and constant.co_consts == code.co_consts
+            )
+    return False
+
+
+def _check_globals(transformation, node):
+    """
+    Ensures the names used by the lambda resolve to pandas and builtins, as assumed by the rewrite.
+
+    Arguments:
+    - transformation (callable): The lambda function.
+    - node (ast.Lambda): Its AST.
+
+    Raises:
+    - UnsupportedExpression: If a name is shadowed or unknown.
+    """
+    arguments = {argument.arg for argument in node.args.args}
+    for child in ast.walk(node.body):
+        if isinstance(child, ast.Name) and child.id not in arguments:
+            if child.id == "pd":
+                if transformation.__globals__.get("pd") is not pd:
+                    raise UnsupportedExpression("pd is not pandas")
+            elif child.id == "str":
+                if transformation.__globals__.get("str", builtins.str) is not str:
+                    raise UnsupportedExpression("str is shadowed")
+            else:
+                raise UnsupportedExpression(f"Unknown name: {child.id}")
+
+
+def analyze_row_function(transformation):
+    """
+    Analyzes a FIELD_MAPPING row function and returns its AST if it can be vectorized.
+
+    Supported shapes are column access (row["X"]), the row index, constants, arithmetic,
+    str() casts, f-strings without conversions, strftime on dates and pd.to_datetime(...).strftime(...).
+
+    Arguments:
+    - transformation (callable): A function taking (row, row_index).
+
+    Returns:
+    - ast.Lambda or None: The lambda node if every part of it is supported, None otherwise.
+    """
+    code = getattr(transformation, "__code__", None)
+    if code is None:
+        return None
+
+    node = _find_lambda_node(code)
+    if node is not None:
+        args = node.args
+        if (
+            len(args.args) != 2
+            or args.vararg
+            or args.kwarg
+            or args.kwonlyargs
+            or args.defaults
+            or transformation.__closure__
+        ):
+            node = None
+    if node is not None:
+        try:
+            _check_globals(transformation, node)
+            _check_node(node.body)
+        except UnsupportedExpression:
+            node = None
+    return node
+
+
+def reads_row_keys_only(transformation):
+    """
+    Checks that a row function only reads its row as row["COLUMN"], so it can receive a dictionary
+    of the row values instead of a Series.
+
+    Arguments:
+    - transformation (callable): A function taking (row, row_index).
+
+    Returns:
+    - bool: True if the function is a lambda whose row argument is only used with constant keys.
+    """
+    code = getattr(transformation, "__code__", None)
+    if code is None:
+        return False
+    node = _find_lambda_node(code)
+    if node is None or len(node.args.args) != 2:
+        return False
+    row_name = node.args.args[0].arg
+    key_access = set()
+    for child in ast.walk(node.body):
+        # Nested scopes could bind another value to the row name
+        if isinstance(child, (ast.Lambda, ast.NamedExpr, ast.comprehension)):
+            return False
+        if (
+            isinstance(child, ast.Subscript)
+            and _is_name(child.value, row_name)
+            and isinstance(child.slice, ast.Constant)
+        ):
+            key_access.add(id(child.value))
+    return all(
+        id(child) in key_access
+        for child in ast.walk(node.body)
+        if _is_name(child, row_name)
+    )
+
+
+def _check_node(node):
+    """
+    Recursively checks that an expression only uses supported shapes.
+
+    Arguments:
+    - node (ast.AST): The expression to check.
+
+    Raises:
+    - UnsupportedExpression: If a part of the expression is not supported.
+    """
+    if isinstance(node, (ast.Constant, ast.Name)):
+        return
+    if isinstance(node, ast.Subscript):
+        if not isinstance(node.value, ast.Name) or not isinstance(
+            node.slice, ast.Constant
+        ):
+            raise UnsupportedExpression("Only row['COLUMN'] access is supported")
+        return
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        _check_node(node.left)
+        _check_node(node.right)
+        return
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        _check_node(node.operand)
+        return
+    if isinstance(node, ast.JoinedStr):
+        for value in node.values:
+            if isinstance(value, ast.FormattedValue):
+                if value.conversion != -1:
+                    raise UnsupportedExpression(
+                        "f-string conversions are not supported"
+                    )
+                if value.format_spec is not None and not all(
+                    isinstance(part, ast.Constant) for part in value.format_spec.values
+                ):
+                    raise UnsupportedExpression(
+                        "Dynamic format specs are not supported"
+                    )
+                _check_node(value.value)
+        return
+    if isinstance(node, ast.Call) and not node.keywords and len(node.args) == 1:
+        if _is_name(node.func, "str"):
+            _check_node(node.args[0])
+            return
+        if _is_pandas_function(node.func, "to_datetime"):
+            _check_node(node.args[0])
+            return
+        if (
+            isinstance(node.func, ast.Attribute)
+            and node.func.attr == "strftime"
+            and isinstance(node.args[0], ast.Constant)
+        ):
+            _check_node(node.func.value)
+            return
+    raise UnsupportedExpression(f"Unsupported expression: {ast.dump(node)}")
+
+
+def _is_name(node, name):
+    return isinstance(node, ast.Name) and node.id == name
+
+
+def _is_pandas_function(node, name):
+    return (
+        isinstance(node, ast.Attribute)
+        and node.attr == name
+        and _is_name(node.value, "pd")
+    )
+
+
+def _to_datetime(values):
+    """
+    Converts values to datetimes only when it is guaranteed to match a per-value pd.to_datetime.
+
+    Arguments:
+    - values (pd.Series): The values to convert.
+
+    Returns:
+    - pd.Series: A datetime64 Series.
+
+    Raises:
+    - UnsupportedExpression: If values are strings (parsed differently in bulk) or contain missing dates.
+    """
+    if not isinstance(values, pd.Series):
+        raise UnsupportedExpression("pd.to_datetime needs a column")
+    if not pd.api.types.is_datetime64_any_dtype(values):
+        if pd.api.types.infer_dtype(values, skipna=False) not in (
+            "datetime",
+            "datetime64",
+        ):
+            raise UnsupportedExpression("Only date values can be converted in bulk")
+        values = pd.to_datetime(values)
+    if values.isna().any():
+        raise UnsupportedExpression("Missing dates are handled by the row path")
+    return values
+
+
+def row_values(values):
+    """
+    Returns a column with the values a row function would receive, so operations give the same results.
+    Small integers (as set by compact_dtypes) are widened so arithmetic cannot overflow, and categories,
+    nullable and string dtypes are read as Python objects, as when iterating over the rows.
+
+    Arguments:
+    - values (pd.Series): The column of the input DataFrame.
+
+    Returns:
+    - pd.Series: The column to evaluate the expression on.
+    """
+    dtype = values.dtype
+    if isinstance(dtype, np.dtype):
+        if dtype.kind in "iu" and dtype.itemsize < 8:
+            return values.astype(np.int64)
+        return values
+    return values.astype(object)
+
+
+def _check_integer_overflow(operation, *operands):
+    """
+    Ensures an operation on 64-bit integer columns cannot wrap around, as Python integers would keep growing.
+    The operation is computed again in floating point to get the magnitude of its results.
+
+    Arguments:
+    - operation (callable): The operator.
+    - operands (pd.Series or scalar): Its operands.
+
+    Raises:
+    - UnsupportedExpression: If a result can exceed INTEGER_RESULT_LIMIT.
+    """
+    if not any(
+        isinstance(operand, pd.Series)
+        and isinstance(operand.dtype, np.dtype)
+        and operand.dtype.kind in "iu"
+        for operand in operands
+    ):
+        return
+    if not all(
+        isinstance(operand, (int, np.integer))
+        or (isinstance(operand, pd.Series) and operand.dtype.kind in "iub")
+        for operand in operands
+    ):
+        return
+    with np.errstate(all="ignore"):
+        magnitude = operation(
+            *(
+                (
+                    operand.astype(np.float64)
+                    if isinstance(operand, pd.Series)
+                    else float(operand)
+                )
+                for operand in operands
+            )
+        )
+    magnitude = np.abs(np.asarray(magnitude, dtype=np.float64))
+    if magnitude.size and not (magnitude < INTEGER_RESULT_LIMIT).all():
+        raise UnsupportedExpression("Integer overflow is handled by the row path")
+
+
+def _evaluate(node, df, row_name, index_name):
+    """
+    Evaluates a checked expression against whole columns.
+
+    Arguments:
+    - node (ast.AST): The expression to evaluate.
+    - df (pd.DataFrame): The input DataFrame.
+    - row_name (str): The name of the row argument of the lambda.
+    - index_name (str): The name of the row index argument of the lambda.
+
+    Returns:
+    - pd.Series or scalar: The result for all rows.
+    """
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name):
+        if node.id == index_name:
+            return pd.Series(df.index, index=df.index)
+        raise UnsupportedExpression(f"Unknown name: {node.id}")
+    if isinstance(node, ast.Subscript):
+        if node.value.id != row_name:
+            raise UnsupportedExpression(f"Unknown name: {node.value.id}")
+        return row_values(df[node.slice.value])
+    if isinstance(node, ast.BinOp):
+        left = _evaluate(node.left, df, row_name, index_name)
+        right = _evaluate(node.right, df, row_name, index_name)
+        if isinstance(node.op, (ast.Div, ast.FloorDiv, ast.Mod)) and bool(
+            (right == 0).any() if isinstance(right, pd.Series) else right == 0
+        ):
+            # Python raises ZeroDivisionError where NumPy returns inf
+            raise UnsupportedExpression("Division by zero is handled by the row path")
+        _check_integer_overflow(BINARY_OPERATORS[type(node.op)], left, right)
+        return BINARY_OPERATORS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp):
+        operand = _evaluate(node.operand, df, row_name, index_name)
+        _check_integer_overflow(UNARY_OPERATORS[type(node.op)], operand)
+        return UNARY_OPERATORS[type(node.op)](operand)
+    if isinstance(node, ast.JoinedStr):
+        result = ""
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                result = result + value.value
+                continue
+            spec = (
+                "".join(part.value for part in value.format_spec.values)
+                if value.format_spec
+                else ""
+            )
+            result = result + _format(
+                _evaluate(value.value, df, row_name, index_name), spec
+            )
+        return result
+    if _is_name(node.func, "str"):
+        return _format(_evaluate(node.args[0], df, row_name, index_name), "")
+    if _is_pandas_function(node.func, "to_datetime"):
+        return _to_datetime(_evaluate(node.args[0], df, row_name, index_name))
+    values = _evaluate(node.func.value, df, row_name, index_name)
+    if not isinstance(values, pd.Series) or not pd.api.types.is_datetime64_any_dtype(
+        values
+    ):
+        raise UnsupportedExpression("strftime needs a date column")
+    values = _to_datetime(values)
+    return values.dt.strftime(node.args[0].value).astype(object)
+
+
+def _format(values, spec):
+    """
+    Formats values as format(value, spec) would, value by value, without building rows.
+
+    Arguments:
+    - values (pd.Series or scalar): The values to format.
+    - spec (str): The format spec, "" for a plain str().
+
+    Returns:
+    - pd.Series or str: The formatted values.
+    """
+    if not isinstance(values, pd.Series):
+        return format(values, spec)
+    if spec == "":
+        return values.map(str).astype(object)
+    return values.map(lambda value: format(value, spec)).astype(object)
+
+
+def vectorize_row_function(transformation, df: pd.DataFrame):
+    """
+    Evaluates a FIELD_MAPPING row function for all rows at once when its shape is supported.
+
+    Arguments:
+    - transformation (callable): A function taking (row, row_index).
+    - df (pd.DataFrame): The input DataFrame.
+
+    Returns:
+    - pd.Series, scalar or None: The values of the new column, or None if the function must run row by row.
+    """
+    node = analyze_row_function(transformation)
+    if node is None:
+        return None
+    row_name, index_name = (argument.arg for argument in node.args.args)
+    try:
+        result = _evaluate(node.body, df, row_name, index_name)
+    except Exception:
+        # The row path runs the original function and raises the real error, if any
+        return None
+    if isinstance(result, pd.Series) and result.dtype == object:
+        result = result.infer_objects()
+    return result
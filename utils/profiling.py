@@ -0,0 +1,153 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import tracemalloc
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:
+    SamplingProfiler = None
+
+# JOB_PROFILE=1 (or the --profile flag) runs the job under cProfile.
+# A comma separated list of modes can be given instead: cpu, sampling (pyinstrument), memory (tracemalloc)
+PROFILE_ENV_VARIABLE = "JOB_PROFILE"
+PROFILE_FLAG = "--profile"
+PROFILE_MODES = ("cpu", "sampling", "memory")
+PROFILE_TOP_N = 30
+TRACEMALLOC_FRAMES = 10
+
+# Modes of the profiler running the job, read by the scheduler
+_ACTIVE_MODES = set()
+
+
+def profiling_modes():
+    """
+    Reads the profiling modes from the --profile[=modes] command line flag or the JOB_PROFILE environment variable.
+
+    Returns:
+    - set: The enabled modes, empty when the profiling is disabled.
+    """
+    value = os.getenv(PROFILE_ENV_VARIABLE, "0")
+    for argument in sys.argv[1:]:
+        if argument == PROFILE_FLAG:
+            value = "cpu"
+        elif argument.startswith(f"{PROFILE_FLAG}="):
+            value = argument.split("=", 1)[1]
+    if value in ("", "0"):
+        return set()
+    if value == "1":
+        return {"cpu"}
+
+    modes = {mode.strip() for mode in value.split(",") if mode.strip()}
+    unknown = modes - set(PROFILE_MODES)
+    if unknown:
+        print(f"Unknown profiling modes ignored: {', '.join(sorted(unknown))}")
+    return modes & set(PROFILE_MODES)
+
+
+def profiling_active():
+    """
+    Returns:
+    - bool: True while a job runs under profiled. cProfile and pyinstrument only measure the thread they are
+      started in, and tracemalloc does not see worker processes, so run_blocks then runs the blocks
+      one after another in the main thread.
+    """
+    return bool(_ACTIVE_MODES)
+
+
+def _write_cpu_report(profiler, base_path, top_n):
+    stats_path = f"{base_path}.pstats"
+    profiler.dump_stats(stats_path)
+    report = io.StringIO()
+    pstats.Stats(stats_path, stream=report).sort_stats("cumulative").print_stats(top_n)
+    report_path = f"{base_path}.profile.txt"
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(report.getvalue())
+    print(f"CPU profile written to {stats_path} and {report_path}")
+
+
+def _write_sampling_report(profiler, base_path):
+    report_path = f"{base_path}.profile.txt"
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(profiler.output_text(unicode=True, color=False))
+    html_path = f"{base_path}.profile.html"
+    with open(html_path, "w", encoding="utf-8") as f:
+        f.write(profiler.output_html())
+    print(f"Sampling profile written to {report_path} and {html_path}")
+
+
+def _write_memory_report(before, after, base_path, top_n):
+    report_path = f"{base_path}.memory.txt"
+    differences = after.compare_to(before, "lineno")
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(
+            f"Top {top_n} memory allocations by line (size and count differences)\n"
+        )
+        for difference in differences[:top_n]:
+            f.write(f"{difference}\n")
+    print(f"Memory profile written to {report_path}")
+
+
+def profiled(main_func, base_path, modes, top_n=PROFILE_TOP_N):
+    """
+    Wraps a job main function so it runs under the requested profilers.
+    The reports are written even if the job fails, to files named after base_path:
+    - cpu: .pstats (for pstats or snakeviz) and .profile.txt with the top N functions by cumulative time;
+    - sampling: .profile.txt and .profile.html from pyinstrument, cProfile being used when it is not installed;
+    - memory: .memory.txt with the top N lines by allocated memory between the start and the end of the job.
+    The blocks of jobs run with run_blocks are run one after another in the main thread while profiling,
+    so they are all measured (see profiling_active).
+
+    Arguments:
+    - main_func (callable): The main function of the job.
+    - base_path (str): The path of the reports without extension, usually the log file path.
+    - modes (set): The profiling modes, as returned by profiling_modes.
+    - top_n (int): The number of entries of the text reports.
+
+    Returns:
+    - callable: The wrapped main function.
+    """
+    modes = set(modes)
+    if "sampling" in modes and SamplingProfiler is None:
+        print("pyinstrument is not installed, cProfile is used instead")
+        modes.discard("sampling")
+        modes.add("cpu")
+    if "sampling" in modes:
+        # Both profilers would measure each other, the sampling profiler has the lowest overhead
+        modes.discard("cpu")
+
+    def run():
+        memory_before = None
+        if "memory" in modes:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            memory_before = tracemalloc.take_snapshot()
+        cpu_profiler = cProfile.Profile() if "cpu" in modes else None
+        sampling_profiler = SamplingProfiler() if "sampling" in modes else None
+
+        print(f"Profiling job: {', '.join(sorted(modes))}")
+        _ACTIVE_MODES.update(modes)
+        if sampling_profiler:
+            sampling_profiler.start()
+        if cpu_profiler:
+            cpu_profiler.enable()
+        try:
+            return main_func()
+        finally:
+            _ACTIVE_MODES.clear()
+            if cpu_profiler:
+                cpu_profiler.disable()
+            if sampling_profiler:
+                sampling_profiler.stop()
+            # Taken before writing the other reports, so their allocations are not counted
+            if memory_before is not None:
+                memory_after = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                _write_memory_report(memory_before, memory_after, base_path, top_n)
+            if cpu_profiler:
+                _write_cpu_report(cpu_profiler, base_path, top_n)
+            if sampling_profiler:
+                _write_sampling_report(sampling_profiler, base_path)
+
+    return run
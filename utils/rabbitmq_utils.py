@@ -1,34 +1,313 @@
 import os
 import json
+import time
+import atexit
 import base64
 import requests
+import pandas as pd
+import pika
 
+RABBITMQ_AMQP_PORT = 5672
+RABBITMQ_BATCH_SIZE = 500
+# Seconds to wait for the broker to open the connection or confirm a batch
+RABBITMQ_CONFIRM_TIMEOUT = 60
 
-def send_message_to_rabbitmq(payload: dict):
+_PUBLISHER = None
+_HTTP_SESSION = None
+
+
+def amqp_connection_parameters():
     """
-    Sends a message (JSON payload) to a RabbitMQ exchange using the HTTP API.
+    Returns the AMQP connection settings read from the RABBITMQ_* environment variables.
+
+    Returns:
+    - pika.ConnectionParameters: The connection settings.
+    """
+    credentials = pika.PlainCredentials(
+        os.getenv("RABBITMQ_USER"), os.getenv("RABBITMQ_PASS")
+    )
+    return pika.ConnectionParameters(
+        host=os.getenv("RABBITMQ_HOST"),
+        port=int(os.getenv("RABBITMQ_PORT") or RABBITMQ_AMQP_PORT),
+        virtual_host=os.getenv("RABBITMQ_VHOST", "/"),
+        credentials=credentials,
+        heartbeat=600,
+        blocked_connection_timeout=300,
+    )
+
+
+class RabbitMQPublisher:
+    """
+    Publishes messages to a RabbitMQ exchange over AMQP 0-9-1, on a single connection and channel.
+
+    The channel is in publisher confirm mode: messages are sent without waiting, and the broker confirms
+    them asynchronously. Every batch_size messages, the publisher waits for the confirmation of the whole batch,
+    and raises an error if the broker refused (nack) or could not route (mandatory flag) any of them,
+    so failures are not lost. Waiting for each batch also slows down the producer when the broker cannot keep up.
+
+    The connection is checked before each batch, and opened again if the broker or the network closed it
+    while the job was not publishing. A connection lost with unconfirmed messages raises an error.
 
     Environment Variables (must be set beforehand):
     - RABBITMQ_USER: Username for RabbitMQ authentication.
     - RABBITMQ_PASS: Password for RabbitMQ authentication.
     - RABBITMQ_HOST: Hostname or IP of the RabbitMQ server.
-    - RABBITMQ_EXCHANGE: Name of the exchange to publish the message to.
+    - RABBITMQ_PORT (optional): AMQP port of the RabbitMQ server. Defaults to 5672.
+    - RABBITMQ_VHOST (optional): Virtual host. Defaults to "/".
+    - RABBITMQ_EXCHANGE: Name of the exchange to publish the messages to.
+    """
+
+    def __init__(
+        self, batch_size=RABBITMQ_BATCH_SIZE, timeout=RABBITMQ_CONFIRM_TIMEOUT
+    ):
+        self.exchange = os.getenv("RABBITMQ_EXCHANGE")
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.published = 0
+        self.connection = None
+        self.channel = None
+        self.connect()
+
+    @property
+    def pending(self):
+        """
+        The number of messages sent and not confirmed yet.
+        """
+        return len(self.unconfirmed)
+
+    def connect(self):
+        """
+        Opens the connection and a channel in confirm mode, waiting until the broker accepts them.
+        """
+        # A connection whose channel was closed by the broker is still open
+        self._close_connection()
+        self.channel = None
+        self.error = None
+        self.delivery_tag = 0
+        self.unconfirmed = set()
+        self.nacked = 0
+        self.returned = []
+        self.connection = pika.SelectConnection(
+            amqp_connection_parameters(),
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_error,
+            on_close_callback=self._on_connection_error,
+        )
+        self._run_until(lambda: self.channel is not None, "open the connection")
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_channel_open(self, channel):
+        channel.add_on_return_callback(self._on_return)
+        channel.add_on_close_callback(self._on_connection_error)
+        channel.confirm_delivery(
+            ack_nack_callback=self._on_confirmation,
+            callback=lambda frame: self._on_confirm_mode(channel),
+        )
+
+    def _on_confirm_mode(self, channel):
+        self.channel = channel
+        self.connection.ioloop.stop()
+
+    def _on_connection_error(self, source, error):
+        # Called when the connection cannot be opened, or the connection or channel is closed
+        self.error = error
+        self.channel = None
+        self.connection.ioloop.stop()
+
+    def _on_return(self, channel, method, properties, body):
+        # Sent by the broker before the confirmation of a mandatory message no queue received
+        self.returned.append(method.routing_key)
+
+    def _on_confirmation(self, frame):
+        tag = frame.method.delivery_tag
+        if frame.method.multiple:
+            confirmed = {
+                delivery_tag for delivery_tag in self.unconfirmed if delivery_tag <= tag
+            }
+        else:
+            confirmed = {tag} & self.unconfirmed
+        self.unconfirmed -= confirmed
+        if isinstance(frame.method, pika.spec.Basic.Nack):
+            self.nacked += len(confirmed)
+        if not self.unconfirmed:
+            self.connection.ioloop.stop()
+
+    def _run_until(self, done, action):
+        """
+        Runs the events of the connection until done() is true, raising an error if the connection
+        fails or the broker does not answer within the timeout.
+        """
+        timed_out = []
+        ioloop = self.connection.ioloop
+        timer = ioloop.call_later(
+            self.timeout, lambda: timed_out.append(True) or ioloop.stop()
+        )
+        try:
+            while not done() and self.error is None and not timed_out:
+                ioloop.start()
+        finally:
+            ioloop.remove_timeout(timer)
+        if self.error is not None:
+            raise RuntimeError(f"RabbitMQ could not {action}: {self.error!r}")
+        if timed_out:
+            raise RuntimeError(f"RabbitMQ did not {action} within {self.timeout} s")
+
+    def _check_connection(self):
+        """
+        Processes the events received since the last batch, so a connection closed meanwhile
+        (heartbeat timeout, broker restart) is detected, and opens it again.
+        """
+        ioloop = self.connection.ioloop
+        if self.error is None and not self.connection.is_closed:
+            ioloop.call_later(0, ioloop.stop)
+            ioloop.start()
+        if self.error is not None or self.connection.is_closed:
+            print(f"RabbitMQ connection closed ({self.error!r}), reconnecting")
+            self.connect()
+
+    def publish(self, body, routing_key=""):
+        """
+        Publishes a message. It is confirmed with the rest of its batch.
+
+        Arguments:
+        - body (str | bytes): The message body.
+        - routing_key (str): The routing key of the message.
+        """
+        if not self.unconfirmed:
+            self._check_connection()
+        elif self.error is not None:
+            raise RuntimeError(
+                f"RabbitMQ connection closed with {self.pending} unconfirmed message(s): {self.error!r}"
+            )
+        self.channel.basic_publish(
+            exchange=self.exchange,
+            routing_key=routing_key,
+            body=body,
+            properties=pika.BasicProperties(
+                content_type="application/json", delivery_mode=2
+            ),
+            mandatory=True,
+        )
+        self.delivery_tag += 1
+        self.unconfirmed.add(self.delivery_tag)
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Waits for the broker to confirm the pending messages.
+
+        Raises:
+        - RuntimeError: If the connection is lost, or messages are refused or not routed.
+        """
+        if not self.unconfirmed:
+            return
+        count = self.pending
+        try:
+            self._run_until(
+                lambda: not self.unconfirmed,
+                f"confirm {count} message(s)",
+            )
+        except RuntimeError:
+            self.unconfirmed.clear()
+            raise
+        returned, self.returned = self.returned, []
+        nacked, self.nacked = self.nacked, 0
+        if nacked:
+            raise RuntimeError(f"{nacked} message(s) refused by RabbitMQ")
+        if returned:
+            raise RuntimeError(
+                f"{len(returned)} message(s) not routed by exchange {self.exchange}"
+                f" (routing keys: {sorted(set(returned))})"
+            )
+        self.published += count
+
+    def close(self):
+        """
+        Confirms the pending messages and closes the connection.
+        """
+        if self.connection is None or self.connection.is_closed:
+            return
+        try:
+            if self.error is None:
+                self.flush()
+        finally:
+            self._close_connection()
+
+    def _close_connection(self):
+        """
+        Closes the connection if it is still open, and waits for the broker to close it.
+        """
+        connection = self.connection
+        if connection is None or connection.is_closed or connection.is_closing:
+            return
+        timed_out = []
+        timer = connection.ioloop.call_later(
+            self.timeout, lambda: timed_out.append(True) or connection.ioloop.stop()
+        )
+        connection.close()
+        try:
+            while not connection.is_closed and not timed_out:
+                connection.ioloop.start()
+        finally:
+            connection.ioloop.remove_timeout(timer)
+
+
+def get_rabbitmq_publisher():
+    """
+    Returns the AMQP publisher of the job, connected on first use and closed when the job ends.
+
+    Returns:
+    - RabbitMQPublisher: The publisher.
+    """
+    global _PUBLISHER
+    if _PUBLISHER is None:
+        _PUBLISHER = RabbitMQPublisher()
+        atexit.register(_PUBLISHER.close)
+    return _PUBLISHER
+
+
+def close_rabbitmq_publisher():
+    """
+    Confirms the pending messages and closes the publisher of the job, a new one is connected on next use.
+    Called by the worker daemon at the end of each job, as the next job can use other credentials.
+    """
+    global _PUBLISHER
+    if _PUBLISHER is None:
+        return
+    publisher, _PUBLISHER = _PUBLISHER, None
+    atexit.unregister(publisher.close)
+    publisher.close()
+
+
+def _use_amqp():
+    """
+    AMQP is used unless RABBITMQ_PROTOCOL is set to "http", to go through the HTTP API of the management plugin.
+    """
+    return os.getenv("RABBITMQ_PROTOCOL", "amqp") != "http"
 
-    Arguments:
-    - payload (dict): The message payload to send (will be encoded as a JSON string).
 
-    This function sends the payload to RabbitMQ using its HTTP API on port 15672.
+def _send_message_over_http(body: str, routing_key=""):
     """
+    Sends a message to a RabbitMQ exchange using the HTTP API of the management plugin on port 15672.
+    The HTTP connection is kept open between messages, and an error is raised if the message is refused or not routed.
+    """
+    global _HTTP_SESSION
     user = os.getenv("RABBITMQ_USER")
     password = os.getenv("RABBITMQ_PASS")
     host = os.getenv("RABBITMQ_HOST")
     exchange = os.getenv("RABBITMQ_EXCHANGE")
 
+    if _HTTP_SESSION is None:
+        _HTTP_SESSION = requests.Session()
+
     # Construct the message format required by RabbitMQ HTTP API
     message = {
         "properties": {},
-        "routing_key": "",
-        "payload": json.dumps(payload),
+        "routing_key": routing_key,
+        "payload": body,
         "payload_encoding": "string",
     }
 
@@ -41,5 +320,135 @@ def send_message_to_rabbitmq(payload: dict):
     }
 
     # Send the POST request to RabbitMQ
-    response = requests.post(url, headers=headers, json=message)
+    response = _HTTP_SESSION.post(url, headers=headers, json=message)
+    response.raise_for_status()
+    if not response.json().get("routed", False):
+        raise RuntimeError(f"Message was not routed by exchange {exchange}")
+
+
+def send_message_to_rabbitmq(payload: dict):
+    """
+    Sends a message (JSON payload) to a RabbitMQ exchange.
+
+    The message is published over AMQP on the connection kept for the whole job, and confirmed by the broker.
+    If RABBITMQ_PROTOCOL is set to "http", the HTTP API on port 15672 is used instead.
+
+    Environment Variables (must be set beforehand):
+    - RABBITMQ_USER: Username for RabbitMQ authentication.
+    - RABBITMQ_PASS: Password for RabbitMQ authentication.
+    - RABBITMQ_HOST: Hostname or IP of the RabbitMQ server.
+    - RABBITMQ_PORT (optional): AMQP port of the RabbitMQ server. Defaults to 5672.
+    - RABBITMQ_EXCHANGE: Name of the exchange to publish the message to.
+
+    Arguments:
+    - payload (dict): The message payload to send (will be encoded as a JSON string).
+    """
+    if _use_amqp():
+        publisher = get_rabbitmq_publisher()
+        publisher.publish(json.dumps(payload))
+        publisher.flush()
+    else:
+        _send_message_over_http(json.dumps(payload))
     print(f"Message: {payload}")
+
+
+def send_messages_to_rabbitmq(payloads, routing_key=""):
+    """
+    Sends many messages (JSON payloads) to a RabbitMQ exchange on a single connection.
+
+    Payloads are consumed one by one, so a generator can be given without building all the messages in memory.
+    Messages are confirmed by batches of RABBITMQ_BATCH_SIZE, and publishing waits for each confirmation,
+    so the producer slows down when the broker cannot keep up.
+
+    Environment Variables: same as send_message_to_rabbitmq.
+
+    Arguments:
+    - payloads (iterable of dict): The message payloads to send (each one encoded as a JSON string).
+    - routing_key (str): The routing key of the messages.
+
+    Returns:
+    - int: The number of messages sent.
+    """
+    count = 0
+    if _use_amqp():
+        publisher = get_rabbitmq_publisher()
+        for payload in payloads:
+            publisher.publish(json.dumps(payload), routing_key)
+            count += 1
+        publisher.flush()
+    else:
+        for payload in payloads:
+            _send_message_over_http(json.dumps(payload), routing_key)
+            count += 1
+    print(f"{count} message(s) sent to RabbitMQ")
+    return count
+
+
+def send_dataframe_to_rabbitmq(
+    df, routing_key_column=None, max_rate=None, chunk_size=10000
+):
+    """
+    Sends each row of a DataFrame as a JSON message to a RabbitMQ exchange.
+
+    Rows are serialised column-wise by pandas (to_json with one record per line) instead of row by row,
+    then published on the single connection of the job and confirmed by batches.
+
+    Environment Variables: same as send_message_to_rabbitmq.
+
+    Arguments:
+    - df (pd.DataFrame | iterable of pd.DataFrame): The rows to send, or the chunks of a streamed DataFrame.
+    - routing_key_column (str, optional): A column holding the routing key of each row. Defaults to an empty routing key.
+    - max_rate (float, optional): The maximum number of messages per second. Defaults to no limit.
+    - chunk_size (int): The number of rows serialised at once.
+
+    Returns:
+    - dict: Throughput counters: {"messages": int, "seconds": float, "messages_per_second": float}.
+    """
+    if isinstance(df, pd.DataFrame):
+        chunks = (
+            df.iloc[start : start + chunk_size]
+            for start in range(0, len(df), chunk_size)
+        )
+    else:
+        chunks = df
+
+    publisher = get_rabbitmq_publisher() if _use_amqp() else None
+    count = 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        # Only "\n" separates the records: splitlines would also split values holding U+2028, \x1c...,
+        # which pandas leaves unescaped
+        bodies = chunk.to_json(
+            orient="records", lines=True, date_format="iso", force_ascii=False
+        ).split("\n")
+        if bodies[-1] == "":
+            bodies.pop()
+        if len(bodies) != len(chunk):
+            raise ValueError(
+                f"{len(bodies)} JSON message(s) serialised for {len(chunk)} row(s)"
+            )
+        if routing_key_column:
+            routing_keys = chunk[routing_key_column].astype(str).tolist()
+        else:
+            routing_keys = [""] * len(bodies)
+
+        for body, routing_key in zip(bodies, routing_keys):
+            if publisher:
+                publisher.publish(body, routing_key)
+            else:
+                _send_message_over_http(body, routing_key)
+            count += 1
+            if max_rate:
+                # Wait until the schedule of the rate limit catches up with the messages sent
+                delay = count / max_rate - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+    if publisher:
+        publisher.flush()
+
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"{count} row(s) sent to RabbitMQ in {elapsed:.2f} s ({rate:.0f} messages/s)")
+    return {"messages": count, "seconds": elapsed, "messages_per_second": rate}
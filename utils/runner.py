@@ -1,8 +1,18 @@
 import os
 import sys
 import traceback
+from utils.block_metrics import (
+    metrics_mode,
+    print_metrics_summary,
+    reset_metrics,
+    write_metrics,
+)
 from utils.logs_management import init_logs
-from utils.rabbitmq_utils import define_payload, send_message_to_rabbitmq
+from utils.profiling import profiled, profiling_modes
+from utils.rabbitmq_utils import send_message_to_rabbitmq
+
+# Outcome of the last job run by run_main in this process, read by the worker daemon
+_LAST_RUN = {}
 
 
 def run_main(main_func):
@@ -13,16 +23,35 @@ def run_main(main_func):
     Arguments:
         main_func (callable): The main function to execute.
     """
+    _LAST_RUN.clear()
     try:
         run_try_main(main_func)
+        _LAST_RUN["status"] = "ok"
     except Exception as e:
-        common_exception_handler(e)
+        _LAST_RUN["status"] = "failed"
+        _LAST_RUN["error"] = common_exception_handler(e)
+
+
+def pop_last_run():
+    """
+    Returns and forgets the outcome of the last job run by run_main.
+
+    Returns:
+        - dict: The status ("ok" or "failed"), log file and error of the job, empty if no job ran since the last call.
+    """
+    outcome = dict(_LAST_RUN)
+    _LAST_RUN.clear()
+    return outcome
 
 
 def run_try_main(main_func):
     """
     Retrieves the calling script's directory name to initialize the logger with a contextual name.
     Executes the given main function and prints start/end messages.
+    When the JOB_METRICS environment variable is set, the metrics of each block are printed at the end
+    and written to a JSON file next to the log, even if the job fails.
+    When the JOB_PROFILE environment variable or the --profile flag is set, the job runs under a profiler
+    and the reports are written next to the log.
 
     Arguments:
         - main_func (callable): The main function to execute.
@@ -30,11 +59,25 @@ def run_try_main(main_func):
     caller_path = sys.modules["__main__"].__file__
     caller_folder = os.path.basename(os.path.dirname(caller_path))
     log_file_name = f"{caller_folder}"
-    init_logs(log_file_name)
+    log_filename = init_logs(log_file_name)
+    _LAST_RUN["log"] = log_filename
 
     print("Starting job")
-    main_func()
-    print("Job completed successfully")
+    modes = profiling_modes()
+    if modes:
+        main_func = profiled(main_func, os.path.splitext(log_filename)[0], modes)
+    if not metrics_mode():
+        main_func()
+        print("Job completed successfully")
+        return
+
+    reset_metrics()
+    try:
+        main_func()
+        print("Job completed successfully")
+    finally:
+        print_metrics_summary()
+        write_metrics(f"{os.path.splitext(log_filename)[0]}.metrics.json")
 
 
 def common_exception_handler(e):
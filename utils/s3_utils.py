@@ -1,36 +1,172 @@
 import boto3
+import hashlib
+import json
 import os
+import threading
+import time
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.logs_management import log_item
 
+S3_MANIFEST_DIR = os.path.join("cache", "s3")
+S3_MAX_CONCURRENCY = 16
+MANIFEST_SAVE_INTERVAL = 100
 
-def download_s3_folder(local_folder, s3_prefix):
+MB = 1024**2
+
+# Clients are created once per process for each set of credentials, bucket and pool size
+_S3_CLIENTS = {}
+_S3_CLIENTS_LOCK = threading.Lock()
+
+
+def get_s3_client(max_pool_connections=S3_MAX_CONCURRENCY):
+    """
+    Returns an S3 client for the credentials set in the environment, created once per process.
+    Reusing the client avoids paying the session setup, the credential resolution and new TLS connections on every call.
+    Clients are thread-safe and can be shared by the threads of a transfer.
+
+    Environment Variables (must be set beforehand):
+    - AWS_ACCESS_KEY: AWS access key ID.
+    - AWS_SECRET_KEY: AWS secret access key.
+    - AWS_BUCKET: Name of the S3 bucket.
+
+    Arguments:
+    - max_pool_connections (int): The maximum number of open connections of the client. Defaults to 16.
+
+    Returns:
+    - botocore.client.S3: The S3 client.
+    """
+    AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY")
+    AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY")
+    BUCKET_NAME = os.getenv("AWS_BUCKET")
+
+    key = (AWS_ACCESS_KEY, AWS_SECRET_KEY, BUCKET_NAME, max_pool_connections)
+    with _S3_CLIENTS_LOCK:
+        if key not in _S3_CLIENTS:
+            _S3_CLIENTS[key] = boto3.client(
+                "s3",
+                aws_access_key_id=AWS_ACCESS_KEY,
+                aws_secret_access_key=AWS_SECRET_KEY,
+                config=Config(max_pool_connections=max_pool_connections),
+            )
+        return _S3_CLIENTS[key]
+
+
+def _transfer_config(file_size, max_concurrency=10):
+    """
+    Returns multipart settings suited to the size of a file.
+    Small files are sent in a single request, large files in bigger parts to limit the number of requests
+    (S3 accepts at most 10,000 parts per upload).
+
+    Arguments:
+    - file_size (int): The size of the file, in bytes.
+    - max_concurrency (int): The number of threads uploading the parts of a single file.
+
+    Returns:
+    - TransferConfig: The transfer settings.
+    """
+    if file_size < 100 * MB:
+        chunk_size = 8 * MB
+    elif file_size < 1024 * MB:
+        chunk_size = 16 * MB
+    else:
+        chunk_size = 64 * MB
+    chunk_size = max(chunk_size, -(-file_size // 10000))
+    return TransferConfig(
+        multipart_threshold=16 * MB,
+        multipart_chunksize=chunk_size,
+        max_concurrency=max_concurrency,
+    )
+
+
+def _print_transfer(source, target, file_size, elapsed):
+    throughput = file_size / MB / elapsed if elapsed > 0 else 0
+    log_item(
+        f"Uploaded {source} → {target} ({file_size / MB:.2f} MB in {elapsed:.2f} s, {throughput:.2f} MB/s)",
+        "S3 transfer reports",
+    )
+
+
+def _manifest_path(bucket, s3_prefix, local_folder):
+    """
+    Returns the path of the manifest recording the downloads of an S3 prefix into a local folder.
+    It is kept outside the local folder so it is not processed with the downloaded files.
+    """
+    key = f"{bucket}|{s3_prefix}|{os.path.abspath(local_folder)}"
+    name = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return os.path.join(S3_MANIFEST_DIR, f"{name}.json")
+
+
+def _load_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(temporary_path, path)
+
+
+def _is_up_to_date(local_path, obj, manifest_entry):
+    """
+    Checks whether a local file already matches a listed S3 object:
+    same size, and same ETag in the manifest or same modification time as the object.
+    """
+    if not os.path.exists(local_path):
+        return False
+    stat = os.stat(local_path)
+    if stat.st_size != obj["Size"]:
+        return False
+    if manifest_entry:
+        return manifest_entry.get("etag") == obj["ETag"]
+    return int(stat.st_mtime) == int(obj["LastModified"].timestamp())
+
+
+def download_s3_folder(local_folder, s3_prefix, max_workers=None):
     """
     Downloads all files from a specific S3 folder to a local folder.
 
+    Files are downloaded concurrently by a pool of threads sharing one client and its connection pool.
+    Files already downloaded with the same size and ETag (or modification time) are skipped,
+    and a manifest of completed downloads is kept in cache/s3, so an interrupted run resumes where it stopped.
+
     Environment Variables (must be set beforehand):
     - AWS_ACCESS_KEY: AWS access key ID.
     - AWS_SECRET_KEY: AWS secret access key.
     - AWS_BUCKET: Name of the S3 bucket.
+    - S3_MAX_CONCURRENCY (optional): Number of concurrent downloads when max_workers is not given. Defaults to 16.
 
     Arguments:
     - local_folder (str): The local directory where files will be downloaded.
     - s3_prefix (str): The destination folder path (prefix) in the S3 bucket.
+    - max_workers (int, optional): The number of concurrent downloads.
 
     This function connects to AWS S3, lists all files under a specific prefix path,
     and downloads them to the local folder while preserving the folder structure.
     """
-    AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY")
-    AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY")
     BUCKET_NAME = os.getenv("AWS_BUCKET")
+    if max_workers is None:
+        max_workers = int(os.getenv("S3_MAX_CONCURRENCY", S3_MAX_CONCURRENCY))
 
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=AWS_ACCESS_KEY,
-        aws_secret_access_key=AWS_SECRET_KEY,
-    )
+    # One client is shared by the threads, with a connection pool sized for them
+    s3 = get_s3_client(max_workers)
+
+    manifest_path = _manifest_path(BUCKET_NAME, s3_prefix, local_folder)
+    manifest = _load_manifest(manifest_path)
+    manifest_lock = threading.Lock()
 
     paginator = s3.get_paginator("list_objects_v2")
     pages = paginator.paginate(Bucket=BUCKET_NAME, Prefix=s3_prefix)
 
+    downloads = []
+    skipped = 0
     for page in pages:
         for obj in page.get("Contents", []):
             s3_key = obj["Key"]
@@ -39,18 +175,70 @@ def download_s3_folder(local_folder, s3_prefix):
             if s3_key.endswith("/") or s3_key == s3_prefix:
                 continue
 
-            # Determine relative local path and create directories if needed
-            relative_path = os.path.relpath(s3_key, s3_prefix)
+            # Determine relative local path
+            relative_path = os.path.relpath(s3_key, s3_prefix) if s3_prefix else s3_key
             local_path = os.path.join(local_folder, relative_path)
-            os.makedirs(os.path.dirname(local_path), exist_ok=True)
 
-            print(f"Downloading s3://{BUCKET_NAME}/{s3_key} → {local_path}")
-            s3.download_file(BUCKET_NAME, s3_key, local_path)
+            if _is_up_to_date(local_path, obj, manifest.get(s3_key)):
+                skipped += 1
+                continue
+            downloads.append((obj, local_path))
+
+    def download(obj, local_path):
+        s3_key = obj["Key"]
+        os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+        log_item(
+            f"Downloading s3://{BUCKET_NAME}/{s3_key} → {local_path}", "S3 downloads"
+        )
+        # Downloaded to a temporary file, so an interrupted download never looks complete
+        temporary_path = f"{local_path}.part"
+        s3.download_file(BUCKET_NAME, s3_key, temporary_path)
+        os.replace(temporary_path, local_path)
+        last_modified = obj["LastModified"].timestamp()
+        os.utime(local_path, (last_modified, last_modified))
+        with manifest_lock:
+            manifest[s3_key] = {
+                "etag": obj["ETag"],
+                "size": obj["Size"],
+                "last_modified": obj["LastModified"].isoformat(),
+            }
+            # Saved periodically: files missing from the manifest are still skipped by size and modification time
+            if len(manifest) % MANIFEST_SAVE_INTERVAL == 0:
+                _save_manifest(manifest_path, manifest)
+
+    failures = []
+    if downloads:
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(download, obj, local_path): obj["Key"]
+                    for obj, local_path in downloads
+                }
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failures.append(futures[future])
+                        print(
+                            f"Failed to download s3://{BUCKET_NAME}/{futures[future]}: {e}"
+                        )
+        finally:
+            with manifest_lock:
+                _save_manifest(manifest_path, manifest)
+
+    print(
+        f"{len(downloads) - len(failures)} file(s) downloaded, {skipped} already up to date, {len(failures)} failed"
+    )
+    if failures:
+        raise RuntimeError(
+            f"{len(failures)} file(s) could not be downloaded from s3://{BUCKET_NAME}/{s3_prefix}"
+        )
 
 
 def upload_file_to_s3(file_path, s3_prefix):
     """
     Uploads a single file to a specific folder in an S3 bucket.
+    Large files are sent as multipart uploads with a part size suited to the file size.
 
     Environment Variables (must be set beforehand):
     - AWS_ACCESS_KEY: AWS access key ID.
@@ -63,18 +251,90 @@ def upload_file_to_s3(file_path, s3_prefix):
 
     This function uploads the file to the specified location inside the S3 bucket.
     """
-    AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY")
-    AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY")
     BUCKET_NAME = os.getenv("AWS_BUCKET")
-
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=AWS_ACCESS_KEY,
-        aws_secret_access_key=AWS_SECRET_KEY,
-    )
+    s3 = get_s3_client()
 
     file_name = os.path.basename(file_path)
     s3_key = f"{s3_prefix}/{file_name}".replace("\\", "/")
 
-    print(f"Uploading {file_path} → s3://{BUCKET_NAME}/{s3_key}")
-    s3.upload_file(file_path, BUCKET_NAME, s3_key)
+    log_item(f"Uploading {file_path} → s3://{BUCKET_NAME}/{s3_key}", "S3 uploads")
+    file_size = os.path.getsize(file_path)
+    start = time.perf_counter()
+    s3.upload_file(file_path, BUCKET_NAME, s3_key, Config=_transfer_config(file_size))
+    _print_transfer(
+        file_path,
+        f"s3://{BUCKET_NAME}/{s3_key}",
+        file_size,
+        time.perf_counter() - start,
+    )
+
+
+def upload_folder_to_s3(folder, s3_prefix, max_workers=None):
+    """
+    Uploads all files of a local folder (and its subfolders) to a specific folder in an S3 bucket, concurrently.
+    The folder structure is kept under the prefix. Each file is logged with its throughput.
+
+    Environment Variables (must be set beforehand):
+    - AWS_ACCESS_KEY: AWS access key ID.
+    - AWS_SECRET_KEY: AWS secret access key.
+    - AWS_BUCKET: Name of the S3 bucket.
+    - S3_MAX_CONCURRENCY (optional): Number of concurrent uploads when max_workers is not given. Defaults to 16.
+
+    Arguments:
+    - folder (str): The local folder to upload.
+    - s3_prefix (str): The destination folder path (prefix) in the S3 bucket.
+    - max_workers (int, optional): The number of files uploaded at the same time.
+    """
+    BUCKET_NAME = os.getenv("AWS_BUCKET")
+    if max_workers is None:
+        max_workers = int(os.getenv("S3_MAX_CONCURRENCY", S3_MAX_CONCURRENCY))
+    # Parts of a large file are also sent in parallel: a few threads per file are enough when files are uploaded concurrently
+    part_concurrency = 4
+    s3 = get_s3_client(max_workers * part_concurrency)
+
+    uploads = []
+    for root, _, files in os.walk(folder):
+        for file in files:
+            file_path = os.path.join(root, file)
+            relative_path = os.path.relpath(file_path, folder)
+            s3_key = f"{s3_prefix}/{relative_path}".replace("\\", "/")
+            uploads.append((file_path, s3_key))
+
+    def upload(file_path, s3_key):
+        file_size = os.path.getsize(file_path)
+        start = time.perf_counter()
+        s3.upload_file(
+            file_path,
+            BUCKET_NAME,
+            s3_key,
+            Config=_transfer_config(file_size, part_concurrency),
+        )
+        elapsed = time.perf_counter() - start
+        _print_transfer(file_path, f"s3://{BUCKET_NAME}/{s3_key}", file_size, elapsed)
+        return file_size
+
+    start = time.perf_counter()
+    total_size = 0
+    failures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(upload, file_path, s3_key): file_path
+            for file_path, s3_key in uploads
+        }
+        for future in as_completed(futures):
+            try:
+                total_size += future.result()
+            except Exception as e:
+                failures.append(futures[future])
+                print(f"Failed to upload {futures[future]}: {e}")
+
+    elapsed = time.perf_counter() - start
+    throughput = total_size / MB / elapsed if elapsed > 0 else 0
+    print(
+        f"{len(uploads) - len(failures)} file(s) uploaded to s3://{BUCKET_NAME}/{s3_prefix} "
+        f"({total_size / MB:.2f} MB in {elapsed:.2f} s, {throughput:.2f} MB/s), {len(failures)} failed"
+    )
+    if failures:
+        raise RuntimeError(
+            f"{len(failures)} file(s) could not be uploaded to s3://{BUCKET_NAME}/{s3_prefix}"
+        )
@@ -0,0 +1,354 @@
+import contextlib
+import io
+import multiprocessing
+import os
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+from utils.block_cache import BlockCache, Checkpoint, cache_enabled
+from utils.block_metrics import add_metrics, get_metrics, reset_metrics
+from utils.profiling import profiling_active
+
+# Number of blocks running at the same time in threads (downloads, uploads, messages...)
+SCHEDULER_THREADS = 8
+
+# Resource used by a block which must run alone, after the blocks before it and before the blocks after it
+ALL_RESOURCES = "*"
+
+
+class Block:
+    """
+    A block of a generated job, run by run_blocks.
+
+    Arguments:
+    - name (str): The name of the block, as written in the job.
+    - function (callable): The function running the block. It receives the inputs as keyword arguments
+      and returns a dictionary with the outputs, or None if the block has no output.
+    - inputs (list): The variables read by the block, assigned by blocks before it.
+    - outputs (list): The variables assigned by the block and read by blocks after it.
+    - modifies (list): The inputs modified in place by the block.
+    - resources (dict): The folders (IN, OUT) and remote services (s3, gdrive, rabbitmq) used by the block,
+      with their access mode: "read", "add" (new files) or "write".
+    - kind (str): "io" for blocks waiting on files or the network, "cpu" for blocks computing on DataFrames.
+    """
+
+    def __init__(
+        self,
+        name,
+        function,
+        inputs=(),
+        outputs=(),
+        modifies=(),
+        resources=None,
+        kind="io",
+    ):
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.modifies = list(modifies)
+        self.resources = dict(resources or {})
+        self.kind = kind
+
+
+def _resolve_resources(block, folders):
+    """
+    Returns the resources of a block with the folder variables replaced by their absolute path.
+    """
+    resolved = {}
+    for name, access in block.resources.items():
+        if name in folders:
+            key = ("folder", os.path.realpath(folders[name] or "."))
+        elif name == ALL_RESOURCES:
+            key = (ALL_RESOURCES, "")
+        else:
+            key = ("remote", name)
+        resolved[key] = "write" if access != resolved.get(key, access) else access
+    return resolved
+
+
+def _overlap(first, second):
+    if ALL_RESOURCES in (first[0], second[0]):
+        return True
+    if first[0] != second[0]:
+        return False
+    if first[0] != "folder":
+        return first[1] == second[1]
+    # A folder inside the other one, or the same folder under two names (IN and OUT)
+    return os.path.commonpath([first[1], second[1]]) in (first[1], second[1])
+
+
+def _conflict(first, second):
+    """
+    Returns whether two blocks cannot run at the same time because of the resources they use.
+    Blocks reading the same resource, or adding files to the same folder, can run together.
+    """
+    for first_key, first_access in first.items():
+        for second_key, second_access in second.items():
+            if not _overlap(first_key, second_key):
+                continue
+            if first_access == second_access and first_access in ("read", "add"):
+                continue
+            return True
+    return False
+
+
+def build_dependencies(blocks, folders=None):
+    """
+    Builds the graph of the blocks of a job: a block waits for the blocks producing its inputs,
+    the blocks using the same resources in a conflicting way run in the order of the job,
+    and a block modifying an input in place waits for the other blocks reading the same value.
+
+    Arguments:
+    - blocks (list): The Block objects, in the order of the job.
+    - folders (dict): The paths of the folder variables used in the block resources, for example {"IN": IN}.
+
+    Returns:
+    - tuple: The list of the indexes of the blocks each block waits for, and the list of the index
+      of the block producing each input of each block.
+
+    Raises:
+    - ValueError: If an input is not produced by a block before.
+    """
+    folders = folders or {}
+    resources = [_resolve_resources(block, folders) for block in blocks]
+    dependencies = [set() for _ in blocks]
+    producers = []
+    for position, block in enumerate(blocks):
+        block_producers = {}
+        for name in block.inputs:
+            producer = next(
+                (
+                    index
+                    for index in range(position - 1, -1, -1)
+                    if name in blocks[index].outputs
+                ),
+                None,
+            )
+            if producer is None:
+                raise ValueError(
+                    f"Block {block.name}: no block before it produces {name}"
+                )
+            block_producers[name] = producer
+            dependencies[position].add(producer)
+        producers.append(block_producers)
+
+        for index in range(position):
+            if _conflict(resources[index], resources[position]):
+                dependencies[position].add(index)
+            # The blocks reading the value before it is modified run first
+            for name in block.modifies:
+                if producers[index].get(name) == block_producers[name]:
+                    dependencies[position].add(index)
+    return dependencies, producers
+
+
+def _run_in_process(function, arguments):
+    """
+    Runs a block in a worker process, returning its outputs with its printed messages and block metrics,
+    which the job process logs.
+    """
+    reset_metrics()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        result = function(**arguments)
+    return result, output.getvalue(), get_metrics()
+
+
+def run_blocks(
+    blocks,
+    folders=None,
+    max_workers=SCHEDULER_THREADS,
+    max_processes=None,
+    use_cache=None,
+):
+    """
+    Runs the blocks of a job, starting each block as soon as the blocks it depends on are done.
+    Independent blocks run at the same time: in threads, or in worker processes for "cpu" blocks
+    when several of them can run together. A block which is the only one able to run is run directly.
+    When a block fails, no other block is started, the running ones are awaited and the error is raised.
+    While the job is profiled (--profile or JOB_PROFILE), the blocks run one after another in the main thread,
+    as the profilers only measure the thread they are started in.
+
+    With the cache (off by default, see cache_enabled), the outputs of the blocks are checkpointed. On the next run, the blocks are restored
+    from their checkpoint, in the order of the job, until the first block which changed (its code, its
+    inputs or the files it reads) or whose files were modified since: this block and all the blocks after
+    it run again. Blocks deleting files, uploading or sending data are never skipped.
+
+    Arguments:
+    - blocks (list): The Block objects, in the order of the job.
+    - folders (dict): The paths of the folder variables used in the block resources, for example {"IN": IN}.
+    - max_workers (int): The maximum number of blocks running in threads at the same time.
+    - max_processes (int): The maximum number of worker processes, the number of CPUs by default.
+    - use_cache (bool): Whether to use the checkpoints of the blocks, see cache_enabled by default.
+    """
+    folders = folders or {}
+    dependencies, producers = build_dependencies(blocks, folders)
+    readers = {}
+    for block_producers in producers:
+        for name, producer in block_producers.items():
+            readers[(producer, name)] = readers.get((producer, name), 0) + 1
+
+    values = {}
+    latest = {}
+    remaining = list(range(len(blocks)))
+    done = set()
+    running = {}
+    errors = []
+
+    cache = None
+    if cache_enabled() if use_cache is None else use_cache:
+        cache = BlockCache()
+    keys = {}
+    snapshots = {}
+    # True until a block cannot be restored from its checkpoint
+    restoring = cache is not None
+
+    def restore(position):
+        """
+        Computes the checkpoint key of a block about to start, and restores its outputs
+        if the job is still restoring blocks and the block has a valid checkpoint.
+        """
+        nonlocal restoring
+        block = blocks[position]
+        keys[position] = cache.key(
+            block,
+            {name: keys[producer] for name, producer in producers[position].items()},
+            folders,
+        )
+        if not cache.cacheable(block):
+            return False
+        if restoring:
+            checkpoint = cache.lookup(keys[position], block)
+            if checkpoint is not None:
+                print(f"Block {block.name} restored from cache")
+                finish(position, checkpoint)
+                return True
+            restoring = False
+        snapshots[position] = cache.snapshot(block, folders)
+        return False
+
+    def complete(position, result):
+        if position in snapshots:
+            cache.store(
+                keys[position],
+                blocks[position],
+                result or {},
+                snapshots.pop(position),
+                folders,
+            )
+        finish(position, result)
+
+    def finish(position, result):
+        result = result or {}
+        for name in blocks[position].outputs:
+            values[(position, name)] = result.get(name)
+            latest[name] = position
+        # A value is released once its last reader is done, unless it is the final value of the variable
+        for name, producer in producers[position].items():
+            readers[(producer, name)] -= 1
+            if readers[(producer, name)] == 0 and latest[name] != producer:
+                values.pop((producer, name), None)
+        done.add(position)
+
+    def arguments(position):
+        for name, producer in producers[position].items():
+            if isinstance(values[(producer, name)], Checkpoint):
+                values[(producer, name)] = values[(producer, name)].load()
+        return {
+            name: values[(producer, name)]
+            for name, producer in producers[position].items()
+        }
+
+    sequential = profiling_active()
+    threads = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="block")
+    processes = None
+    try:
+        while remaining or running:
+            ready = []
+            if not errors:
+                ready = [
+                    position for position in remaining if dependencies[position] <= done
+                ]
+            if sequential:
+                ready = [position for position in ready if position == remaining[0]]
+            if restoring:
+                # Blocks are restored in the order of the job, up to the first one which changed
+                ready = ready[
+                    : next(
+                        (
+                            index
+                            for index, position in enumerate(ready)
+                            if position != remaining[index]
+                        ),
+                        len(ready),
+                    )
+                ]
+            for position in ready:
+                remaining.remove(position)
+            restored = False
+            if cache is not None:
+                started = len(ready)
+                ready = [position for position in ready if not restore(position)]
+                restored = len(ready) < started
+
+            if len(ready) == 1 and not running:
+                position = ready[0]
+                try:
+                    complete(position, blocks[position].function(**arguments(position)))
+                except Exception as e:
+                    errors.append(e)
+                continue
+
+            cpu_blocks = sum(
+                blocks[position].kind == "cpu"
+                for position in ready + [position for position, _ in running.values()]
+            )
+            for position in ready:
+                block = blocks[position]
+                in_process = block.kind == "cpu" and cpu_blocks > 1
+                if in_process:
+                    if processes is None:
+                        processes = ProcessPoolExecutor(
+                            max_workers=max_processes,
+                            mp_context=multiprocessing.get_context("spawn"),
+                        )
+                    future = processes.submit(
+                        _run_in_process, block.function, arguments(position)
+                    )
+                else:
+                    future = threads.submit(block.function, **arguments(position))
+                running[future] = (position, in_process)
+
+            # The blocks depending on the restored ones can start right away
+            if restored:
+                continue
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                position, in_process = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if in_process:
+                    result, output, records = result
+                    for line in output.splitlines():
+                        print(line)
+                    add_metrics(records)
+                complete(position, result)
+    finally:
+        threads.shutdown(wait=True)
+        if processes is not None:
+            processes.shutdown(wait=True)
+
+    if errors:
+        if remaining:
+            print(f"{len(remaining)} block(s) not run because of the failure")
+        raise errors[0]
@@ -0,0 +1,507 @@
+import argparse
+import collections
+import functools
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+import types
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+
+# Modules imported once by the fork server, so each worker starts with them already loaded.
+# Missing optional packages (boto3, googleapiclient...) are skipped
+WARM_MODULES = (
+    "numpy",
+    "pandas",
+    "openpyxl",
+    "utils.runner",
+    "utils.file_management",
+    "utils.data_management",
+    "utils.block_metrics",
+    "utils.scheduler",
+    "utils.s3_utils",
+    "utils.gDrive_utils",
+    "utils.rabbitmq_utils",
+)
+WORKER_SOCKET = "/tmp/open-gui-etl-worker.sock"
+WORKER_PROCESSES = 4
+# Each worker is replaced after this number of jobs, so the memory kept by a job (caches, fragmentation) is released
+WORKER_MAX_JOBS = 50
+JOBS_DIR = "jobs"
+
+
+def run_job(job_path, arguments=()):
+    """
+    Runs a job in the current process, as "python <job_path> <arguments>" would: the job module is executed
+    as __main__, so it loads its .env and calls run_main itself. The environment variables, sys.argv,
+    sys.path and the standard outputs are restored afterwards, so the next job starts from a clean state.
+
+    Arguments:
+    - job_path (str): The path of the run.py file of the job.
+    - arguments (list): The command line arguments of the job (--profile, --cache...).
+
+    Returns:
+    - dict: The job, its status ("ok" or "failed"), log file, error and duration in seconds.
+    """
+    from utils.logs_management import close_logs
+    from utils.rabbitmq_utils import close_rabbitmq_publisher
+    from utils.runner import pop_last_run
+
+    job_path = os.path.abspath(job_path)
+    environment = dict(os.environ)
+    argv = sys.argv
+    path = list(sys.path)
+    main_module = sys.modules["__main__"]
+
+    module = types.ModuleType("__main__")
+    module.__file__ = job_path
+    sys.modules["__main__"] = module
+    sys.argv = [job_path, *arguments]
+    sys.path.insert(0, os.path.dirname(job_path))
+
+    result = {"job": job_path, "status": "ok", "log": None, "error": None}
+    start = time.perf_counter()
+    pop_last_run()
+    try:
+        with open(job_path, encoding="utf-8") as f:
+            code = compile(f.read(), job_path, "exec")
+        exec(code, module.__dict__)
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            result.update(status="failed", error=f"SystemExit: {e.code}")
+    except Exception as e:
+        # Raised outside of run_main, while loading the job
+        traceback.print_exc()
+        result.update(status="failed", error=f"{type(e).__name__}: {e}")
+    finally:
+        outcome = pop_last_run()
+        if result["status"] == "ok":
+            result.update(outcome)
+        else:
+            result["log"] = outcome.get("log")
+        try:
+            close_rabbitmq_publisher()
+        except Exception as e:
+            result.update(status="failed", error=f"{type(e).__name__}: {e}")
+        close_logs()
+        os.environ.clear()
+        os.environ.update(environment)
+        sys.argv = argv
+        sys.path[:] = path
+        sys.modules["__main__"] = main_module
+    result["duration_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _worker_loop(connection, max_jobs):
+    """
+    Runs the jobs received from the daemon one after another, and exits after max_jobs jobs.
+    """
+    # The daemon stops the workers itself, after their current job
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    for _ in range(max_jobs):
+        try:
+            job = connection.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        connection.send(run_job(job["job"], job["args"]))
+
+
+class _Worker:
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.job = None
+        self.jobs_done = 0
+        self.released = False
+
+
+class WorkerDaemon:
+    """
+    A pool of pre-forked worker processes running jobs without starting a new interpreter for each of them.
+
+    The workers are forked from a fork server which imported WARM_MODULES once, so a job starts with pandas,
+    numpy, openpyxl and the utils modules already loaded. Each worker runs one job at a time and is replaced
+    after max_jobs jobs, or when it dies (the job it was running is then reported as failed).
+    Jobs are submitted with submit, from the local socket server or the RabbitMQ consumer.
+
+    Arguments:
+    - workers (int): The number of worker processes, i.e. of jobs running at the same time.
+    - max_jobs (int): The number of jobs run by a worker before it is replaced.
+    - jobs_dir (str): The folder of the jobs, only the run.py files of its subfolders can be run.
+    """
+
+    def __init__(
+        self,
+        workers=WORKER_PROCESSES,
+        max_jobs=WORKER_MAX_JOBS,
+        jobs_dir=JOBS_DIR,
+    ):
+        self.worker_count = workers
+        self.max_jobs = max_jobs
+        self.jobs_dir = os.path.realpath(jobs_dir)
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self.context = multiprocessing.get_context("forkserver")
+            self.context.set_forkserver_preload(list(WARM_MODULES))
+        else:
+            self.context = multiprocessing.get_context("spawn")
+        self.workers = []
+        self.waiting = collections.deque()
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.stopping = False
+        self.wakeup_reader, self.wakeup_writer = multiprocessing.Pipe(duplex=False)
+        self.thread = None
+
+    def start(self):
+        for _ in range(self.worker_count):
+            self._spawn()
+        self.thread = threading.Thread(
+            target=self._dispatch, name="worker-dispatcher", daemon=True
+        )
+        self.thread.start()
+        print(f"{self.worker_count} worker(s) started")
+
+    def _spawn(self):
+        connection, worker_connection = self.context.Pipe()
+        process = self.context.Process(
+            target=_worker_loop,
+            args=(worker_connection, self.max_jobs),
+            name="etl-worker",
+        )
+        # Not daemonic: jobs can start their own worker processes
+        process.start()
+        worker_connection.close()
+        self.workers.append(_Worker(process, connection))
+
+    def job_path(self, job):
+        """
+        Returns the path of the run.py file of a job given by its folder name or its path.
+
+        Raises:
+        - ValueError: If the file is not the run.py file of a job of the jobs folder.
+        """
+        if not isinstance(job, str):
+            raise ValueError(f"The job must be a string: {job!r}")
+        if not job.endswith(".py"):
+            job = os.path.join(self.jobs_dir, job, "run.py")
+        path = os.path.realpath(job)
+        if (
+            os.path.basename(path) != "run.py"
+            or os.path.commonpath([path, self.jobs_dir]) != self.jobs_dir
+            or not os.path.isfile(path)
+        ):
+            raise ValueError(f"Not a job of {self.jobs_dir}: {job}")
+        return path
+
+    def submit(self, job, arguments=()):
+        """
+        Queues a job, run by the first available worker.
+
+        Arguments:
+        - job (str): The folder name of the job in the jobs folder, or the path of its run.py file.
+        - arguments (list): The command line arguments of the job.
+
+        Returns:
+        - Future: Resolved with the result of run_job when the job ends.
+
+        Raises:
+        - ValueError: If the job is not a job of the jobs folder, or the daemon is stopping.
+        """
+        path = self.job_path(job)
+        if not isinstance(arguments, (list, tuple)) or not all(
+            isinstance(argument, str) for argument in arguments
+        ):
+            raise ValueError("The job arguments must be a list of strings")
+        future = Future()
+        with self.lock:
+            if self.stopping:
+                raise ValueError("The worker daemon is stopping")
+            job_id = next(self.ids)
+            self.waiting.append(
+                ({"id": job_id, "job": path, "args": list(arguments)}, future)
+            )
+        self.wakeup_writer.send(None)
+        return future
+
+    def stop(self):
+        """
+        Stops the daemon once the running jobs are done. The queued jobs are not run.
+        """
+        with self.lock:
+            self.stopping = True
+            waiting, self.waiting = list(self.waiting), collections.deque()
+        for job, future in waiting:
+            future.set_result(
+                {"job": job["job"], "status": "cancelled", "log": None, "error": None}
+            )
+        self.wakeup_writer.send(None)
+        if self.thread is not None:
+            self.thread.join()
+        for worker in self.workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        print("Workers stopped")
+
+    def _finish(self, worker, result):
+        job, future = worker.job
+        worker.job = None
+        worker.jobs_done += 1
+        print(
+            f"Job {job['job']}: {result['status']} in {result.get('duration_s', 0)} s"
+        )
+        future.set_result(result)
+
+    def _dispatch(self):
+        """
+        Sends the waiting jobs to the idle workers, collects the results and replaces the exited workers.
+        """
+        while True:
+            with self.lock:
+                stopping = self.stopping
+                for worker in self.workers:
+                    # A worker which ran max_jobs jobs is exiting, it is replaced once it has exited
+                    if worker.job or worker.released:
+                        continue
+                    if stopping:
+                        worker.connection.send(None)
+                        worker.released = True
+                    elif self.waiting and worker.jobs_done < self.max_jobs:
+                        worker.job = self.waiting.popleft()
+                        worker.connection.send(worker.job[0])
+            if stopping and not any(worker.job for worker in self.workers):
+                return
+
+            busy = [worker.connection for worker in self.workers if worker.job]
+            sentinels = [worker.process.sentinel for worker in self.workers]
+            ready = wait(busy + sentinels + [self.wakeup_reader], timeout=1)
+            if self.wakeup_reader in ready:
+                while self.wakeup_reader.poll():
+                    self.wakeup_reader.recv()
+
+            for worker in list(self.workers):
+                if worker.job and worker.connection in ready:
+                    try:
+                        self._finish(worker, worker.connection.recv())
+                    except EOFError:
+                        pass
+                if worker.process.sentinel not in ready:
+                    continue
+                # Recycled after max_jobs jobs, or crashed
+                worker.process.join()
+                if worker.job:
+                    if worker.connection.poll():
+                        self._finish(worker, worker.connection.recv())
+                    else:
+                        job = worker.job[0]
+                        self._finish(
+                            worker,
+                            {
+                                "job": job["job"],
+                                "status": "failed",
+                                "log": None,
+                                "error": f"Worker exited with code {worker.process.exitcode}",
+                            },
+                        )
+                worker.connection.close()
+                self.workers.remove(worker)
+                with self.lock:
+                    stopping = self.stopping
+                if not stopping:
+                    try:
+                        self._spawn()
+                    except (OSError, EOFError) as e:
+                        print(f"Worker not replaced: {e}")
+
+
+class _JobRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Reads one JSON request per line, {"job": "my_job", "args": ["--cache"]},
+    and answers with one JSON line holding the result of the job once it ends.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                future = self.server.worker_daemon.submit(
+                    request["job"], request.get("args", [])
+                )
+                result = future.result()
+            except (ValueError, KeyError, TypeError) as e:
+                result = {"status": "rejected", "error": str(e)}
+            self.wfile.write((json.dumps(result) + "\n").encode())
+            self.wfile.flush()
+
+
+class _JobSocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve_socket(daemon, socket_path=WORKER_SOCKET):
+    """
+    Starts a local socket server accepting jobs for the daemon, in a background thread.
+    The socket can only be used by the user running the daemon.
+
+    Arguments:
+    - daemon (WorkerDaemon): The started daemon.
+    - socket_path (str): The path of the Unix socket.
+
+    Returns:
+    - socketserver.BaseServer: The server, stopped with shutdown().
+    """
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = _JobSocketServer(socket_path, _JobRequestHandler)
+    os.chmod(socket_path, 0o600)
+    server.worker_daemon = daemon
+    threading.Thread(
+        target=server.serve_forever, name="worker-socket", daemon=True
+    ).start()
+    print(f"Accepting jobs on {socket_path}")
+    return server
+
+
+def consume_rabbitmq_queue(daemon, queue_name):
+    """
+    Runs the jobs of the messages of a RabbitMQ queue ({"job": "my_job", "args": []}), in a background thread.
+    A message is acknowledged when its job ends, and the result is published to its reply_to queue if set.
+    The messages of jobs cancelled by the shutdown of the daemon are requeued, for another worker to run them.
+    At most one message per worker is received at a time. The connection uses the RABBITMQ_* environment variables.
+
+    Arguments:
+    - daemon (WorkerDaemon): The started daemon.
+    - queue_name (str): The name of the queue, declared durable if it does not exist.
+
+    Returns:
+    - callable: A function stopping the consumer.
+    """
+    import pika
+
+    from utils.rabbitmq_utils import amqp_connection_parameters
+
+    connection = pika.BlockingConnection(amqp_connection_parameters())
+    channel = connection.channel()
+    channel.queue_declare(queue=queue_name, durable=True)
+    channel.basic_qos(prefetch_count=daemon.worker_count)
+
+    def acknowledge(delivery_tag, properties, result):
+        if result["status"] == "cancelled":
+            # The job did not run
+            channel.basic_nack(delivery_tag, requeue=True)
+            return
+        if properties.reply_to:
+            channel.basic_publish(
+                exchange="",
+                routing_key=properties.reply_to,
+                body=json.dumps(result),
+                properties=pika.BasicProperties(
+                    correlation_id=properties.correlation_id,
+                    content_type="application/json",
+                ),
+            )
+        channel.basic_ack(delivery_tag)
+
+    def on_message(channel, method, properties, body):
+        try:
+            request = json.loads(body)
+            future = daemon.submit(request["job"], request.get("args", []))
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Message rejected: {e}")
+            channel.basic_reject(method.delivery_tag, requeue=False)
+            return
+        future.add_done_callback(
+            lambda future: connection.add_callback_threadsafe(
+                functools.partial(
+                    acknowledge, method.delivery_tag, properties, future.result()
+                )
+            )
+        )
+
+    channel.basic_consume(queue=queue_name, on_message_callback=on_message)
+    threading.Thread(
+        target=channel.start_consuming, name="worker-rabbitmq", daemon=True
+    ).start()
+    print(f"Consuming jobs from the RabbitMQ queue {queue_name}")
+    return lambda: connection.add_callback_threadsafe(channel.stop_consuming)
+
+
+def submit_job(job, arguments=(), socket_path=WORKER_SOCKET):
+    """
+    Sends a job to a running worker daemon and waits for its result.
+
+    Arguments:
+    - job (str): The folder name of the job in the jobs folder, or the path of its run.py file.
+    - arguments (list): The command line arguments of the job.
+    - socket_path (str): The path of the Unix socket of the daemon.
+
+    Returns:
+    - dict: The result of the job.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        request = {"job": os.path.abspath(job) if job.endswith(".py") else job}
+        request["args"] = list(arguments)
+        client.sendall((json.dumps(request) + "\n").encode())
+        with client.makefile("rb") as response:
+            return json.loads(response.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run jobs in pre-forked workers with the utils modules already imported."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Start the worker daemon")
+    serve.add_argument("--socket", default=os.getenv("WORKER_SOCKET", WORKER_SOCKET))
+    serve.add_argument("--queue", help="RabbitMQ queue to consume jobs from")
+    serve.add_argument("--workers", type=int, default=WORKER_PROCESSES)
+    serve.add_argument("--max-jobs", type=int, default=WORKER_MAX_JOBS)
+    serve.add_argument("--jobs-dir", default=JOBS_DIR)
+    submit = commands.add_parser("submit", help="Run a job on the worker daemon")
+    submit.add_argument("--socket", default=os.getenv("WORKER_SOCKET", WORKER_SOCKET))
+    submit.add_argument("job", help="Job folder name or path of its run.py file")
+    submit.add_argument("args", nargs=argparse.REMAINDER)
+    options = parser.parse_args()
+
+    if options.command == "submit":
+        result = submit_job(options.job, options.args, options.socket)
+        print(json.dumps(result))
+        sys.exit(0 if result.get("status") == "ok" else 1)
+
+    daemon = WorkerDaemon(options.workers, options.max_jobs, options.jobs_dir)
+    daemon.start()
+    server = serve_socket(daemon, options.socket)
+    stop_consumer = None
+    if options.queue:
+        stop_consumer = consume_rabbitmq_queue(daemon, options.queue)
+
+    stopped = threading.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: stopped.set())
+    stopped.wait()
+    print("Stopping the worker daemon")
+    if stop_consumer is not None:
+        stop_consumer()
+    server.shutdown()
+    server.server_close()
+    os.remove(options.socket)
+    daemon.stop()
+
+
+if __name__ == "__main__":
+    main()